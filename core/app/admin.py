@@ -1,4 +1,6 @@
+from django import forms
 from django.contrib import admin
+from . import zone_cache
 from .models import (
     Team,
     Player,
@@ -8,6 +10,7 @@ from .models import (
     ZoneAttemptAccess,
     ZoneAttempt,
     Score,
+    ZoneScore,
 )
 
 # -------------------------
@@ -29,6 +32,7 @@ class TeamAdmin(admin.ModelAdmin):
 class PlayerAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "role", "team")
     list_filter = ("role", "team")
+    list_select_related = ("team",)
     search_fields = ("name", "role", "team__name")  # 🔍 allow searching by name & role
 
 
@@ -40,6 +44,7 @@ class PlayerAdmin(admin.ModelAdmin):
 class TeamSessionAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "session_key", "last_seen_at")
     list_filter = ("user",)
+    list_select_related = ("user",)
 
 
 # -------------------------
@@ -59,6 +64,11 @@ class ZoneAdmin(admin.ModelAdmin):
     list_display = ("id", "title")
     inlines = [ZoneContentInline]  
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline rows are covered by signals too; this catches any bulk paths
+        zone_cache.invalidate_on_commit()
+
 
 # -------------------------
 # ZONE ATTEMPT ACCESS (PER PLAYER CODES)
@@ -72,6 +82,8 @@ class ZoneAttemptAccessAdmin(admin.ModelAdmin):
     autocomplete_fields = ["player", "team"]
     search_fields = ("attempt_code", "player__name", "team__name")
     ordering = ("team__name", "zone__title", "player__role")
+    # Player.__str__ shows its team too
+    list_select_related = ("team", "zone", "player__team")
 
 
 
@@ -95,40 +107,70 @@ class ZoneAttemptAdmin(admin.ModelAdmin):
     list_filter = ("zone", "status", "team")
     ordering = ("team__name", "zone__title", "player__role")
     readonly_fields = ("entry_time", "exit_time")
+    list_select_related = ("team", "zone", "player")
+
+    actions = ("force_exit_attempts",)
 
     def get_role(self, obj):
         return obj.player.role
 
     get_role.short_description = "Role"
 
+    @admin.action(description="Force exit selected active attempts")
+    def force_exit_attempts(self, request, queryset):
+        # One UPDATE (e.g. filter by zone, select all); ended rows skipped
+        ended = queryset.end_attempts("FORCED_EXIT")
+        self.message_user(request, f"Force-exited {len(ended)} active attempt(s).")
+
 
 # -------------------------
 # SCORE
 # -------------------------
+class ScoreForm(forms.ModelForm):
+    """
+    Credit plus one points field per zone ("zone_<id>"); the zone fields
+    are added by ScoreAdmin.get_form so new zones show up automatically.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            for zone_id, points in self.instance.zone_points().items():
+                self.initial[f"zone_{zone_id}"] = points
+
+    def zone_points(self):
+        return {
+            int(name[len("zone_"):]): value or 0
+            for name, value in self.cleaned_data.items()
+            if name.startswith("zone_")
+        }
+
+
+def zone_column(zone):
+    def points(obj):
+        # team__zone_scores is prefetched by ScoreAdmin.get_queryset
+        for zone_score in obj.team.zone_scores.all():
+            if zone_score.zone_id == zone.id:
+                return zone_score.points
+        return 0
+
+    points.short_description = zone.title
+    return points
+
+
 @admin.register(Score)
 class ScoreAdmin(admin.ModelAdmin):
-    list_display = (
-        "team",
-        "zone1",
-        "zone2",
-        "zone3",
-        "zone4",
-        "zone5",
-        "zone6",
-        "credit",          # NEW
-        "total_display",
-    )
+    form = ScoreForm
+
+    # Plus one column per zone, see get_list_display()
+    list_display = ("team", "credit", "total")
 
     list_editable = (
-        "zone1",
-        "zone2",
-        "zone3",
-        "zone4",
-        "zone5",
-        "zone6",
-        "credit",          # NEW
+        "credit",
     )
 
+    readonly_fields = ("total",)
+
     ordering = ("team__name",)
 
     search_fields = (
@@ -137,7 +179,45 @@ class ScoreAdmin(admin.ModelAdmin):
 
     list_select_related = ("team",)
 
-    def total_display(self, obj):
-        return obj.total
+    def get_list_display(self, request):
+        team, *rest = self.list_display
+        return (team, *[zone_column(zone) for zone in zone_cache.get_zones()], *rest)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("team__zone_scores")
+
+    def get_form(self, request, obj=None, change=False, **kwargs):
+        zone_fields = {
+            f"zone_{zone.id}": forms.IntegerField(label=zone.title, initial=0)
+            for zone in zone_cache.get_zones()
+        }
+        kwargs["form"] = type("ScoreForm", (self.form,), zone_fields)
+        return super().get_form(request, obj, change, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        # Zone rows first, then one Score save carrying both credit and the
+        # new total: one leaderboard update and one publish per edit. The
+        # changelist (list_editable) form has no zone fields.
+        if hasattr(form, "zone_points"):
+            obj.set_zone_points(form.zone_points(), save=False)
+        super().save_model(request, obj, form, change)
+
+
+# -------------------------
+# ZONE SCORES (inline editing)
+# -------------------------
+# One row per (team, zone), points edited in place on the changelist as
+# the old zone1..zone6 columns on Score were. Each saved row re-sums the
+# team total through the ZoneScore signals.
+@admin.register(ZoneScore)
+class ZoneScoreAdmin(admin.ModelAdmin):
+    list_display = ("team", "zone", "points")
+
+    list_editable = (
+        "points",
+    )
 
-    total_display.short_description = "Total"
+    list_filter = ("zone", "team")
+    ordering = ("team__name", "zone__title")
+    search_fields = ("team__name",)
+    list_select_related = ("team", "zone")
@@ -0,0 +1,180 @@
+"""
+Async-native versions of the read-heavy views.
+
+Routed instead of their sync twins in views.py when PORTAL_ASYNC_VIEWS is
+on (the default) so that, under core.asgi, they run on the event loop
+rather than in a thread executor. Presentation logic is shared with
+views.py; only the data access differs (async ORM, auser(), aget()).
+"""
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response
+
+from . import zone_assets
+from .leaderboard import acurrent_version, atimeline_points
+from .models import LeaderboardEntry, ZoneAttempt
+from .views import (
+    build_graph_data,
+    leaderboard_context_rows,
+    leaderboard_entries,
+    leaderboard_etag,
+    leaderboard_json,
+    leaderboard_payload,
+    my_entry,
+    my_rank_payload,
+    neighbour_querysets,
+    not_modified_or_none,
+    page_cursor,
+    parse_neighbours,
+    parse_part,
+    revalidated,
+    zone_part_etag,
+    zone_play_context,
+    zone_play_etag,
+)
+from .team_state import aget_team_state, ateam_id_for_user
+from .zone_cache import aget_zone, aget_zone_content, aget_zones
+
+
+async def auser_team_id(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None
+    return await ateam_id_for_user(user.id)
+
+
+# -------------------------
+# ZONES (TEAM VIEW)
+# -------------------------
+@login_required(login_url="/login/")
+async def zones_view(request):
+    user = await request.auser()
+    team_id = await ateam_id_for_user(user.id)
+    zones = (await aget_team_state(team_id)).apply(await aget_zones())
+
+    return render(request, "zones.html", {
+        "zones": zones,
+    }, using=settings.PORTAL_HOT_TEMPLATES)
+
+
+# -------------------------
+# ZONE PLAY (PLAYER VIEW)
+# -------------------------
+async def zone_play(request, zone_id):
+    attempt_id = await request.session.aget("active_attempt_id")
+    if not attempt_id:
+        return redirect("enter_zone")
+
+    attempt = await aget_object_or_404(
+        ZoneAttempt.objects.select_related("player"),
+        id=attempt_id,
+        zone_id=zone_id,
+        status="ACTIVE"
+    )
+
+    zone = await aget_zone(attempt.zone_id)
+    zone_content = await aget_zone_content(attempt.zone_id, attempt.player.role)
+    if zone is None or zone_content is None:
+        raise Http404("No zone content for this role")
+
+    etag = zone_play_etag(request, attempt, zone, zone_content)
+    not_modified = not_modified_or_none(request, etag, zone_content.updated_at)
+    if not_modified is not None:
+        return not_modified
+
+    response = render(
+        request, "zone_play.html", zone_play_context(attempt, zone, zone_content),
+        using=settings.PORTAL_HOT_TEMPLATES,
+    )
+    return revalidated(response, etag, zone_content.updated_at)
+
+
+async def aactive_attempt(request, zone_id):
+    return await (
+        ZoneAttempt.objects.select_related("player")
+        .filter(id=await request.session.aget("active_attempt_id"), zone_id=zone_id, status="ACTIVE")
+        .afirst()
+    )
+
+
+async def zone_content_part(request, zone_id):
+    attempt = await aactive_attempt(request, zone_id)
+    if attempt is None:
+        return HttpResponseForbidden("No active attempt in this zone")
+
+    zone_content = await aget_zone_content(zone_id, attempt.player.role)
+    part = parse_part(request)
+    if zone_content is None or part is None or not 0 <= part < zone_content.part_count:
+        raise Http404("No such part")
+
+    etag = zone_part_etag(zone_content, part)
+    not_modified = not_modified_or_none(request, etag, zone_content.updated_at)
+    if not_modified is not None:
+        return not_modified
+
+    response = HttpResponse(zone_content.part(part), content_type="text/html; charset=utf-8")
+    return revalidated(response, etag, zone_content.updated_at)
+
+
+async def zone_asset(request, zone_id, name):
+    if await aactive_attempt(request, zone_id) is None:
+        return HttpResponseForbidden("No active attempt in this zone")
+    # A stat() and an open(); the body is streamed from a thread
+    return zone_assets.serve(request, zone_id, name)
+
+
+# -------------------------------------
+# LEADERBOARD (PUBLIC / TEAM VIEW)
+# -------------------------------------
+async def leaderboard_view(request):
+    entries = [
+        entry async for entry in
+        LeaderboardEntry.objects.select_related("team").order_by("rank", "team_id")
+    ]
+
+    timeline_last_id, points = await atimeline_points()
+
+    return render(request, "leaderboard.html", {
+        "leaderboard": leaderboard_context_rows(entries),
+        "graph_data": build_graph_data(points),
+        "timeline_last_id": timeline_last_id,
+        "user_team_id": await auser_team_id(request),
+    }, using=settings.PORTAL_HOT_TEMPLATES)
+
+
+async def leaderboard_data_api(request):
+    version = await acurrent_version()
+    etag = leaderboard_etag(request, version, await request.session.aget(SESSION_KEY, 0))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    entries, full, limit = leaderboard_entries(request, version)
+    entries, next_cursor = page_cursor([entry async for entry in entries], limit)
+
+    return leaderboard_json(
+        leaderboard_payload(entries, version, full, await auser_team_id(request), next_cursor), etag
+    )
+
+
+async def leaderboard_me_api(request):
+    version = await acurrent_version()
+    etag = leaderboard_etag(request, version, await request.session.aget(SESSION_KEY, 0))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    team_id = await auser_team_id(request)
+    entry = await my_entry(team_id).afirst() if team_id else None
+    if entry is None:
+        return HttpResponseForbidden("Team login required")
+
+    above, below = neighbour_querysets(entry, parse_neighbours(request))
+    above = [e async for e in above]
+    below = [e async for e in below]
+    teams = await LeaderboardEntry.objects.acount()
+
+    return leaderboard_json(my_rank_payload(entry, above, below, teams, version), etag)
@@ -0,0 +1,150 @@
+"""
+Zone content rendering, done once when a ZoneContent is saved.
+
+Admins write HTML (or plain text); players get a sanitized copy with
+comments, scripts and unknown tags/attributes removed and every link
+opening in a new tab. The result is split into parts at top-level
+element boundaries so large briefings can be loaded a part at a time.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from django.utils.html import linebreaks
+
+
+PART_CHARS = 16 * 1024   # a part is cut after the first top-level element past this size
+
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "code", "dd", "del", "details", "div", "dl", "dt",
+    "em", "figcaption", "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins",
+    "kbd", "li", "mark", "ol", "p", "pre", "q", "s", "samp", "small", "span", "strong", "sub",
+    "summary", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+VOID_TAGS = {"br", "hr", "img"}
+DROPPED_WITH_CONTENT = {"script", "style", "iframe", "object", "embed", "template", "noscript"}
+
+ALLOWED_ATTRS = {"class", "id", "title"}
+TAG_ATTRS = {
+    "a": {"href"},
+    "img": {"src", "alt", "width", "height"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+    "ol": {"start"},
+}
+URL_ATTRS = {"href", "src"}
+SAFE_URL = re.compile(r"^(https?://|mailto:|tel:|ftp:|/|#)", re.IGNORECASE)
+HAS_SCHEME = re.compile(r"^[a-z][a-z0-9+.-]*:", re.IGNORECASE)
+LOOKS_LIKE_HTML = re.compile(
+    r"<(!--|/?(%s)\b)" % "|".join(sorted(ALLOWED_TAGS | DROPPED_WITH_CONTENT)), re.IGNORECASE
+)
+
+
+def clean_url(url, bare_host):
+    """
+    Links are written as bare hosts ("example.com/x") as often as full
+    URLs: with bare_host those get https://, otherwise they stay relative.
+    Other schemes (javascript:, data:) are dropped.
+    """
+    url = url.strip()
+    if SAFE_URL.match(url):
+        return url
+    if HAS_SCHEME.match(url):
+        return None
+    return f"https://{url}" if bare_host else url
+
+
+class Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.size = 0
+        self.part_start = 0
+        self.part_ends = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def emit(self, text):
+        self.out.append(text)
+        self.size += len(text)
+
+    def end_part_if_full(self):
+        if not self.open_tags and self.size - self.part_start >= PART_CHARS:
+            self.part_ends.append(self.size)
+            self.part_start = self.size
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_WITH_CONTENT:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+
+        allowed = ALLOWED_ATTRS | TAG_ATTRS.get(tag, set())
+        kept = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS:
+                value = clean_url(value, bare_host=name == "href")
+                if value is None:
+                    continue
+            kept.append((name, value))
+        if tag == "a":
+            kept += [("target", "_blank"), ("rel", "noopener noreferrer")]
+
+        self.emit(f"<{tag}" + "".join(f' {name}="{escape(value)}"' for name, value in kept) + ">")
+        if tag in VOID_TAGS:
+            self.end_part_if_full()
+        else:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and tag in ALLOWED_TAGS and not self.dropping:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_WITH_CONTENT:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+
+        # Close anything left open inside it (unbalanced markup)
+        while True:
+            open_tag = self.open_tags.pop()
+            self.emit(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+        self.end_part_if_full()
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.emit(escape(data, quote=False))
+            self.end_part_if_full()
+
+    def finish(self):
+        self.close()
+        while self.open_tags:
+            self.emit(f"</{self.open_tags.pop()}>")
+        html = "".join(self.out)
+        lead = len(html) - len(html.lstrip())
+        html = html.strip()
+        ends = [end - lead for end in self.part_ends if 0 < end - lead < len(html)]
+        return html, (ends + [len(html)] if html else [])
+
+
+def render_content(text):
+    """
+    (html, part_ends) for raw ZoneContent.content; part_ends are the
+    offsets in html where each part stops (the last one is len(html)).
+    """
+    if not text.strip():
+        return "", []
+    if not LOOKS_LIKE_HTML.search(text):
+        text = linebreaks(text.strip(), autoescape=True)
+
+    sanitizer = Sanitizer()
+    sanitizer.feed(text)
+    return sanitizer.finish()
@@ -0,0 +1,63 @@
+"""
+Retry for short write transactions that lose the SQLite write lock.
+
+The production profile in settings.py (WAL, busy_timeout, BEGIN IMMEDIATE)
+makes writers queue instead of failing; this covers what is left, e.g. a
+busy_timeout that expires during a burst of logins.
+"""
+import functools
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+from . import metrics
+
+
+BASE_DELAY = 0.01    # seconds, doubled per retry
+MAX_DELAY = 0.25
+
+
+def retry_on_lock(func):
+    """
+    Re-run func on "database is locked", up to PORTAL_DB_LOCK_RETRIES
+    times, sleeping a random 0..min(MAX_DELAY, BASE_DELAY * 2**n) between
+    tries ("full jitter", so retrying writers don't collide again).
+
+    func must be safe to repeat: one transaction.atomic() block (or a
+    single statement). Inside an outer transaction the error is raised
+    as is, since only the outermost block can be retried.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (
+                    retries >= settings.PORTAL_DB_LOCK_RETRIES
+                    or connection.in_atomic_block
+                    or not metrics.is_lock_error(exc)
+                ):
+                    raise
+
+            metrics.registry.increment("portal_db_lock_retries_total", op=func.__qualname__)
+            time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** retries)))
+            retries += 1
+
+    return wrapper
+
+
+def supports_update_returning(connection):
+    """
+    Whether connection runs UPDATE ... RETURNING: PostgreSQL, and SQLite
+    from 3.35 (the library Python is linked against, not Django's minimum).
+    """
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return False
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+from collections import deque
+
+
+# -------------------------
+# CONFIG
+# -------------------------
+
+HEARTBEAT_SECONDS = 15
+RECONNECT_MS = 3000         # client retry delay advertised via "retry:"
+HISTORY_SIZE = 512          # events kept for Last-Event-ID replay
+SUBSCRIBER_QUEUE_SIZE = 256  # slow clients beyond this are dropped (they reconnect)
+
+
+# -------------------------
+# IN-PROCESS BROADCASTER
+# -------------------------
+class Broadcaster:
+    """
+    Fans out server-sent events to every connected client in this process.
+
+    publish() is called from sync code (signals, views running in threads),
+    so events are handed to each subscriber's event loop thread-safely.
+    A bounded history lets reconnecting clients resume via Last-Event-ID.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._last_id = 0
+
+    @property
+    def client_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, data):
+        with self._lock:
+            self._last_id += 1
+            message = (self._last_id, event, json.dumps(data))
+            self._history.append(message)
+            subscribers = list(self._subscribers)
+
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, loop, queue, message)
+
+    def _deliver(self, loop, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Client can't keep up: cut it loose, EventSource will reconnect
+            # with Last-Event-ID and replay from history.
+            with self._lock:
+                self._subscribers.discard((loop, queue))
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def _replay(self, last_event_id):
+        """
+        Events after last_event_id, or None if the gap fell out of history.
+        """
+        with self._lock:
+            history = list(self._history)
+            last_id = self._last_id
+
+        if last_event_id is None or last_event_id == last_id:
+            return []
+        if last_event_id > last_id:
+            # Ids from before a server restart
+            return None
+        if history and history[0][0] > last_event_id + 1:
+            return None
+        return [m for m in history if m[0] > last_event_id]
+
+    async def stream(self, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """
+        Async generator of SSE-formatted chunks for one client.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (loop, queue)
+
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+        try:
+            yield f"retry: {RECONNECT_MS}\n\n"
+
+            replay = self._replay(last_event_id)
+            if replay is None:
+                # Too far behind: tell the client to refetch the full board
+                yield format_sse(None, "reset", "{}")
+                replay, last_event_id = [], None
+
+            sent_id = last_event_id or 0
+            for message in replay:
+                sent_id = message[0]
+                yield format_sse(*message)
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if message is None:
+                    return
+                if message[0] <= sent_id:
+                    continue  # already sent during replay
+                sent_id = message[0]
+                yield format_sse(*message)
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+def format_sse(event_id, event, data):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+leaderboard_events = Broadcaster()
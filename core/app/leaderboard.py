@@ -0,0 +1,424 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Q, Window
+from django.db.models.functions import Rank
+from django.utils.timezone import make_naive
+
+from .events import leaderboard_events
+from .models import LeaderboardEntry, Score, ScoreEvent, ZoneAttempt, ZoneScore
+
+
+# -------------------------
+# RANKING ORDER
+# -------------------------
+# 1️⃣ Total DESC
+# 2️⃣ Credit DESC
+# 3️⃣ Time ASC
+RANK_ORDER = (
+    F("total").desc(),
+    F("credit").desc(),
+    F("total_time_seconds").asc(),
+)
+
+
+VERSION_CACHE_KEY = "leaderboard:version"
+
+
+# -------------------------
+# RANK MAINTENANCE
+# -------------------------
+# rank = 1 + number of rows strictly ahead (RANK(): ties share a rank and
+# the next one is skipped). When one team's (total, credit, time) moves,
+# only the rows between its old and new positions change rank, each by
+# exactly one, so a score change costs O(rows passed), not O(teams).
+RANK_FIELDS = ("total", "credit", "total_time_seconds")
+
+
+def rank_key(entry):
+    return tuple(getattr(entry, field) for field in RANK_FIELDS)
+
+
+def _sort_key(key):
+    total, credit, seconds = key
+    return (-total, -credit, seconds)
+
+
+def ranked_ahead_of(key):
+    """
+    Rows strictly ahead of (total, credit, time_seconds).
+    """
+    total, credit, seconds = key
+    return (
+        Q(total__gt=total)
+        | Q(total=total, credit__gt=credit)
+        | Q(total=total, credit=credit, total_time_seconds__lt=seconds)
+    )
+
+
+def ranked_behind(key):
+    """
+    Rows strictly behind (total, credit, time_seconds).
+    """
+    total, credit, seconds = key
+    return (
+        Q(total__lt=total)
+        | Q(total=total, credit__lt=credit)
+        | Q(total=total, credit=credit, total_time_seconds__gt=seconds)
+    )
+
+
+def move_team(team_id, old_key, new_key):
+    """
+    Re-rank after team_id's row went from old_key to new_key (old_key
+    None: the row is new). Must run in the transaction that wrote it.
+    Returns the team ids whose rank changed.
+    """
+    others = LeaderboardEntry.objects.exclude(team_id=team_id)
+
+    if old_key is None:
+        # New row: everything behind it drops one place
+        passed, shift = others.filter(ranked_behind(new_key)), 1
+    elif _sort_key(new_key) < _sort_key(old_key):
+        # Moved up past rows that were level with or behind the old key
+        passed, shift = others.filter(ranked_behind(new_key)).exclude(ranked_behind(old_key)), 1
+    elif _sort_key(new_key) > _sort_key(old_key):
+        # Moved down: rows it was ahead of and no longer is move up
+        passed, shift = others.filter(ranked_behind(old_key)).exclude(ranked_behind(new_key)), -1
+    else:
+        passed, shift = others.none(), 0
+
+    changed = set(passed.values_list("team_id", flat=True)) if shift else set()
+    if changed:
+        LeaderboardEntry.objects.filter(team_id__in=changed).update(rank=F("rank") + shift)
+
+    rank = others.filter(ranked_ahead_of(new_key)).count() + 1
+    if LeaderboardEntry.objects.filter(team_id=team_id).exclude(rank=rank).update(rank=rank):
+        changed.add(team_id)
+    return changed
+
+
+def rerank():
+    """
+    Re-number every rank with RANK() over the stored totals. Only rows
+    whose rank actually moved are written back. For repairs and bulk
+    changes; single-team changes use move_team().
+    Returns the team ids whose rank changed.
+    """
+    rows = (
+        LeaderboardEntry.objects
+        .annotate(new_rank=Window(expression=Rank(), order_by=RANK_ORDER))
+        .values_list("pk", "team_id", "rank", "new_rank")
+    )
+
+    changed = []
+    changed_team_ids = set()
+    for pk, team_id, rank, new_rank in rows:
+        if rank != new_rank:
+            changed.append(LeaderboardEntry(pk=pk, rank=new_rank))
+            changed_team_ids.add(team_id)
+
+    if changed:
+        LeaderboardEntry.objects.bulk_update(changed, ["rank"])
+
+    return changed_team_ids
+
+
+# -------------------------
+# SERIALIZATION / PUSH
+# -------------------------
+def format_time_display(seconds):
+    """Format seconds into MM:SS or HH:MM:SS"""
+    if seconds == 0:
+        return "--:--"
+    
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+    
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def serialize_entry(entry):
+    return {
+        "team_id": entry.team_id,
+        "rank": entry.rank,
+        "team": entry.team.name,
+        "total": entry.total,
+        "credit": entry.credit,
+        "time": format_time_display(entry.total_time_seconds),
+    }
+
+
+# -------------------------
+# VERSIONING
+# -------------------------
+def current_version():
+    """
+    Latest leaderboard version. Served from the shared cache so a
+    conditional poll needs no ORM work; falls back to MAX(version).
+    """
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = LeaderboardEntry.objects.aggregate(v=Max("version"))["v"] or 0
+        # add(), not set(): never overwrite a newer version stored meanwhile
+        cache.add(VERSION_CACHE_KEY, version, None)
+    return version
+
+
+async def acurrent_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = (await LeaderboardEntry.objects.aaggregate(v=Max("version")))["v"] or 0
+        cache.add(VERSION_CACHE_KEY, version, None)
+    return version
+
+
+def advance_version(version):
+    """
+    Move the cached version forward to `version`, never back: commits can
+    land out of order, and an older one must not hide a newer version.
+    With nothing cached, current_version() reads MAX(version) instead.
+    """
+    cached = cache.get(VERSION_CACHE_KEY)
+    if cached is not None and cached < version:
+        cache.set(VERSION_CACHE_KEY, version, None)
+
+
+def bump_version(team_ids=None, floor=0):
+    """
+    Stamp the given rows (all rows if None) with a new version.
+    Must run inside the transaction that changed them.
+    """
+    latest = LeaderboardEntry.objects.aggregate(v=Max("version"))["v"] or 0
+    version = max(latest, floor) + 1
+
+    entries = LeaderboardEntry.objects.all()
+    if team_ids is not None:
+        entries = entries.filter(team_id__in=team_ids)
+    entries.update(version=version)
+
+    transaction.on_commit(lambda: advance_version(version))
+    return version
+
+
+def publish_changes(team_ids):
+    """
+    Version the changed rows and push them to SSE clients once committed.
+    """
+    team_ids = set(team_ids)
+    version = bump_version(team_ids)
+
+    def send():
+        entries = (
+            LeaderboardEntry.objects
+            .select_related("team")
+            .filter(team_id__in=team_ids)
+        )
+        leaderboard_events.publish("leaderboard", {
+            "version": version,
+            "rows": [serialize_entry(entry) for entry in entries],
+        })
+
+    transaction.on_commit(send)
+
+
+# -------------------------
+# INCREMENTAL UPDATES
+# -------------------------
+def _current_key(team_id):
+    return (
+        LeaderboardEntry.objects
+        .filter(team_id=team_id)
+        .values_list(*RANK_FIELDS)
+        .first()
+    )
+
+
+@transaction.atomic
+def refresh_team(team_id):
+    """
+    Recompute a single team's row from Score + ZoneAttempt.
+    """
+    score = Score.objects.with_totals().filter(team_id=team_id).first()
+    old_key = _current_key(team_id)
+
+    entry, _ = LeaderboardEntry.objects.update_or_create(
+        team_id=team_id,
+        defaults={
+            "total": score.total if score else 0,
+            "credit": score.credit if score else 0,
+            "total_time_seconds": score.total_time_seconds if score else 0,
+        },
+    )
+    publish_changes({team_id} | move_team(team_id, old_key, rank_key(entry)))
+
+
+@transaction.atomic
+def apply_score(score):
+    """
+    Called on Score save: copy total/credit, log a timeline point
+    if the total moved, and re-rank the rows it passed.
+    """
+    old_key = _current_key(score.team_id)
+    if old_key is None:
+        refresh_team(score.team_id)
+        return
+
+    previous_total, previous_credit, seconds = old_key
+    if (score.total, score.credit) == (previous_total, previous_credit):
+        return   # nothing shown on the leaderboard changed
+
+    if score.total != previous_total:
+        ScoreEvent.objects.create(
+            team_id=score.team_id,
+            total=score.total,
+            delta=score.total - previous_total,
+        )
+
+    LeaderboardEntry.objects.filter(team_id=score.team_id).update(
+        total=score.total,
+        credit=score.credit,
+    )
+    new_key = (score.total, score.credit, seconds)
+    publish_changes({score.team_id} | move_team(score.team_id, old_key, new_key))
+
+
+@transaction.atomic
+def apply_completed_attempt(attempt):
+    """
+    Called from ZoneAttempt.end_attempt: add this attempt's time.
+    Time is the last tie-break, so ranks may move.
+    """
+    apply_completed_attempts({attempt.team_id: attempt.duration_seconds or 0})
+
+
+@transaction.atomic
+def apply_completed_attempts(durations):
+    """
+    Add time for many completed attempts ({team_id: seconds}), moving
+    each team past the rows it fell behind, and publish once
+    (ZoneAttempt end_attempts).
+    """
+    old_keys = {
+        team_id: key
+        for team_id, *key in LeaderboardEntry.objects
+        .filter(team_id__in=durations)
+        .values_list("team_id", *RANK_FIELDS)
+    }
+
+    # Teams without a row yet: build theirs from scratch
+    for team_id in set(durations) - set(old_keys):
+        refresh_team(team_id)
+    if not old_keys:
+        return
+
+    # One team at a time: each move needs every other row's rank to
+    # match its stored key
+    changed = set(old_keys)
+    for team_id, (total, credit, seconds) in old_keys.items():
+        LeaderboardEntry.objects.filter(team_id=team_id).update(
+            total_time_seconds=F("total_time_seconds") + durations[team_id],
+        )
+        new_key = (total, credit, seconds + durations[team_id])
+        changed |= move_team(team_id, (total, credit, seconds), new_key)
+    publish_changes(changed)
+
+
+# -------------------------
+# FULL REBUILD (seeding / repair)
+# -------------------------
+@transaction.atomic
+def rebuild():
+    """
+    Rebuild every row from scratch. Use after bulk data changes
+    that bypass Score.save / end_attempt (e.g. seed_ctf).
+    """
+    # Keep versions monotonic across the delete
+    floor = LeaderboardEntry.objects.aggregate(v=Max("version"))["v"] or 0
+    LeaderboardEntry.objects.all().delete()
+
+    entries = [
+        LeaderboardEntry(
+            team_id=score.team_id,
+            total=score.total,
+            credit=score.credit,
+            total_time_seconds=score.total_time_seconds,
+            rank=score.rank,
+        )
+        for score in Score.objects.ranked()
+    ]
+    LeaderboardEntry.objects.bulk_create(entries)
+
+    version = bump_version(floor=floor)
+    transaction.on_commit(lambda: leaderboard_events.publish("reset", {"version": version}))
+
+
+@transaction.atomic
+def rebuild_timeline():
+    """
+    Replace the score history with one point per COMPLETED attempt,
+    valued at the team's current zone points. Only for seeded data,
+    where no real history exists.
+    """
+    ScoreEvent.objects.all().delete()
+
+    attempts = (
+        ZoneAttempt.objects
+        .filter(status="COMPLETED", exit_time__isnull=False)
+        .only("team_id", "zone_id", "exit_time")
+        .order_by("exit_time")
+    )
+    points_by_zone = {
+        (team_id, zone_id): points
+        for team_id, zone_id, points in ZoneScore.objects.values_list("team_id", "zone_id", "points")
+    }
+
+    totals = {}
+    events = []
+    for attempt in attempts:
+        points = points_by_zone.get((attempt.team_id, attempt.zone_id), 0)
+        totals[attempt.team_id] = totals.get(attempt.team_id, 0) + points
+        events.append(ScoreEvent(
+            team_id=attempt.team_id,
+            total=totals[attempt.team_id],
+            delta=points,
+            created_at=attempt.exit_time,
+        ))
+
+    ScoreEvent.objects.bulk_create(events)
+
+
+# -------------------------
+# TIMELINE
+# -------------------------
+def _timeline_events(since):
+    events = ScoreEvent.objects.select_related("team").order_by("id")
+    if since is not None:
+        events = events.filter(id__gt=since)
+    return events
+
+
+def _timeline_point(event):
+    return {
+        "team": event.team.name,
+        "x": make_naive(event.created_at).isoformat(),
+        "y": event.total,
+    }
+
+
+def timeline_points(since=None):
+    """
+    Score history as (last_id, [{"team", "x", "y"}]), oldest first.
+    since is the last event id the caller already has.
+    """
+    events = list(_timeline_events(since))
+    last_id = events[-1].id if events else (since or 0)
+    return last_id, [_timeline_point(event) for event in events]
+
+
+async def atimeline_points(since=None):
+    events = [event async for event in _timeline_events(since)]
+    last_id = events[-1].id if events else (since or 0)
+    return last_id, [_timeline_point(event) for event in events]
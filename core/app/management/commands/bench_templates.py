@@ -0,0 +1,80 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from app.models import LeaderboardEntry, Team
+from app.views import build_graph_data, leaderboard_context_rows
+
+
+ENGINES = ("django", "jinja2")
+DEFAULT_SIZES = "10,100,1000"
+
+
+def leaderboard_context(teams):
+    """
+    The leaderboard.html context for `teams` unsaved teams, with five
+    timeline points each (no database needed).
+    """
+    entries = [
+        LeaderboardEntry(
+            team=Team(id=i, name=f"Team {i:04d}"),
+            team_id=i,
+            rank=i,
+            total=10_000 - i,
+            credit=i % 7,
+            total_time_seconds=600 + i,
+        )
+        for i in range(1, teams + 1)
+    ]
+    start = datetime(2026, 2, 14, 9, 0)
+    points = [
+        {"team": f"Team {i:04d}", "x": (start + timedelta(minutes=step * 10)).isoformat(), "y": step * 100}
+        for step in range(5) for i in range(1, teams + 1)
+    ]
+    return {
+        "leaderboard": leaderboard_context_rows(entries),
+        "graph_data": build_graph_data(points),
+        "timeline_last_id": len(points),
+        "user_team_id": None,
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark rendering leaderboard.html with the Django and Jinja2 engines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated team counts")
+        parser.add_argument("--renders", type=int, default=50, help="Renders per engine per size")
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get("/leaderboard/")
+        request.user = AnonymousUser()
+
+        self.stdout.write(f"{'teams':>6}  {'engine':<8}{'p50 ms':>10}{'min ms':>10}{'KB':>8}")
+        for teams in [int(size) for size in options["sizes"].split(",")]:
+            context = leaderboard_context(teams)
+            medians = {}
+
+            for engine in ENGINES:
+                # First render compiles (or loads bytecode); not measured
+                html = render_to_string("leaderboard.html", context, request, using=engine)
+
+                timings = []
+                for _ in range(options["renders"]):
+                    start = time.perf_counter()
+                    render_to_string("leaderboard.html", context, request, using=engine)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                medians[engine] = statistics.median(timings)
+                self.stdout.write(
+                    f"{teams:>6}  {engine:<8}{medians[engine]:>10.2f}{min(timings):>10.2f}{len(html) / 1024:>8.0f}"
+                )
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{'':>6}  django/jinja2 = {medians['django'] / medians['jinja2']:.2f}x"
+            ))
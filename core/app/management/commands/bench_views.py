@@ -0,0 +1,157 @@
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_PATHS = ["/leaderboard/", "/leaderboard/data/"]
+LOGIN_PATHS = ["/zones/"]
+
+
+def wait_for_server(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/leaderboard/data/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"uvicorn did not start on port {port}")
+
+
+def login_cookie(port, username, password):
+    """
+    Log in through /login/ and return a Cookie header for later requests.
+    """
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    base = f"http://127.0.0.1:{port}"
+
+    opener.open(f"{base}/login/").read()
+    csrf = next((c.value for c in jar if c.name == "csrftoken"), "")
+
+    body = urllib.parse.urlencode({
+        "username": username,
+        "password": password,
+        "csrfmiddlewaretoken": csrf,
+    }).encode()
+    request = urllib.request.Request(f"{base}/login/", data=body, headers={"Referer": f"{base}/login/"})
+    opener.open(request).read()
+
+    if not any(c.name == settings.SESSION_COOKIE_NAME for c in jar):
+        raise CommandError("Login failed (bad credentials or MAX_SESSIONS reached)")
+    return "; ".join(f"{c.name}={c.value}" for c in jar)
+
+
+def hammer(port, path, total, concurrency, cookie=None):
+    """
+    Issue `total` GETs over `concurrency` keep-alive connections.
+    Returns (requests/sec, latencies in ms, error count).
+    """
+    headers = {"Cookie": cookie} if cookie else {}
+    per_worker = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+    def worker(count):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies, errors = [], 0
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            latencies.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, per_worker))
+    elapsed = time.perf_counter() - started
+
+    latencies = [ms for worker_latencies, _ in results for ms in worker_latencies]
+    errors = sum(worker_errors for _, worker_errors in results)
+    return total / elapsed, latencies, errors
+
+
+class Command(BaseCommand):
+    help = "Benchmark hot views under uvicorn: sync path vs async views (requests/sec)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per path per mode")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--port", type=int, default=8100)
+        parser.add_argument("--username", help="Team login, enables /zones/")
+        parser.add_argument("--password")
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Extra path to benchmark (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        port = options["port"]
+        paths = list(DEFAULT_PATHS)
+        if options["username"]:
+            paths += LOGIN_PATHS
+        paths += options["paths"] or []
+
+        results = {}
+        for mode, flag in (("sync", "0"), ("async", "1")):
+            env = {**os.environ, "PORTAL_ASYNC_VIEWS": flag}
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "core.asgi:application",
+                 "--port", str(port), "--log-level", "warning"],
+                cwd=settings.BASE_DIR,
+                env=env,
+            )
+            try:
+                wait_for_server(port)
+
+                cookie = None
+                if options["username"]:
+                    cookie = login_cookie(port, options["username"], options["password"])
+
+                for path in paths:
+                    # Warm caches / connections before measuring
+                    hammer(port, path, min(50, options["requests"]), options["concurrency"], cookie)
+                    results[(mode, path)] = hammer(
+                        port, path, options["requests"], options["concurrency"], cookie
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+        self.stdout.write(
+            f"{'path':<24}{'mode':<7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}"
+        )
+        for path in paths:
+            for mode in ("sync", "async"):
+                rps, latencies, errors = results[(mode, path)]
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+                self.stdout.write(
+                    f"{path:<24}{mode:<7}{rps:>10.1f}"
+                    f"{statistics.median(latencies):>10.1f}{p95:>10.1f}{errors:>8}"
+                )
+            sync_rps = results[("sync", path)][0]
+            async_rps = results[("async", path)][0]
+            self.stdout.write(self.style.SUCCESS(f"{'':<24}async/sync = {async_rps / sync_rps:.2f}x"))
@@ -0,0 +1,164 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+
+from app import metrics
+from app.management.commands.loadtest import create_load_teams, delete_load_teams, percentile
+from app.models import TeamSession, ZoneAttempt
+from app.session_backend import HeartbeatBuffer
+
+
+OPERATIONS = ("enter_zone", "submit_zone", "heartbeat")
+SESSION_PREFIX = "bench-writes-"
+
+
+# -------------------------
+# ONE PROFILE (child process)
+# -------------------------
+def play(username, steps, results, lock):
+    """
+    One team: for each zone redeem the code, complete the attempt and
+    write a heartbeat, each as its own "request" (connections are
+    closed or kept between them per CONN_MAX_AGE, like Django does).
+    """
+    latencies = defaultdict(list)
+    locked = defaultdict(int)
+    heartbeat = HeartbeatBuffer(flush_size=1)   # flush on every record
+    session_key = f"{SESSION_PREFIX}{username}"
+
+    def timed(name, func):
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            return func()
+        except OperationalError as exc:
+            if not metrics.is_lock_error(exc):
+                raise
+            locked[name] += 1
+        finally:
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            close_old_connections()
+
+    try:
+        for code, _zone_id, _exit_code in steps:
+            attempt = timed("enter_zone", lambda: ZoneAttempt.start(code))
+            if attempt is not None:
+                timed("submit_zone", lambda: attempt.end_attempt(status="COMPLETED"))
+            timed("heartbeat", lambda: heartbeat.record(session_key))
+    finally:
+        connection.close()
+
+    with lock:
+        for name in OPERATIONS:
+            results["latencies"][name] += latencies[name]
+            results["locked"][name] += locked[name]
+
+
+def run_profile(teams):
+    plan = create_load_teams(teams)
+    users = dict(User.objects.filter(username__in=[u for u, _ in plan]).values_list("username", "id"))
+    TeamSession.objects.bulk_create([
+        TeamSession(user_id=users[username], session_key=f"{SESSION_PREFIX}{username}")
+        for username, _ in plan
+    ])
+    connection.close()
+
+    results = {"latencies": defaultdict(list), "locked": defaultdict(int)}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=teams) as pool:
+            for future in [pool.submit(play, username, steps, results, lock) for username, steps in plan]:
+                future.result()
+        elapsed = time.perf_counter() - started
+    finally:
+        TeamSession.objects.filter(session_key__startswith=SESSION_PREFIX).delete()
+        delete_load_teams()
+
+    retries = sum(
+        value for name, _labels, value in metrics.registry.snapshot()["counters"]
+        if name == "portal_db_lock_retries_total"
+    )
+    return {
+        "elapsed": elapsed,
+        "retries": retries,
+        "latencies": results["latencies"],
+        "locked": results["locked"],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the write paths (enter_zone, submit_zone, heartbeat) under "
+        "concurrent teams, once per PORTAL_DB_PROFILE, and compare"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--teams", type=int, default=16, help="Concurrent teams (threads)")
+        parser.add_argument(
+            "--profiles", default="stock,production",
+            help="Comma-separated PORTAL_DB_PROFILE values to compare",
+        )
+        parser.add_argument("--child", action="store_true", help="Internal: run one profile, print JSON")
+
+    def handle(self, *args, **options):
+        if options["child"]:
+            result = run_profile(options["teams"])
+            self.stdout.write(json.dumps(result))
+            return
+
+        profiles = options["profiles"].split(",")
+        unknown = set(profiles) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(sorted(unknown))}")
+
+        results = {}
+        for profile in profiles:
+            self.stdout.write(f"Running {options['teams']} teams with PORTAL_DB_PROFILE={profile}...")
+            # A fresh process per profile: DATABASES is read at startup
+            child = subprocess.run(
+                [sys.executable, "manage.py", "bench_writes", "--child", "--teams", str(options["teams"])],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "PORTAL_DB_PROFILE": profile},
+                capture_output=True,
+                text=True,
+            )
+            if child.returncode:
+                raise CommandError(f"{profile} run failed:\n{child.stderr}")
+            results[profile] = json.loads(child.stdout.strip().splitlines()[-1])
+
+        self.report(results)
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'profile':<12}{'operation':<13}{'count':>7}{'ops/s':>8}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'locked':>8}"
+        )
+        for profile, result in results.items():
+            for name in OPERATIONS:
+                latencies = result["latencies"].get(name, [])
+                if not latencies:
+                    continue
+                self.stdout.write(
+                    f"{profile:<12}{name:<13}{len(latencies):>7}{len(latencies) / result['elapsed']:>8.1f}"
+                    f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}"
+                    f"{percentile(latencies, 99):>9.1f}{result['locked'].get(name, 0):>8}"
+                )
+
+            total = sum(len(v) for v in result["latencies"].values())
+            locked = sum(result["locked"].values())
+            summary = (
+                f"{profile}: {total} writes in {result['elapsed']:.1f}s = {total / result['elapsed']:.1f}/s, "
+                f"{locked} 'database is locked', {result['retries']:.0f} retried"
+            )
+            self.stdout.write(self.style.ERROR(summary) if locked else self.style.SUCCESS(summary))
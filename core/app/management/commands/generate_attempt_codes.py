@@ -0,0 +1,128 @@
+import csv
+import secrets
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from app.models import Player, Zone, ZoneAttemptAccess
+from app.team_state import invalidate as invalidate_team_state
+
+
+# No 0/O or 1/I: codes get typed in from printed slips
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 10   # max_length is 20
+BATCH_SIZE = 1000
+
+
+class CodeGenerator:
+    """
+    Hands out codes that are unique against the table and each other,
+    so collisions are resolved here instead of by failed INSERTs.
+    """
+
+    def __init__(self, length=CODE_LENGTH):
+        self.length = length
+        self.taken = set(
+            ZoneAttemptAccess.objects.values_list("attempt_code", flat=True).iterator()
+        )
+
+    def __call__(self):
+        while True:
+            code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(self.length))
+            if code not in self.taken:
+                self.taken.add(code)
+                return code
+
+
+class Command(BaseCommand):
+    help = "Bulk-create attempt codes (one per player per zone) and export them to CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--team", action="append", dest="teams", help="Team name (repeatable, default: all)")
+        parser.add_argument("--zone", action="append", dest="zones", type=int, help="Zone id (repeatable, default: all)")
+        parser.add_argument("--output", default="attempt_codes.csv", help='CSV path, or "-" for stdout')
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--length", type=int, default=CODE_LENGTH)
+
+    def handle(self, *args, **options):
+        if not 6 <= options["length"] <= 20:
+            raise CommandError("--length must be between 6 and 20")
+
+        zones = Zone.objects.order_by("id")
+        if options["zones"]:
+            zones = zones.filter(id__in=options["zones"])
+        zones = list(zones)
+        if not zones:
+            raise CommandError("No zones found.")
+
+        players = Player.objects.select_related("team").order_by("team__name", "role")
+        if options["teams"]:
+            players = players.filter(team__name__in=options["teams"])
+
+        # Codes already issued for these players/zones are left alone
+        existing = set(
+            ZoneAttemptAccess.objects
+            .filter(player__in=players, zone__in=zones)
+            .values_list("player_id", "zone_id")
+            .iterator()
+        )
+        next_code = CodeGenerator(options["length"])
+
+        out = sys.stdout if options["output"] == "-" else open(
+            options["output"], "w", newline="", encoding="utf-8"
+        )
+        created = skipped = 0
+        try:
+            writer = csv.writer(out)
+            writer.writerow(["team_name", "player_name", "role", "zone", "attempt_code"])
+
+            batch = []
+            for player in players.iterator(chunk_size=options["batch_size"]):
+                for zone in zones:
+                    if (player.id, zone.id) in existing:
+                        skipped += 1
+                        continue
+
+                    batch.append(ZoneAttemptAccess(
+                        zone=zone,
+                        team=player.team,
+                        player=player,
+                        attempt_code=next_code(),
+                    ))
+                    if len(batch) >= options["batch_size"]:
+                        created += self.flush(batch, writer)
+                        batch = []
+
+            created += self.flush(batch, writer)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"✔ {created} codes created, {skipped} already existed"
+            + ("" if out is sys.stdout else f"\n✔ Codes saved to {options['output']}")
+        ))
+
+    def flush(self, batch, writer):
+        """
+        Insert one batch and write its rows out; nothing is kept after.
+        """
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                ZoneAttemptAccess.objects.bulk_create(batch)
+        except IntegrityError as exc:
+            # Only a concurrent admin edit can get here
+            raise CommandError(f"Codes changed while generating, re-run to continue: {exc}")
+
+        # bulk_create sends no post_save: refresh these teams' zones pages
+        invalidate_team_state(*{a.team_id for a in batch})
+
+        writer.writerows(
+            [a.team.name, a.player.name, a.player.role, a.zone.title, a.attempt_code]
+            for a in batch
+        )
+        return len(batch)
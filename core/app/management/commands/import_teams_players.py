@@ -1,12 +1,21 @@
 import csv
+import itertools
+import json
+import os
 import random
 import string
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from django.core.management.base import BaseCommand
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.db import transaction, IntegrityError
+from django.db import transaction
 
-from app.models import Team, Player
+from app.leaderboard import rebuild as rebuild_leaderboard
+from app.models import Team, Player, Score
+from app.normalize import normalize_rows
 
 
 def random_password(length=8):
@@ -32,86 +41,332 @@ class Command(BaseCommand):
             type=str,
             default="generated_team_credentials.csv"
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Hash passwords in parallel and insert each chunk with bulk_create (skips per-team signals)"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Password hashing processes for --bulk (default: all cores)"
+        )
+        parser.add_argument(
+            "--raw",
+            action="store_true",
+            help="Input is the registration sheet (one row per team); normalize it on the fly"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Teams per transaction"
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help="Resume file (default: <input_csv>.checkpoint)"
+        )
+        parser.add_argument(
+            "--rejected",
+            type=str,
+            default=None,
+            help="Rejected rows (default: <input_csv>.rejected.csv)"
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        """
+        Streaming import: rows are grouped per team and committed in
+        chunks of --chunk-size teams.
+
+        - A checkpoint file records how many rows are committed, so a
+          failed run picks up where it stopped when re-run.
+        - Bad rows (and teams that already exist) go to the --rejected
+          CSV instead of aborting the import.
+        - By default each chunk saves team by team with create(), so the
+          Team/Score signals run as for an admin-created team. --bulk
+          inserts a chunk in a handful of statements instead: bulk_create
+          doesn't send post_save, so create_user_for_team /
+          create_score_for_team / the leaderboard signal are bypassed on
+          purpose, users and scores are created here and the leaderboard
+          is rebuilt once at the end.
+        """
+        started = time.perf_counter()
         input_csv = options["input_csv"]
-        output_csv = options["output"]
-
-        teams_created = {}
-        credentials = []
-
-        # ✅ utf-8-sig fixes Excel BOM issue
-        with open(input_csv, newline="", encoding="utf-8-sig") as file:
-            reader = csv.DictReader(file)
-
-            required_columns = {"team_name", "player_name", "role"}
-
-            if not reader.fieldnames:
-                raise Exception("CSV file is empty or missing header row")
-
-            if not required_columns.issubset(reader.fieldnames):
-                raise Exception(
-                    f"CSV must contain columns {required_columns}, "
-                    f"but found {reader.fieldnames}"
-                )
-
-            for row in reader:
-                team_name = row["team_name"].strip()
-                player_name = row["player_name"].strip()
-                role = row["role"].strip()
-
-                if role not in VALID_ROLES:
-                    raise ValueError(
-                        f"Invalid role '{role}' for player '{player_name}' "
-                        f"in team '{team_name}'"
-                    )
-
-                # --- Create team + team user only once ---
-                if team_name not in teams_created:
-                    username = slugify_name(team_name)
-                    password = generic_password(username)
-
-                    user = User.objects.create_user(
-                        username=username,
-                        password=password
-                    )
-
-                    team = Team.objects.create(
-                        name=team_name,
-                        user=user
-                    )
-
-                    teams_created[team_name] = team
-                    credentials.append([
-                        team_name,
-                        username,
-                        password
-                    ])
-                else:
-                    team = teams_created[team_name]
-
-                # --- Create player (role must be unique per team) ---
-                try:
-                    Player.objects.create(
-                        name=player_name,
-                        role=role,
-                        team=team
-                    )
-                except IntegrityError:
-                    raise IntegrityError(
-                        f"Role '{role}' already exists in team '{team_name}'"
-                    )
-
-        # --- Write output credentials ---
-        with open(output_csv, "w", newline="", encoding="utf-8") as out:
-            writer = csv.writer(out)
-            writer.writerow(["team_name", "username", "password"])
-            writer.writerows(credentials)
+        checkpoint = Checkpoint(options["checkpoint"] or f"{input_csv}.checkpoint", input_csv)
+        done = resumed_at = checkpoint.load()
+        if done:
+            self.stdout.write(f"↻ Resuming after row {done} ({checkpoint.path})")
+
+        rows = itertools.islice(source_rows(options), done, None)
+        stats = {"players": 0, "teams": 0, "rejected": 0}
+
+        workers = (options["workers"] or os.cpu_count() or 1) if options["bulk"] else 1
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup) if workers > 1 else None
+        write = self.write_bulk if options["bulk"] else self.write_serial
+
+        with CsvAppender(options["output"], ["team_name", "username", "password"], fresh=not done) as credentials, \
+             CsvAppender(options["rejected"] or f"{input_csv}.rejected.csv", REJECTED_FIELDS, fresh=not done) as rejected:
+            try:
+                chunk, chunk_rows = {}, 0
+                for team_name, group in team_groups(rows):
+                    chunk_rows += len(group)
+                    team = chunk.setdefault(team_name, {"players": {}, "rows": [], "rejects": []})
+                    validate_team(team_name, group, team)
 
+                    if len(chunk) >= options["chunk_size"]:
+                        done += self.import_chunk(chunk, chunk_rows, write, pool, workers, credentials, rejected, stats)
+                        checkpoint.save(done)
+                        chunk, chunk_rows = {}, 0
+
+                done += self.import_chunk(chunk, chunk_rows, write, pool, workers, credentials, rejected, stats)
+            finally:
+                if pool:
+                    pool.shutdown()
+
+        if options["bulk"]:
+            rebuild_leaderboard()
+        checkpoint.clear()
+
+        elapsed = time.perf_counter() - started
         self.stdout.write(
             self.style.SUCCESS(
-                f"✔ Teams & players imported successfully\n"
-                f"✔ Team credentials saved to {output_csv}"
+                f"✔ {stats['teams']} teams / {stats['players']} players imported in {elapsed:.2f}s "
+                f"({(done - resumed_at) / elapsed:.0f} rows/sec)\n"
+                f"✔ Team credentials saved to {options['output']}"
             )
         )
+        if stats["rejected"]:
+            self.stdout.write(self.style.WARNING(
+                f"✘ {stats['rejected']} rows rejected, see {rejected.path}"
+            ))
+
+    def import_chunk(self, chunk, chunk_rows, write, pool, workers, credentials, rejected, stats):
+        """
+        Commit one chunk of teams; returns the number of source rows it
+        covered (imported + rejected).
+        """
+        usernames = {name: slugify_name(name) for name, team in chunk.items() if team["players"]}
+
+        taken = set(Team.objects.filter(name__in=usernames).values_list("name", flat=True))
+        taken_usernames = set(
+            User.objects.filter(username__in=usernames.values()).values_list("username", flat=True)
+        )
+        seen = set()
+        for name, username in list(usernames.items()):
+            if name in taken or username in taken_usernames or username in seen:
+                reject_team(chunk[name], "team or username already exists")
+                del usernames[name]
+            seen.add(username)
+
+        credential_rows = [
+            [name, username, generic_password(username)]
+            for name, username in usernames.items()
+        ]
+        # Hashed before the transaction opens, so the write lock isn't
+        # held through PBKDF2
+        hashes = hash_passwords([password for _, _, password in credential_rows], pool, workers)
+
+        with transaction.atomic():
+            players = write(chunk, credential_rows, hashes)
+
+        # Side files only after the commit, so a crash can't leave
+        # credentials behind for teams that were rolled back
+        credentials.writerows(credential_rows)
+        rejects = [reject for team in chunk.values() for reject in team["rejects"]]
+        rejected.writerows(rejects)
+
+        stats["teams"] += len(credential_rows)
+        stats["players"] += players
+        stats["rejected"] += len(rejects)
+        return chunk_rows
+
+    def write_serial(self, chunk, credential_rows, hashes):
+        players = 0
+        for (name, username, _), hashed in zip(credential_rows, hashes):
+            user = User.objects.create(username=username, password=hashed)
+            team = Team.objects.create(name=name, user=user)
+            for role, player_name in chunk[name]["players"].items():
+                Player.objects.create(name=player_name, role=role, team=team)
+                players += 1
+        return players
+
+    def write_bulk(self, chunk, credential_rows, hashes):
+        usernames = {name: username for name, username, _ in credential_rows}
+
+        User.objects.bulk_create([
+            User(username=username, password=hashed)
+            for (_, username, _), hashed in zip(credential_rows, hashes)
+        ])
+        user_ids = dict(
+            User.objects.filter(username__in=usernames.values()).values_list("username", "id")
+        )
+
+        Team.objects.bulk_create([
+            Team(name=name, user_id=user_ids[username])
+            for name, username in usernames.items()
+        ])
+        team_ids = dict(Team.objects.filter(name__in=usernames).values_list("name", "id"))
+
+        players = [
+            Player(name=player_name, role=role, team_id=team_ids[name])
+            for name in usernames
+            for role, player_name in chunk[name]["players"].items()
+        ]
+        Player.objects.bulk_create(players)
+        Score.objects.bulk_create([Score(team_id=team_id) for team_id in team_ids.values()])
+        return len(players)
+
+
+# -------------------------
+# PIPELINE HELPERS
+# -------------------------
+REJECTED_FIELDS = ["team_name", "player_name", "role", "reason"]
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    """
+    PBKDF2 is deliberately slow and CPU-bound, so spread it across a
+    process pool. Workers only hash; they never touch the database.
+    """
+    if pool is None or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def source_rows(options):
+    """
+    Importer rows from either a normalized CSV or, with --raw, the
+    registration sheet normalized on the fly.
+    """
+    if options["raw"]:
+        return normalize_rows(read_csv(options["input_csv"]))
+    return read_rows(options["input_csv"])
+
+
+def team_groups(rows):
+    """
+    Group consecutive rows of the same team (normalize output keeps a
+    team's players together).
+    """
+    for team_name, group in itertools.groupby(rows, key=lambda row: row["team_name"].strip()):
+        yield team_name, list(group)
+
+
+def validate_team(team_name, rows, team):
+    """
+    Sort a team's rows into valid players and rejects (with a reason).
+    """
+    for row in rows:
+        player_name = row["player_name"].strip()
+        role = row["role"].strip()
+
+        if not team_name or not player_name:
+            reason = "missing team or player name"
+        elif role not in VALID_ROLES:
+            reason = f"invalid role '{role}'"
+        elif role in team["players"]:
+            reason = f"role '{role}' already exists in team"
+        else:
+            team["players"][role] = player_name
+            team["rows"].append([team_name, player_name, role])
+            continue
+
+        team["rejects"].append([team_name, player_name, role, reason])
+
+
+def reject_team(team, reason):
+    team["rejects"].extend(row + [reason] for row in team["rows"])
+    team["players"], team["rows"] = {}, []
+
+
+class Checkpoint:
+    """
+    Number of source rows already committed, kept next to the input.
+    """
+
+    def __init__(self, path, input_csv):
+        self.path = path
+        self.input_csv = os.path.abspath(input_csv)
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return 0
+
+        if data.get("input") != self.input_csv:
+            raise CommandError(
+                f"Checkpoint {self.path} belongs to {data.get('input')}; delete it to start over"
+            )
+        return data["rows"]
+
+    def save(self, rows):
+        # Write-then-rename so a crash never leaves a torn checkpoint
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump({"input": self.input_csv, "rows": rows}, file)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CsvAppender:
+    """
+    CSV side file that survives resumes: truncated with a header on a
+    fresh run, appended to (and flushed per chunk) otherwise.
+    """
+
+    def __init__(self, path, header, fresh):
+        self.path = path
+        self.header = header
+        self.fresh = fresh
+
+    def __enter__(self):
+        self.file = open(self.path, "w" if self.fresh else "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        if self.fresh:
+            self.writer.writerow(self.header)
+        return self
+
+    def writerows(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+def read_csv(input_csv):
+    # ✅ utf-8-sig fixes Excel BOM issue
+    with open(input_csv, newline="", encoding="utf-8-sig") as file:
+        yield from csv.DictReader(file)
+
+
+def read_rows(input_csv):
+    """
+    Yield the import CSV's rows after checking its header.
+    """
+    # ✅ utf-8-sig fixes Excel BOM issue
+    with open(input_csv, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+
+        required_columns = {"team_name", "player_name", "role"}
+
+        if not reader.fieldnames:
+            raise Exception("CSV file is empty or missing header row")
+
+        if not required_columns.issubset(reader.fieldnames):
+            raise Exception(
+                f"CSV must contain columns {required_columns}, "
+                f"but found {reader.fieldnames}"
+            )
+
+        yield from reader
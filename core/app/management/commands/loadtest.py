@@ -0,0 +1,316 @@
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.leaderboard import rebuild as rebuild_leaderboard
+from app.management.commands.bench_views import wait_for_server
+from app.management.commands.generate_attempt_codes import CodeGenerator
+from app.models import Player, Score, Team, ZoneAttempt, ZoneAttemptAccess, ZoneContent
+
+
+TEAM_PREFIX = "LOADTEST "
+PASSWORD = "loadtest-pass"
+
+
+# -------------------------
+# FIXTURES
+# -------------------------
+def delete_load_teams():
+    teams = Team.objects.filter(name__startswith=TEAM_PREFIX)
+    user_ids = list(teams.values_list("user_id", flat=True))
+    with transaction.atomic():
+        # ZoneAttempt.player is PROTECT: clear attempts before the teams
+        ZoneAttempt.objects.filter(team__in=teams).delete()
+        teams.delete()
+        User.objects.filter(id__in=user_ids).delete()
+        rebuild_leaderboard()
+
+
+@transaction.atomic
+def create_load_teams(count):
+    """
+    N teams with one player per role and an unused code for every zone
+    that has content. Returns [(username, [(code, zone_id, exit_code)])].
+    """
+    contents = {}
+    for content in ZoneContent.objects.order_by("zone_id", "role"):
+        contents.setdefault(content.zone_id, content)   # one playable role per zone
+    if not contents:
+        raise CommandError("No ZoneContent found: add zones/content first.")
+
+    # Same password for every load-test user: hash it once
+    hashed = make_password(PASSWORD)
+    names = [f"{TEAM_PREFIX}{i:04d}" for i in range(count)]
+    usernames = {name: f"loadtest_{i:04d}" for i, name in enumerate(names)}
+
+    User.objects.bulk_create([User(username=u, password=hashed) for u in usernames.values()])
+    user_ids = dict(User.objects.filter(username__in=usernames.values()).values_list("username", "id"))
+
+    Team.objects.bulk_create([Team(name=name, user_id=user_ids[usernames[name]]) for name in names])
+    teams = list(Team.objects.filter(name__in=names).order_by("name"))
+
+    Player.objects.bulk_create([
+        Player(name=f"{team.name} {role}", role=role, team=team)
+        for team in teams
+        for role, _ in Player.ROLE_CHOICES
+    ])
+    Score.objects.bulk_create([Score(team=team) for team in teams])
+
+    players = {
+        (p.team_id, p.role): p
+        for p in Player.objects.filter(team__in=teams)
+    }
+    next_code = CodeGenerator()
+    plan, codes = [], []
+    for team in teams:
+        steps = []
+        for zone_id, content in contents.items():
+            code = next_code()
+            codes.append(ZoneAttemptAccess(
+                zone_id=zone_id,
+                team=team,
+                player=players[(team.id, content.role)],
+                attempt_code=code,
+            ))
+            steps.append((code, zone_id, content.exit_code or ""))
+        plan.append((usernames[team.name], steps))
+
+    ZoneAttemptAccess.objects.bulk_create(codes)
+    rebuild_leaderboard()
+    return plan
+
+
+# -------------------------
+# HTTP CLIENT
+# -------------------------
+class Session:
+    """
+    One browser: keep-alive connection + cookie jar. Redirects are
+    recorded, not followed.
+    """
+
+    def __init__(self, host, port, recorder):
+        self.host, self.port = host, port
+        self.recorder = recorder
+        self.cookies = {}
+        self.conn = None
+
+    def request(self, label, method, path, data=None, headers=None, expect=(200, 302, 304)):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["X-CSRFToken"] = self.cookies.get(settings.CSRF_COOKIE_NAME, "")
+
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            self.recorder.record(label, (time.perf_counter() - start) * 1000, error=True)
+            return None
+
+        elapsed = (time.perf_counter() - start) * 1000
+        for header in response.headers.get_all("Set-Cookie") or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+
+        queries = response.headers.get("X-DB-Queries")
+        self.recorder.record(
+            label,
+            elapsed,
+            error=response.status not in expect,
+            locked=response.headers.get("X-DB-Locked") == "1" or b"database is locked" in payload,
+            queries=int(queries) if queries is not None else None,
+        )
+        return response
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.queries = defaultdict(list)
+
+    def record(self, label, ms, error=False, locked=False, queries=None):
+        with self._lock:
+            self.latencies[label].append(ms)
+            self.errors[label] += error
+            self.locked[label] += locked
+            if queries is not None:
+                self.queries[label].append(queries)
+
+
+# -------------------------
+# SIMULATED CLIENTS
+# -------------------------
+def play_team(host, port, recorder, username, steps, think):
+    """
+    One team's round: log in, then for each zone enter the code, open
+    the zone and submit the exit code, reloading /zones/ in between.
+    """
+    session = Session(host, port, recorder)
+    try:
+        session.request("login (GET)", "GET", "/login/")
+        session.request("team_login", "POST", "/login/", {"username": username, "password": PASSWORD})
+        session.request("zones_view", "GET", "/zones/")
+
+        for code, zone_id, exit_code in steps:
+            time.sleep(think)
+            session.request("enter_zone", "POST", "/enter_zone/", {"attempt_code": code})
+            session.request("zone_play", "GET", f"/zone/{zone_id}/play/")
+            time.sleep(think)
+            session.request("submit_zone", "POST", f"/zone/{zone_id}/submit/", {"exit_code": exit_code})
+            session.request("zones_view", "GET", "/zones/")
+
+        session.request("logout", "GET", "/logout/")
+    finally:
+        session.close()
+
+
+def poll_leaderboard(host, port, recorder, interval, stop):
+    """
+    Anonymous leaderboard page: conditional delta polls like the JS does.
+    """
+    session = Session(host, port, recorder)
+    version, etag = None, None
+    try:
+        while not stop.is_set():
+            path = "/leaderboard/data/" + (f"?since={version}" if version is not None else "")
+            headers = {"If-None-Match": etag} if etag else {}
+            response = session.request("leaderboard_data_api", "GET", path, headers=headers)
+            if response is not None and response.status == 200:
+                etag = response.headers.get("ETag")
+                try:
+                    version = int(response.headers.get("ETag", "").strip('"').split("-")[1])
+                except (IndexError, ValueError):
+                    version = None
+            stop.wait(interval)
+    finally:
+        session.close()
+
+
+def percentile(values, pct):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[pct - 1]
+
+
+class Command(BaseCommand):
+    help = "Simulate a CTF round (N teams playing + M leaderboard pollers) and report capacity"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--teams", type=int, default=20)
+        parser.add_argument("--pollers", type=int, default=20)
+        parser.add_argument("--poll-interval", type=float, default=3.0, help="Seconds between polls")
+        parser.add_argument("--think", type=float, default=0.0, help="Seconds a team pauses between actions")
+        parser.add_argument("--url", help="Test a running server instead of starting uvicorn")
+        parser.add_argument("--port", type=int, default=8200)
+        parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+        parser.add_argument("--keep", action="store_true", help="Keep the LOADTEST teams afterwards")
+
+    def handle(self, *args, **options):
+        delete_load_teams()
+        plan = create_load_teams(options["teams"])
+        self.stdout.write(f"Created {len(plan)} teams x {len(plan[0][1])} zones")
+
+        server = None
+        if options["url"]:
+            url = urllib.parse.urlsplit(options["url"])
+            host, port = url.hostname, url.port or 80
+        else:
+            host, port = "127.0.0.1", options["port"]
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "core.asgi:application",
+                 "--port", str(port), "--workers", str(options["workers"]), "--log-level", "warning"],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "PORTAL_DEBUG_HEADERS": "1"},
+                # Tracebacks for failed requests only with -v 2
+                stderr=None if options["verbosity"] > 1 else subprocess.DEVNULL,
+            )
+
+        recorder = Recorder()
+        try:
+            if server:
+                wait_for_server(port)
+
+            stop = threading.Event()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["teams"] + options["pollers"]) as pool:
+                pollers = [
+                    pool.submit(poll_leaderboard, host, port, recorder, options["poll_interval"], stop)
+                    for _ in range(options["pollers"])
+                ]
+                teams = [
+                    pool.submit(play_team, host, port, recorder, username, steps, options["think"])
+                    for username, steps in plan
+                ]
+                for future in teams:
+                    future.result()
+                elapsed = time.perf_counter() - started
+                stop.set()
+                for future in pollers:
+                    future.result()
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+            if not options["keep"]:
+                delete_load_teams()
+
+        self.report(recorder, elapsed)
+
+    def report(self, recorder, elapsed):
+        total = sum(len(v) for v in recorder.latencies.values())
+        self.stdout.write(
+            f"{'endpoint':<22}{'count':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'err %':>7}{'lock %':>8}{'q/req':>7}"
+        )
+        for label, latencies in sorted(recorder.latencies.items()):
+            count = len(latencies)
+            queries = recorder.queries.get(label)
+            self.stdout.write(
+                f"{label:<22}{count:>7}{count / elapsed:>8.1f}"
+                f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}"
+                f"{percentile(latencies, 99):>9.1f}"
+                f"{100 * recorder.errors[label] / count:>7.1f}"
+                f"{100 * recorder.locked[label] / count:>8.1f}"
+                + (f"{statistics.mean(queries):>7.1f}" if queries else f"{'-':>7}")
+            )
+
+        errors = sum(recorder.errors.values())
+        locked = sum(recorder.locked.values())
+        summary = (
+            f"{total} requests in {elapsed:.1f}s = {total / elapsed:.1f} req/s, "
+            f"{errors} errors, {locked} 'database is locked'"
+        )
+        self.stdout.write(self.style.ERROR(summary) if errors else self.style.SUCCESS(summary))
@@ -5,6 +5,7 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
+from app.leaderboard import rebuild as rebuild_leaderboard, rebuild_timeline
 from app.models import (
     Team,
     Player,
@@ -56,9 +57,7 @@ class Command(BaseCommand):
             score, _ = Score.objects.get_or_create(team=team)
 
             # Reset scores
-            for i in range(1, 7):
-                setattr(score, f"zone{i}", 0)
-            score.save()
+            points = {zone.id: 0 for zone in zones}
 
             # Clear old attempts + access codes
             ZoneAttempt.objects.filter(team=team).delete()
@@ -95,15 +94,21 @@ class Command(BaseCommand):
                         access=access,
                         entry_time=entry_time,
                         exit_time=exit_time,
+                        duration_seconds=duration_minutes * 60,
                         status="COMPLETED"
                     )
 
                     # Assign realistic points
                     zone_points = random.choice([100, 200, 300, 400, 500])
-                    setattr(score, f"zone{zone.id}", zone_points)
+                    points[zone.id] = zone_points
 
                     current_time = exit_time
 
-            score.save()
+            score.set_zone_points(points)
+
+        # Attempts above were inserted as COMPLETED directly (no end_attempt),
+        # so recompute the materialized leaderboard times in one pass.
+        rebuild_leaderboard()
+        rebuild_timeline()
 
         self.stdout.write(self.style.SUCCESS("Gameplay data generated successfully!"))
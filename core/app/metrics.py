@@ -0,0 +1,375 @@
+"""
+In-process request metrics, exported in Prometheus text format at /metrics/.
+
+Each worker process counts into plain dicts under one short lock per
+request. A daemon thread writes the process's snapshot to
+PORTAL_METRICS_DIR every FLUSH_SECONDS; /metrics sums the snapshots of
+every worker, so the numbers cover the whole server, not just the
+process that answered the scrape.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Count
+from django.template.backends.django import DjangoTemplates, Template
+from django.template.backends.jinja2 import Jinja2, Template as Jinja2Template
+from django.utils import timezone
+
+
+# -------------------------
+# CONFIG
+# -------------------------
+FLUSH_SECONDS = 5
+STALE_SECONDS = 120          # gauges from workers silent this long are dropped
+RETENTION_SECONDS = 24 * 3600  # snapshots of long-gone workers are deleted
+POLL_WINDOW_SECONDS = 60     # a leaderboard poller counts as active this long
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "portal_requests_total": ("counter", "Requests by URL name, method and status"),
+    "portal_request_duration_seconds": ("histogram", "Request latency by URL name"),
+    "portal_db_queries_total": ("counter", "Database queries by URL name"),
+    "portal_db_query_seconds_total": ("counter", "Time spent in database queries by URL name"),
+    "portal_db_locked_total": ("counter", "Requests that failed with 'database is locked'"),
+    "portal_db_lock_retries_total": ("counter", "Write transactions retried after 'database is locked'"),
+    "portal_template_renders_total": ("counter", "Template renders by URL name"),
+    "portal_template_render_seconds_total": ("counter", "Template render time by URL name"),
+    "portal_sse_clients": ("gauge", "Connected leaderboard event-stream clients"),
+    "portal_leaderboard_pollers": ("gauge", f"Distinct leaderboard pollers in the last {POLL_WINDOW_SECONDS}s"),
+    "portal_zone_attempts": ("gauge", "Zone attempts by status"),
+    "portal_team_sessions": ("gauge", "Tracked TeamSession rows"),
+    "portal_team_sessions_live": ("gauge", "TeamSessions seen in the last 5 minutes"),
+}
+
+
+# -------------------------
+# PER-REQUEST DB / TEMPLATE COUNTERS
+# -------------------------
+# A context variable rather than connection.execute_wrapper() in the
+# middleware: async views run their ORM calls on executor threads with
+# their own connections, and asgiref copies the context into them.
+_request_stats = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "templates", "template_seconds", "locked")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.templates = 0
+        self.template_seconds = 0.0
+        self.locked = False
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def current_stats():
+    return _request_stats.get()
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def is_lock_error(exception):
+    return isinstance(exception, OperationalError) and "locked" in str(exception)
+
+
+class TimedRender:
+    def render(self, context=None, request=None):
+        stats = _request_stats.get()
+        if stats is None:
+            return super().render(context, request)
+
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.templates += 1
+            stats.template_seconds += time.perf_counter() - start
+
+
+class TimedTemplate(TimedRender, Template):
+    pass
+
+
+class TimedJinja2Template(TimedRender, Jinja2Template):
+    pass
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates backend that adds render time to the current
+    request's stats (TEMPLATES BACKEND = "app.metrics.TimedDjangoTemplates").
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class TimedJinja2(Jinja2):
+    """
+    The same for the Jinja2 backend (app/jinja2/ templates).
+    """
+
+    def from_string(self, template_code):
+        return TimedJinja2Template(self.env.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedJinja2Template(template.template, self)
+
+
+# -------------------------
+# REGISTRY (one per process)
+# -------------------------
+def _key(name, **labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)   # (name, labels) -> value
+        self._histograms = {}                 # (name, labels) -> [per-bucket..., +Inf, sum]
+        self._pollers = {}                    # client digest -> last seen
+        self._flusher_pid = None
+
+    def record_request(self, view, method, status, seconds, stats, poller=None):
+        view_labels = {"view": view}
+        histogram = _key("portal_request_duration_seconds", **view_labels)
+        bucket = next((i for i, le in enumerate(LATENCY_BUCKETS) if seconds <= le), len(LATENCY_BUCKETS))
+
+        with self._lock:
+            counters = self._counters
+            counters[_key("portal_requests_total", view=view, method=method, status=str(status))] += 1
+            counters[_key("portal_db_queries_total", **view_labels)] += stats.queries
+            counters[_key("portal_db_query_seconds_total", **view_labels)] += stats.db_seconds
+            if stats.templates:
+                counters[_key("portal_template_renders_total", **view_labels)] += stats.templates
+                counters[_key("portal_template_render_seconds_total", **view_labels)] += stats.template_seconds
+            if stats.locked:
+                counters[_key("portal_db_locked_total", **view_labels)] += 1
+
+            values = self._histograms.get(histogram)
+            if values is None:
+                values = self._histograms[histogram] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            values[bucket] += 1
+            values[-1] += seconds
+
+            if poller:
+                self._pollers[poller] = time.time()
+
+        self._ensure_flusher()
+
+    def increment(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[_key(name, **labels)] += value
+        self._ensure_flusher()
+
+    # --- cross-process snapshots ---
+
+    def snapshot(self):
+        from .events import leaderboard_events
+
+        cutoff = time.time() - POLL_WINDOW_SECONDS
+        with self._lock:
+            self._pollers = {k: seen for k, seen in self._pollers.items() if seen >= cutoff}
+            return {
+                "written_at": time.time(),
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, labels, list(values)] for (name, labels), values in self._histograms.items()],
+                "sse_clients": leaderboard_events.client_count,
+                "pollers": list(self._pollers),
+            }
+
+    def flush(self):
+        directory = settings.PORTAL_METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(tmp, path)
+
+    def _ensure_flusher(self):
+        # Lazily, once per process (also after a fork)
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name="metrics-flush", daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+
+registry = Registry()
+
+
+def poller_key(request):
+    client = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.blake2b(client.encode(), digest_size=8).hexdigest()
+
+
+# -------------------------
+# EXPORT
+# -------------------------
+def collect():
+    """
+    Sum every worker's latest snapshot (this process's is rewritten first).
+    """
+    registry.flush()
+
+    counters = defaultdict(float)
+    histograms = {}
+    sse_clients = 0
+    pollers = set()
+    now = time.time()
+
+    directory = settings.PORTAL_METRICS_DIR
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+
+        if now - snapshot["written_at"] > RETENTION_SECONDS:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+            continue
+
+        for metric, labels, value in snapshot["counters"]:
+            counters[(metric, tuple(map(tuple, labels)))] += value
+        for metric, labels, values in snapshot["histograms"]:
+            key = (metric, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+
+        # Counters of exited workers still count; their gauges don't
+        if now - snapshot["written_at"] <= STALE_SECONDS:
+            sse_clients += snapshot["sse_clients"]
+            pollers.update(snapshot["pollers"])
+
+    gauges = {
+        _key("portal_sse_clients"): sse_clients,
+        _key("portal_leaderboard_pollers"): len(pollers),
+    }
+    gauges.update(game_gauges())
+    return counters, histograms, gauges
+
+
+def game_gauges():
+    from .models import TeamSession, ZoneAttempt
+
+    gauges = {
+        _key("portal_zone_attempts", status=status): 0
+        for status, _ in ZoneAttempt.STATUS_CHOICES
+    }
+    counts = ZoneAttempt.objects.order_by().values("status").annotate(n=Count("id"))
+    for row in counts:
+        gauges[_key("portal_zone_attempts", status=row["status"])] = row["n"]
+
+    live_cutoff = timezone.now() - timedelta(minutes=5)
+    gauges[_key("portal_team_sessions")] = TeamSession.objects.count()
+    gauges[_key("portal_team_sessions_live")] = TeamSession.objects.filter(last_seen_at__gte=live_cutoff).count()
+    return gauges
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    counters, histograms, gauges = collect()
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), value in gauges.items():
+        by_name[name].append((labels, value))
+
+    lines = []
+    for name in sorted(set(by_name) | {name for name, _ in histograms}):
+        kind, text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if kind == "histogram":
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for le, count in zip(LATENCY_BUCKETS + (math.inf,), values[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=_number(float(le)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(values[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            continue
+
+        for labels, value in sorted(by_name[name]):
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    return "\n".join(lines) + "\n"
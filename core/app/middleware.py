@@ -1,16 +1,79 @@
-from django.utils import timezone
-from .models import TeamSession
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+
+# -------------------------
+# REQUEST METRICS
+# -------------------------
+class MetricsMiddleware:
+    """
+    Records per-URL-name request counts, latency, DB queries/time and
+    template time into app.metrics (exported at /metrics/).
+
+    With PORTAL_DEBUG_HEADERS on, also adds X-DB-Queries, X-DB-Time-Ms
+    and X-DB-Locked response headers for the loadtest command.
+    """
+
+    sync_capable = True
+    async_capable = True
 
-class TeamSessionHeartbeatMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(metrics.install_query_counter, dispatch_uid="count_queries")
+        for connection in connections.all(initialized_only=True):
+            metrics.install_query_counter(connection=connection)
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        stats, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        stats, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, stats, started)
+
+    def process_exception(self, request, exception):
+        stats = metrics.current_stats()
+        if stats is not None and metrics.is_lock_error(exception):
+            stats.locked = True
+
+    def finish(self, request, response, stats, started):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unmatched"
 
-        if request.user.is_authenticated:
-            TeamSession.objects.filter(
-                session_key=request.session.session_key
-            ).update(last_seen_at=timezone.now())
+        metrics.registry.record_request(
+            view,
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            stats,
+            poller=metrics.poller_key(request) if view == "leaderboard_data_api" else None,
+        )
 
+        if settings.PORTAL_DEBUG_HEADERS:
+            response["X-DB-Queries"] = str(stats.queries)
+            response["X-DB-Time-Ms"] = f"{stats.db_seconds * 1000:.2f}"
+            if stats.locked:
+                response["X-DB-Locked"] = "1"
         return response
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_leaderboard(apps, schema_editor):
+    Score = apps.get_model("app", "Score")
+    ZoneAttempt = apps.get_model("app", "ZoneAttempt")
+    LeaderboardEntry = apps.get_model("app", "LeaderboardEntry")
+
+    times = {}
+    for attempt in ZoneAttempt.objects.filter(status="COMPLETED", exit_time__isnull=False):
+        seconds = int((attempt.exit_time - attempt.entry_time).total_seconds())
+        times[attempt.team_id] = times.get(attempt.team_id, 0) + seconds
+
+    entries = []
+    for score in Score.objects.all():
+        total = sum(getattr(score, f"zone{i}") for i in range(1, 7))
+        entries.append(LeaderboardEntry(
+            team_id=score.team_id,
+            total=total,
+            credit=score.credit,
+            total_time_seconds=times.get(score.team_id, 0),
+        ))
+
+    entries.sort(key=lambda e: (-e.total, -e.credit, e.team_id))
+    for position, entry in enumerate(entries, start=1):
+        entry.rank = position
+
+    LeaderboardEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_score_credit'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='score',
+            options={'verbose_name': 'Enter Scores', 'verbose_name_plural': 'Enter Scores'},
+        ),
+        migrations.AlterModelOptions(
+            name='zoneattemptaccess',
+            options={'verbose_name': 'Create Code', 'verbose_name_plural': 'Create Codes'},
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField(default=0)),
+                ('credit', models.IntegerField(default=0)),
+                ('total_time_seconds', models.IntegerField(default=0)),
+                ('rank', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to='app.team')),
+            ],
+            options={
+                'verbose_name': 'Leaderboard Entry',
+                'verbose_name_plural': 'Leaderboard',
+                'ordering': ('rank', 'team_id'),
+                'indexes': [models.Index(fields=['rank', 'team'], name='app_leaderb_rank_e2e16c_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
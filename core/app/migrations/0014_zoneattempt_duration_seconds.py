@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+def backfill_durations(apps, schema_editor):
+    ZoneAttempt = apps.get_model("app", "ZoneAttempt")
+    LeaderboardEntry = apps.get_model("app", "LeaderboardEntry")
+
+    attempts = list(ZoneAttempt.objects.filter(exit_time__isnull=False))
+    for attempt in attempts:
+        attempt.duration_seconds = int((attempt.exit_time - attempt.entry_time).total_seconds())
+    ZoneAttempt.objects.bulk_update(attempts, ["duration_seconds"])
+
+    # Time is now a tie-break: re-rank with RANK() semantics
+    entries = sorted(
+        LeaderboardEntry.objects.all(),
+        key=lambda e: (-e.total, -e.credit, e.total_time_seconds),
+    )
+    previous_key, rank = None, 0
+    for position, entry in enumerate(entries, start=1):
+        key = (entry.total, entry.credit, entry.total_time_seconds)
+        if key != previous_key:
+            rank, previous_key = position, key
+        entry.rank = rank
+    LeaderboardEntry.objects.bulk_update(entries, ["rank"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zoneattempt',
+            name='duration_seconds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='zoneattempt',
+            index=models.Index(fields=['team', 'status'], name='app_zoneatt_team_id_6003eb_idx'),
+        ),
+        migrations.RunPython(backfill_durations, migrations.RunPython.noop),
+    ]
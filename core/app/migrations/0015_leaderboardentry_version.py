@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_zoneattempt_duration_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='version',
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_score_events(apps, schema_editor):
+    # Seed history the way the old graph drew it: one point per
+    # COMPLETED attempt, valued at the team's current zone points.
+    Score = apps.get_model("app", "Score")
+    ZoneAttempt = apps.get_model("app", "ZoneAttempt")
+    ScoreEvent = apps.get_model("app", "ScoreEvent")
+
+    scores = {score.team_id: score for score in Score.objects.all()}
+    attempts = (
+        ZoneAttempt.objects
+        .filter(status="COMPLETED", exit_time__isnull=False)
+        .order_by("exit_time")
+    )
+
+    totals = {}
+    events = []
+    for attempt in attempts:
+        score = scores.get(attempt.team_id)
+        if score is None:
+            continue
+
+        points = getattr(score, f"zone{attempt.zone_id}", 0)
+        totals[attempt.team_id] = totals.get(attempt.team_id, 0) + points
+        events.append(ScoreEvent(
+            team_id=attempt.team_id,
+            total=totals[attempt.team_id],
+            delta=points,
+            created_at=attempt.exit_time,
+        ))
+
+    ScoreEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_leaderboardentry_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField()),
+                ('delta', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_events', to='app.team')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['team', 'created_at'], name='app_scoreev_team_id_ca2ba2_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_score_events, migrations.RunPython.noop),
+    ]
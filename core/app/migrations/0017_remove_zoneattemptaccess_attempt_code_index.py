@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_scoreevent'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='zoneattemptaccess',
+            name='app_zoneatt_attempt_9aab60_idx',
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+ZONE_COLUMNS = ("zone1", "zone2", "zone3", "zone4", "zone5", "zone6")
+
+
+def copy_zone_columns(apps, schema_editor):
+    # zoneN held the points of the zone with id N
+    Score = apps.get_model("app", "Score")
+    Zone = apps.get_model("app", "Zone")
+    ZoneScore = apps.get_model("app", "ZoneScore")
+
+    zone_ids = set(Zone.objects.values_list("id", flat=True))
+    rows = []
+    for score in Score.objects.all():
+        for zone_id, column in enumerate(ZONE_COLUMNS, start=1):
+            points = getattr(score, column)
+            if points and zone_id in zone_ids:
+                rows.append(ZoneScore(team_id=score.team_id, zone_id=zone_id, points=points))
+    ZoneScore.objects.bulk_create(rows, batch_size=1000)
+
+    totals = {}
+    for row in rows:
+        totals[row.team_id] = totals.get(row.team_id, 0) + row.points
+    for team_id, total in totals.items():
+        Score.objects.filter(team_id=team_id).update(total=total)
+
+
+def copy_back_to_columns(apps, schema_editor):
+    Score = apps.get_model("app", "Score")
+    ZoneScore = apps.get_model("app", "ZoneScore")
+
+    for row in ZoneScore.objects.filter(zone_id__lte=len(ZONE_COLUMNS)):
+        Score.objects.filter(team_id=row.team_id).update(**{ZONE_COLUMNS[row.zone_id - 1]: row.points})
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_remove_zoneattemptaccess_attempt_code_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZoneScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='zonescore',
+            name='team',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zone_scores', to='app.team'),
+        ),
+        migrations.AddField(
+            model_name='zonescore',
+            name='zone',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='app.zone'),
+        ),
+        migrations.AddConstraint(
+            model_name='zonescore',
+            constraint=models.UniqueConstraint(fields=('team', 'zone'), name='unique_zone_score'),
+        ),
+        migrations.AddField(
+            model_name='score',
+            name='total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(copy_zone_columns, copy_back_to_columns),
+        migrations.RemoveField(
+            model_name='score',
+            name='zone1',
+        ),
+        migrations.RemoveField(
+            model_name='score',
+            name='zone2',
+        ),
+        migrations.RemoveField(
+            model_name='score',
+            name='zone3',
+        ),
+        migrations.RemoveField(
+            model_name='score',
+            name='zone4',
+        ),
+        migrations.RemoveField(
+            model_name='score',
+            name='zone5',
+        ),
+        migrations.RemoveField(
+            model_name='score',
+            name='zone6',
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(models.OrderBy(models.F('total'), descending=True), models.OrderBy(models.F('credit'), descending=True), models.OrderBy(models.F('total_time_seconds')), name='leaderboard_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(models.OrderBy(models.F('total'), descending=True), models.OrderBy(models.F('credit'), descending=True), name='score_ranking_idx'),
+        ),
+    ]
@@ -1,9 +1,15 @@
-from django.db import models
+from django.db import connection, connections, models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, DenseRank, Rank
 from django.contrib.auth.models import User
+import hashlib
 import uuid
 from django.conf import settings
 from django.utils import timezone
 from django.core.validators import MinValueValidator
+
+from .content import render_content
+from .db import retry_on_lock, supports_update_returning
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -88,8 +94,8 @@ class ZoneAttemptAccess(models.Model):
 
     class Meta:
         unique_together = ("player", "zone")
+        # attempt_code is already indexed by its unique constraint
         indexes = [
-            models.Index(fields=["attempt_code"]),
             models.Index(fields=["zone"]),
         ]
         verbose_name = "Create Code"
@@ -98,10 +104,119 @@ class ZoneAttemptAccess(models.Model):
     def __str__(self):
         return f"{self.team.name} - {self.zone.title} - {self.player.role}"
 
+    @classmethod
+    def claim(cls, attempt_code):
+        """
+        Burn an unused code with one conditional UPDATE.
+
+        Returns the claimed access (ids only, nothing else loaded), or
+        None if the code is unknown or already used. Concurrent claims of
+        the same code can't both match `is_used = false`, so exactly one
+        caller wins. Call inside a transaction so a failed attempt insert
+        un-burns the code.
+        """
+        fields = ("id", "zone_id", "team_id", "player_id")
+
+        if supports_update_returning(connection):
+            # UPDATE ... RETURNING: claim and read back in one round trip
+            qn = connection.ops.quote_name
+            sql = (
+                f"UPDATE {qn(cls._meta.db_table)} SET {qn('is_used')} = %s "
+                f"WHERE {qn('attempt_code')} = %s AND {qn('is_used')} = %s "
+                f"RETURNING {', '.join(qn(f) for f in fields)}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [True, attempt_code, False])
+                row = cursor.fetchone()
+        else:
+            claimed = cls.objects.filter(attempt_code=attempt_code, is_used=False).update(is_used=True)
+            row = (
+                cls.objects.filter(attempt_code=attempt_code).values_list(*fields).first()
+                if claimed else None
+            )
+
+        if row is None:
+            return None
+        return cls(**dict(zip(fields, row)), attempt_code=attempt_code, is_used=True)
+
 
 # -------------------------
 # ZONE ATTEMPT (actual gameplay state)
 # -------------------------
+class ZoneAttemptQuerySet(models.QuerySet):
+    def end_attempts(self, status):
+        """
+        End every ACTIVE attempt in this queryset with one conditional
+        UPDATE (duration_seconds computed per row in SQL) and return the
+        ended attempts' ids.
+
+        Like update(), this skips save() and its signals: team state is
+        invalidated and, for COMPLETED, leaderboard time added here, once
+        for the whole batch.
+        """
+        from . import leaderboard, team_state
+        exit_time = timezone.now()
+
+        @retry_on_lock
+        def write():
+            with transaction.atomic(using=self.db):
+                rows = self._end_active(status, exit_time)
+                if rows:
+                    durations = {}
+                    for _, team_id, duration_seconds in rows:
+                        durations[team_id] = durations.get(team_id, 0) + duration_seconds
+                    if status == "COMPLETED":
+                        leaderboard.apply_completed_attempts(durations)
+                    team_state.invalidate_on_commit(*durations)
+                return [attempt_id for attempt_id, _, _ in rows]
+
+        return write()
+
+    def _end_active(self, status, exit_time):
+        # -> [(id, team_id, duration_seconds)] for the rows this call ended
+        model = self.model
+        active = self.order_by().filter(status="ACTIVE")
+        connection = connections[self.db]
+
+        if supports_update_returning(connection):
+            # UPDATE ... RETURNING; the WHERE re-checks status, so attempts
+            # ended concurrently are neither ended twice nor returned
+            qn = connection.ops.quote_name
+            table, entry_time = qn(model._meta.db_table), qn("entry_time")
+            if connection.vendor == "sqlite":
+                # Django's SQLite function: difference in microseconds
+                duration = f"django_timestamp_diff(%s, {entry_time}) / 1000000"
+            else:
+                duration = f"FLOOR(EXTRACT(EPOCH FROM (%s - {entry_time})))::integer"
+            exit_param = connection.ops.adapt_datetimefield_value(exit_time)
+            subquery, subquery_params = active.values("pk").query.get_compiler(self.db).as_sql()
+            sql = (
+                f"UPDATE {table} SET {qn('status')} = %s, {qn('exit_time')} = %s, "
+                f"{qn('duration_seconds')} = {duration} "
+                f"WHERE {qn('status')} = %s AND {qn('id')} IN ({subquery}) "
+                f"RETURNING {qn('id')}, {qn('team_id')}, {qn('duration_seconds')}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [status, exit_param, exit_param, "ACTIVE", *subquery_params])
+                return cursor.fetchall()
+
+        rows = list(active.select_for_update().values_list("id", "team_id", "entry_time"))
+        if not rows:
+            return []
+        durations = {
+            attempt_id: int((exit_time - entry_time).total_seconds())
+            for attempt_id, _, entry_time in rows
+        }
+        model.objects.using(self.db).filter(pk__in=durations, status="ACTIVE").update(
+            status=status,
+            exit_time=exit_time,
+            duration_seconds=Case(
+                *[When(pk=attempt_id, then=Value(seconds)) for attempt_id, seconds in durations.items()]
+            ),
+        )
+        return [(attempt_id, team_id, durations[attempt_id]) for attempt_id, team_id, _ in rows]
+
+
 class ZoneAttempt(models.Model):
     STATUS_CHOICES = [
         ("ACTIVE", "Active"),
@@ -123,22 +238,66 @@ class ZoneAttempt(models.Model):
     exit_time = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ACTIVE")
 
+    # Persisted (exit_time - entry_time) so rankings can SUM it in SQL
+    duration_seconds = models.IntegerField(null=True, blank=True)
+
+    objects = ZoneAttemptQuerySet.as_manager()
+
     class Meta:
         unique_together = ("player", "zone")
         indexes = [
             models.Index(fields=["zone", "status"]),
             models.Index(fields=["player", "status"]),
+            models.Index(fields=["team", "status"]),
         ]
 
+    @classmethod
+    @retry_on_lock
+    def start(cls, attempt_code):
+        """
+        Redeem attempt_code and create the ACTIVE attempt in one short
+        transaction. Returns None for an invalid or used code; raises
+        IntegrityError (code left unused) if the player already
+        attempted this zone.
+        """
+        with transaction.atomic():
+            access = ZoneAttemptAccess.claim(attempt_code)
+            if access is None:
+                return None
+
+            return cls.objects.create(
+                team_id=access.team_id,
+                zone_id=access.zone_id,
+                player_id=access.player_id,
+                access=access,
+            )
+
     def end_attempt(self, status):
-        if self.status == "ACTIVE":
-            from django.utils import timezone
+        if self.status != "ACTIVE":
+            return
+
+        from .leaderboard import apply_completed_attempt
+        exit_time = timezone.now()
+        duration_seconds = int((exit_time - self.entry_time).total_seconds())
+
+        # Attempt row + leaderboard time in one transaction; the field
+        # values are re-applied on each try so a retry is idempotent.
+        @retry_on_lock
+        def write():
             self.status = status
-            self.exit_time = timezone.now()
-            self.save(update_fields=["status", "exit_time"])
+            self.exit_time = exit_time
+            self.duration_seconds = duration_seconds
+            with transaction.atomic():
+                self.save(update_fields=["status", "exit_time", "duration_seconds"])
+                if status == "COMPLETED":
+                    apply_completed_attempt(self)
+
+        write()
 
     @property
     def time_taken_seconds(self):
+        if self.duration_seconds is not None:
+            return self.duration_seconds
         if self.exit_time:
             return int((self.exit_time - self.entry_time).total_seconds())
         return None
@@ -158,7 +317,54 @@ class ZoneAttempt(models.Model):
 
 
 # -------------------------
-# SCORE (unchanged for now)
+# SCORE RANKING (single SQL query)
+# -------------------------
+class ScoreQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotates total_time_seconds (COMPLETED attempts only).
+        """
+        completed_time = (
+            ZoneAttempt.objects
+            .filter(team_id=OuterRef("team_id"), status="COMPLETED")
+            .order_by()
+            .values("team_id")
+            .annotate(seconds=Sum("duration_seconds"))
+            .values("seconds")
+        )
+
+        return self.annotate(
+            total_time_seconds=Coalesce(
+                Subquery(completed_time, output_field=models.IntegerField()), 0
+            ),
+        )
+
+    def ranked(self):
+        """
+        Leaderboard order with ties resolved by the database:
+        1. Total score (higher wins)
+        2. Credit (higher wins)
+        3. Time (lower wins)
+
+        rank uses RANK() (1, 1, 3), dense_rank uses DENSE_RANK() (1, 1, 2).
+        """
+        order = [
+            F("total").desc(),
+            F("credit").desc(),
+            F("total_time_seconds").asc(),
+        ]
+        return (
+            self.with_totals()
+            .annotate(
+                rank=Window(expression=Rank(), order_by=order),
+                dense_rank=Window(expression=DenseRank(), order_by=order),
+            )
+            .order_by(*order, "team_id")
+        )
+
+
+# -------------------------
+# SCORE (one row per team)
 # -------------------------
 class Score(models.Model):
     team = models.OneToOneField(
@@ -167,15 +373,15 @@ class Score(models.Model):
         related_name="score"
     )
 
+    objects = ScoreQuerySet.as_manager()
+
     # -------------------------
-    # ZONE SCORES
+    # TOTAL SCORE (does NOT include credit)
     # -------------------------
-    zone1 = models.IntegerField(default=0)
-    zone2 = models.IntegerField(default=0)
-    zone3 = models.IntegerField(default=0)
-    zone4 = models.IntegerField(default=0)
-    zone5 = models.IntegerField(default=0)
-    zone6 = models.IntegerField(default=0)
+    # Sum of this team's ZoneScore rows, kept up to date by
+    # recalculate_total() (ZoneScore signals) so ranking is an indexed
+    # ORDER BY instead of a per-row computation.
+    total = models.IntegerField(default=0, editable=False)
 
     # -------------------------
     # CREDITS (Standalone Resource)
@@ -186,19 +392,48 @@ class Score(models.Model):
         help_text="Standalone credits used for tie-breaking or advantages."
     )
 
-    # -------------------------
-    # TOTAL SCORE (does NOT include credit)
-    # -------------------------
-    @property
-    def total(self):
-        return (
-            self.zone1 +
-            self.zone2 +
-            self.zone3 +
-            self.zone4 +
-            self.zone5 +
-            self.zone6
+    @classmethod
+    def recalculate_total(cls, team_id):
+        """
+        Re-sum the team's zone points. Saving (rather than update()) keeps
+        the post_save leaderboard/cache hooks firing.
+        """
+        score, _ = cls.objects.get_or_create(team_id=team_id)
+        score.total = (
+            ZoneScore.objects
+            .filter(team_id=team_id)
+            .aggregate(total=Sum("points"))["total"]
+        ) or 0
+        score.save(update_fields=["total"])
+        return score
+
+    def zone_points(self):
+        """
+        {zone_id: points} for this team.
+        """
+        return dict(ZoneScore.objects.filter(team_id=self.team_id).values_list("zone_id", "points"))
+
+    @transaction.atomic
+    def set_zone_points(self, points, save=True):
+        """
+        Write {zone_id: points} in one upsert and re-sum the total once
+        (instead of one recalculation per ZoneScore save). With save=False
+        only self.total is updated; the caller saves the Score itself.
+        """
+        ZoneScore.objects.bulk_create(
+            [ZoneScore(team_id=self.team_id, zone_id=zone_id, points=value) for zone_id, value in points.items()],
+            update_conflicts=True,
+            unique_fields=["team", "zone"],
+            update_fields=["points"],
         )
+        if save:
+            self.total = Score.recalculate_total(self.team_id).total
+        else:
+            self.total = (
+                ZoneScore.objects
+                .filter(team_id=self.team_id)
+                .aggregate(total=Sum("points"))["total"]
+            ) or 0
 
     # -------------------------
     # TOTAL TIME (All completed zones)
@@ -207,16 +442,11 @@ class Score(models.Model):
         """
         Returns total time taken across all completed zone attempts.
         """
-        completed_attempts = self.team.zone_attempts.filter(
+        total_seconds = self.team.zone_attempts.filter(
             status="COMPLETED"
-        )
-
-        total_seconds = sum(
-            attempt.time_taken_seconds or 0
-            for attempt in completed_attempts
-        )
+        ).aggregate(total=Sum("duration_seconds"))["total"]
 
-        return total_seconds
+        return total_seconds or 0
 
     # -------------------------
     # DISPLAY TIME (Optional helper)
@@ -248,12 +478,50 @@ class Score(models.Model):
     class Meta:
         verbose_name = "Enter Scores"
         verbose_name_plural = "Enter Scores"
+        indexes = [
+            models.Index(F("total").desc(), F("credit").desc(), name="score_ranking_idx"),
+        ]
     def __str__(self):
         return f"{self.team.name} Score"
-    
+
+
+# -------------------------
+# ZONE SCORE (one row per team per scored zone)
+# -------------------------
+class ZoneScore(models.Model):
+    team = models.ForeignKey(
+        "Team",
+        on_delete=models.CASCADE,
+        related_name="zone_scores"
+    )
+    zone = models.ForeignKey(
+        Zone,
+        on_delete=models.CASCADE,
+        related_name="scores"
+    )
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["team", "zone"], name="unique_zone_score"),
+        ]
+
+    def __str__(self):
+        return f"{self.team.name} - {self.zone.title}: {self.points}"
+
+
 # -------------------------
 # ZONE CONTENT (ROLE-BASED)
 # -------------------------
+class ZoneContentQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create() skips save(): render here so html is never stale
+        objs = list(objs)
+        for obj in objs:
+            obj.render()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class ZoneContent(models.Model):
     zone = models.ForeignKey(
         Zone,
@@ -267,7 +535,7 @@ class ZoneContent(models.Model):
     )
 
     content = models.TextField(
-        help_text="HTML / Markdown / plain text rendered inside the zone"
+        help_text="HTML or plain text rendered inside the zone (sanitized on save)"
     )
 
     exit_code = models.CharField(
@@ -277,11 +545,112 @@ class ZoneContent(models.Model):
         help_text="Code required to exit/submit this zone"
     )
 
+    # Rendered from content on save (app/content.py); players only see these
+    html = models.TextField(editable=False, default="")
+    content_hash = models.CharField(max_length=64, editable=False, default="")
+    part_ends = models.JSONField(editable=False, default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ZoneContentQuerySet.as_manager()
+
     class Meta:
         unique_together = ("zone", "role")
         indexes = [
             models.Index(fields=["zone", "role"]),
         ]
 
+    def render(self):
+        self.html, self.part_ends = render_content(self.content)
+        self.content_hash = hashlib.sha256(self.html.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        # Re-render only when the source is written, e.g. not for
+        # save(update_fields=["exit_code"])
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.render()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "html", "content_hash", "part_ends"}
+        super().save(*args, **kwargs)
+
+    @property
+    def part_count(self):
+        return len(self.part_ends)
+
+    def part(self, index):
+        """
+        The index-th slice of html (whole elements only, see PART_CHARS).
+        """
+        if not 0 <= index < len(self.part_ends):
+            return ""
+        start = self.part_ends[index - 1] if index else 0
+        return self.html[start:self.part_ends[index]]
+
     def __str__(self):
         return f"{self.zone.title} - {self.role}"
+
+
+# -------------------------
+# LEADERBOARD (materialized ranking, one row per team)
+# -------------------------
+class LeaderboardEntry(models.Model):
+    """
+    Denormalized leaderboard row kept in sync by app.leaderboard.
+    Read this instead of recomputing Score totals per request.
+    """
+    team = models.OneToOneField(
+        "Team",
+        on_delete=models.CASCADE,
+        related_name="leaderboard_entry"
+    )
+
+    total = models.IntegerField(default=0)
+    credit = models.IntegerField(default=0)
+    total_time_seconds = models.IntegerField(default=0)
+    rank = models.PositiveIntegerField(default=0)
+    # Leaderboard version at which this row last changed (for ?since= deltas)
+    version = models.PositiveBigIntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("rank", "team_id")
+        indexes = [
+            models.Index(fields=["rank", "team"]),
+            # Ranking order: leaderboard.move_team() range scans, rerank()
+            models.Index(
+                F("total").desc(), F("credit").desc(), F("total_time_seconds").asc(),
+                name="leaderboard_ranking_idx",
+            ),
+        ]
+        verbose_name = "Leaderboard Entry"
+        verbose_name_plural = "Leaderboard"
+
+    def __str__(self):
+        return f"#{self.rank} {self.team.name}"
+
+
+# -------------------------
+# SCORE HISTORY (append-only timeline)
+# -------------------------
+class ScoreEvent(models.Model):
+    """
+    One point per score-affecting change: the team's total right after it.
+    Never updated in place; the timeline graph reads these by id range.
+    """
+    team = models.ForeignKey(
+        "Team",
+        on_delete=models.CASCADE,
+        related_name="score_events"
+    )
+
+    total = models.IntegerField()
+    delta = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["team", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.team.name} -> {self.total} ({self.delta:+})"
@@ -0,0 +1,45 @@
+"""
+Registration sheet -> importer rows.
+
+Plain Python (no Django imports) so the root normalize.py script can
+use it too. The registration CSV has one row per team with a column
+per role; the importer wants one (team_name, player_name, role) row
+per player.
+"""
+
+ROLE_MAPPING = {
+    "INTERN NAME": "INTERN",
+    "JUNIOR ANALYST NAME": "JUNIOR_ANALYST",
+    "TEAM LEAD NAME": "TEAM_LEADER",
+    "MANAGER NAME": "MANAGER",
+    "CEO NAME": "CEO",
+}
+
+FIELDNAMES = ["team_name", "player_name", "role"]
+
+
+def normalize_rows(rows):
+    """
+    Generator: yields importer rows for each registration row, so a
+    whole sheet never has to sit in memory or in an intermediate file.
+    """
+    for row in rows:
+        # Uppercase + strip keys and values
+        clean_row = {
+            k.strip().upper(): (v.strip().upper() if v else "")
+            for k, v in row.items()
+            if k
+        }
+
+        team_name = clean_row.get("TEAM NAME", "")
+        if not team_name:
+            continue
+
+        for column, role in ROLE_MAPPING.items():
+            player_name = clean_row.get(column, "")
+            if player_name:
+                yield {
+                    "team_name": team_name,
+                    "player_name": player_name,
+                    "role": role
+                }
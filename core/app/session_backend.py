@@ -0,0 +1,213 @@
+"""
+Portal session engine (SESSION_ENGINE = "app.session_backend").
+
+cached_db sessions that:
+- only hit the database when session data changes or the refresh
+  interval has elapsed (replaces SESSION_SAVE_EVERY_REQUEST), and
+- keep team logins' TeamSession rows in step with those saves, so no
+  separate per-request heartbeat is needed.
+"""
+import atexit
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.db import connection
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .db import retry_on_lock
+from .models import TeamSession
+from .team_state import team_id_for_user
+
+
+# -------------------------
+# CONFIG
+# -------------------------
+# Worst-case staleness of TeamSession.last_seen_at is
+# REFRESH + HEARTBEAT_FLUSH seconds; keep it well below SESSION_IDLE_MINUTES.
+SESSION_REFRESH_SECONDS = 60      # re-save (slide expiry, heartbeat) at most this often
+HEARTBEAT_FLUSH_SECONDS = 15      # write buffered heartbeats at least this often
+HEARTBEAT_FLUSH_SIZE = 200        # ...or as soon as this many are pending
+
+# A session silent for this long may have had its TeamSession row purged
+# by team_login's idle cleanup, so its next save re-creates the row.
+REATTACH_AFTER_SECONDS = 10 * 60
+
+REFRESHED_AT_KEY = "_portal_refreshed_at"
+ATTACHED_KEY = "_portal_attached"
+
+
+# -------------------------
+# HEARTBEAT BUFFER
+# -------------------------
+class HeartbeatBuffer:
+    """
+    Collects TeamSession heartbeats in memory and writes them as one
+    bulk UPDATE, instead of one UPDATE per session save.
+
+    A beat waits at most flush_every seconds: a timer thread flushes
+    what's pending even if no more traffic comes, and the process
+    flushes once more at exit.
+    """
+
+    def __init__(self, flush_every=HEARTBEAT_FLUSH_SECONDS, flush_size=HEARTBEAT_FLUSH_SIZE, timer=True):
+        self.flush_every = flush_every
+        self.flush_size = flush_size
+        self.timer = timer
+
+        self._lock = threading.Lock()
+        self._pending = {}   # session_key -> last_seen_at to write
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def record(self, session_key):
+        with self._lock:
+            self._pending[session_key] = timezone.now()
+            due = (
+                len(self._pending) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_every
+            )
+            if self.timer and not due and self._timer is None:
+                self._timer = threading.Timer(self.flush_every, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if due:
+            self.flush()
+
+    def forget(self, session_key):
+        with self._lock:
+            self._pending.pop(session_key, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+        try:
+            return self._write(pending)
+        except Exception:
+            # Keep the beats for the next flush (newer ones win)
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()   # this thread's own connection
+
+    @retry_on_lock
+    def _write(self, pending):
+        return TeamSession.objects.filter(session_key__in=pending).update(
+            last_seen_at=Case(
+                *[When(session_key=key, then=Value(seen)) for key, seen in pending.items()],
+                output_field=DateTimeField(),
+            )
+        )
+
+
+heartbeats = HeartbeatBuffer()
+atexit.register(heartbeats.flush)
+
+
+# -------------------------
+# TEAMSESSION ROWS
+# -------------------------
+def count_live_sessions(user_id, idle_minutes):
+    """
+    Purge this team's idle TeamSession rows and count its live ones.
+    Call inside the login transaction (see views.team_login): the DELETE
+    is its first write, which takes SQLite's write lock (IMMEDIATE does
+    it at BEGIN), and the user row lock serializes logins elsewhere, so
+    two logins can't both see the last free slot. Both statements use
+    the user_id index; other teams' idle rows go at their next login.
+    """
+    cutoff = timezone.now() - timedelta(minutes=idle_minutes)
+    TeamSession.objects.filter(user_id=user_id, last_seen_at__lt=cutoff).delete()
+    list(User.objects.select_for_update().filter(pk=user_id).values_list("pk"))
+    return TeamSession.objects.filter(user_id=user_id).count()
+
+
+@retry_on_lock
+def _attach(user_id, session_key):
+    TeamSession.objects.update_or_create(
+        session_key=session_key,
+        defaults={"user_id": user_id},
+    )
+
+
+def track_session(session, user_id, session_key):
+    """
+    Attach (create or refresh) the TeamSession row for a team login's
+    session, or just buffer a heartbeat if it was attached recently.
+    team_login calls it inside its transaction; session saves call it too.
+    """
+    # Only team logins are limited and tracked (not staff/admin)
+    if team_id_for_user(user_id) is None:
+        return
+
+    # (key, time) of this session's last attach, kept in the session
+    # itself: a new key (login cycles it) or a long silence re-attaches
+    now = int(time.time())
+    attached_key, attached_at = session.get(ATTACHED_KEY) or (None, 0)
+    if attached_key == session_key and now - attached_at < REATTACH_AFTER_SECONDS:
+        heartbeats.record(session_key)
+    else:
+        _attach(user_id, session_key)
+        session[ATTACHED_KEY] = (session_key, now)
+
+
+def _untrack(session_key):
+    heartbeats.forget(session_key)
+    TeamSession.objects.filter(session_key=session_key).delete()
+
+
+# -------------------------
+# SESSION STORE
+# -------------------------
+class SessionStore(CachedDBStore):
+    cache_key_prefix = "app.session_backend"
+
+    def _mark_refresh(self, data):
+        # Ask SessionMiddleware to save this response only when the
+        # refresh interval is up (slides expiry + heartbeats TeamSession).
+        if data and time.time() - data.get(REFRESHED_AT_KEY, 0) >= SESSION_REFRESH_SECONDS:
+            self.modified = True
+        return data
+
+    def load(self):
+        return self._mark_refresh(super().load())
+
+    async def aload(self):
+        return self._mark_refresh(await super().aload())
+
+    def save(self, must_create=False):
+        self._session[REFRESHED_AT_KEY] = int(time.time())
+        user_id = self._session.get(SESSION_KEY)
+        if user_id and self.session_key:
+            # Before the save, so the attach mark is stored with it
+            track_session(self._session, user_id, self.session_key)
+        super().save(must_create=must_create)
+
+    async def asave(self, must_create=False):
+        await sync_to_async(self.save)(must_create=must_create)
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key:
+            _untrack(key)
+
+    async def adelete(self, session_key=None):
+        await sync_to_async(self.delete)(session_key)
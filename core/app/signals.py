@@ -64,16 +64,11 @@ from .models import ZoneAttempt
 
 @receiver(user_logged_out)
 def end_active_attempt_on_logout(sender, request, user, **kwargs):
-    if not hasattr(user, "team"):
+    if user is None:
         return
 
-    attempts = ZoneAttempt.objects.filter(
-        team=user.team,
-        status="ACTIVE"
-    )
-
-    for attempt in attempts:
-        attempt.end_attempt(status="FORCED_EXIT")
+    # One UPDATE for all of the team's ACTIVE attempts (none for non-team users)
+    ZoneAttempt.objects.filter(team__user=user).end_attempts("FORCED_EXIT")
 
         
 from django.db.models.signals import post_save
@@ -83,4 +78,58 @@ from .models import Team, Score
 @receiver(post_save, sender=Team)
 def create_score_for_team(sender, instance, created, **kwargs):
     if created:
-        Score.objects.create(team=instance)
\ No newline at end of file
+        Score.objects.create(team=instance)
+
+@receiver(post_save, sender=Score)
+def update_leaderboard_on_score_save(sender, instance, **kwargs):
+    from .leaderboard import apply_score
+    apply_score(instance)
+
+
+from django.db.models.signals import post_delete
+from .models import Zone, ZoneContent
+
+@receiver(post_save, sender=Zone)
+@receiver(post_delete, sender=Zone)
+@receiver(post_save, sender=ZoneContent)
+@receiver(post_delete, sender=ZoneContent)
+def invalidate_zone_cache(sender, **kwargs):
+    from .zone_cache import invalidate_on_commit
+    invalidate_on_commit()
+
+
+from .models import ZoneAttemptAccess, ZoneScore
+
+@receiver(post_save, sender=ZoneScore)
+def update_total_on_zone_score_save(sender, instance, **kwargs):
+    Score.recalculate_total(instance.team_id)
+
+
+@receiver(post_delete, sender=ZoneScore)
+def update_total_on_zone_score_delete(sender, instance, origin=None, **kwargs):
+    # Cascades from a team/user delete: the Score row is going too
+    origin_model = getattr(origin, "model", type(origin))
+    if origin_model not in (ZoneScore, Zone):
+        return
+    Score.recalculate_total(instance.team_id)
+
+
+@receiver(post_save, sender=ZoneAttempt)
+@receiver(post_delete, sender=ZoneAttempt)
+@receiver(post_save, sender=ZoneAttemptAccess)
+@receiver(post_delete, sender=ZoneAttemptAccess)
+@receiver(post_save, sender=Score)
+@receiver(post_delete, sender=Score)
+@receiver(post_save, sender=ZoneScore)
+@receiver(post_delete, sender=ZoneScore)
+def invalidate_team_state(sender, instance, **kwargs):
+    from .team_state import invalidate_on_commit
+    invalidate_on_commit(instance.team_id)
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def forget_team_user(sender, instance, **kwargs):
+    from .team_state import forget_user
+    if instance.user_id:
+        forget_user(instance.user_id)
@@ -0,0 +1,156 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+
+from . import zone_cache
+from .models import Team, Zone, ZoneAttempt, ZoneAttemptAccess, ZoneScore
+
+
+# -------------------------
+# PER-TEAM ZONE STATE (zones page)
+# -------------------------
+# One small cached object per team, built by one query and dropped only
+# when that team's attempts, codes or score change (see signals.py).
+# The zone cache version is part of the key, so adding or editing zones
+# also rebuilds it.
+
+STATE_CACHE_KEY = "team_state:v1:{team_id}:{zones_version}"
+TEAM_CACHE_KEY = "team_of_user:{user_id}"
+STATE_CACHE_SECONDS = 6 * 3600   # safety net; normally invalidated explicitly
+
+
+class TeamState:
+    """
+    Bitmaps over zone ids (bit n = zone n) plus per-zone scores.
+    """
+
+    __slots__ = ("active", "completed", "access", "scores")
+
+    def __init__(self, rows):
+        self.active = self.completed = self.access = 0
+        self.scores = {}
+
+        for zone_id, active, completed, access, score in rows:
+            bit = 1 << zone_id
+            if active:
+                self.active |= bit
+            if completed:
+                self.completed |= bit
+            if access:
+                self.access |= bit
+            if score:
+                self.scores[zone_id] = score
+
+    def __getstate__(self):
+        return (self.active, self.completed, self.access, self.scores)
+
+    def __setstate__(self, state):
+        self.active, self.completed, self.access, self.scores = state
+
+    def apply(self, zones):
+        """
+        Sets has_active / has_completed / has_access / score / can_enter
+        on each zone. Shared by the sync and async zones views.
+        """
+        for zone in zones:
+            bit = 1 << zone.id
+
+            zone.has_active = bool(self.active & bit)
+            zone.has_completed = bool(self.completed & bit)
+            zone.has_access = bool(self.access & bit)
+            zone.score = self.scores.get(zone.id, 0)
+
+            # 🔐 ENTRY PERMISSION: an active attempt can always be resumed,
+            # otherwise an unused code is needed
+            zone.can_enter = zone.has_active or zone.has_access
+
+        return zones
+
+
+def _state_rows(team_id):
+    """
+    (zone_id, active, completed, access, score) per zone, in one query.
+    """
+    attempts = ZoneAttempt.objects.filter(team_id=team_id, zone=OuterRef("pk"))
+
+    return (
+        Zone.objects
+        .order_by("id")
+        .annotate(
+            active=Exists(attempts.filter(status="ACTIVE")),
+            completed=Exists(attempts.filter(status="COMPLETED")),
+            access=Exists(
+                ZoneAttemptAccess.objects.filter(team_id=team_id, zone=OuterRef("pk"), is_used=False)
+            ),
+            points=Subquery(
+                ZoneScore.objects.filter(team_id=team_id, zone=OuterRef("pk")).values("points")[:1]
+            ),
+        )
+        .values_list("id", "active", "completed", "access", "points")
+    )
+
+
+def _state_key(team_id):
+    return STATE_CACHE_KEY.format(team_id=team_id, zones_version=zone_cache.current_version())
+
+
+def get_team_state(team_id):
+    key = _state_key(team_id)
+    state = cache.get(key)
+    if state is None:
+        state = TeamState(_state_rows(team_id))
+        cache.set(key, state, STATE_CACHE_SECONDS)
+    return state
+
+
+async def aget_team_state(team_id):
+    key = _state_key(team_id)
+    state = await cache.aget(key)
+    if state is None:
+        state = TeamState([row async for row in _state_rows(team_id)])
+        await cache.aset(key, state, STATE_CACHE_SECONDS)
+    return state
+
+
+def invalidate(*team_ids):
+    """
+    Drop the cached state of these teams. Signals cover save()/delete();
+    bulk_create()/update() callers must call this themselves.
+    """
+    cache.delete_many([_state_key(team_id) for team_id in team_ids])
+
+
+def invalidate_on_commit(*team_ids):
+    transaction.on_commit(lambda: invalidate(*team_ids))
+
+
+# -------------------------
+# USER -> TEAM
+# -------------------------
+# A team's login user never changes in play, so the lookup behind
+# request.user.team is cached too (cleared on Team save/delete).
+
+# None for users without a team (staff); cached as NO_TEAM
+NO_TEAM = 0
+
+
+def team_id_for_user(user_id):
+    key = TEAM_CACHE_KEY.format(user_id=user_id)
+    team_id = cache.get(key)
+    if team_id is None:
+        team_id = Team.objects.filter(user_id=user_id).values_list("id", flat=True).first() or NO_TEAM
+        cache.set(key, team_id, None)
+    return team_id or None
+
+
+async def ateam_id_for_user(user_id):
+    key = TEAM_CACHE_KEY.format(user_id=user_id)
+    team_id = await cache.aget(key)
+    if team_id is None:
+        team_id = await Team.objects.filter(user_id=user_id).values_list("id", flat=True).afirst() or NO_TEAM
+        await cache.aset(key, team_id, None)
+    return team_id or None
+
+
+def forget_user(user_id):
+    cache.delete(TEAM_CACHE_KEY.format(user_id=user_id))
@@ -1,3 +1,1700 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.templatetags.static import static
+from django.db import OperationalError, connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+
+from core import settings as project_settings
+
+from . import leaderboard, metrics, views
+from .management.commands.generate_attempt_codes import CODE_ALPHABET, CODE_LENGTH, CodeGenerator, Command as GenerateCommand
+from .management.commands.import_teams_players import Command as ImportCommand, hash_passwords
+from .content import render_content
+from .db import retry_on_lock, supports_update_returning
+from .leaderboard import rebuild as rebuild_leaderboard, rebuild_timeline, rerank
+from .models import LeaderboardEntry, Player, Score, ScoreEvent, Team, TeamSession, Zone, ZoneAttempt, ZoneAttemptAccess, ZoneContent, ZoneScore
+from .session_backend import HeartbeatBuffer, SessionStore, heartbeats
+from .team_state import get_team_state
+from .zone_cache import get_zones
+
+# Sync twins of the hot views (what PORTAL_ASYNC_VIEWS=0 serves), for
+# @override_settings(ROOT_URLCONF=__name__)
+urlpatterns = [
+    path("zones/", views.zones_view, name="zones"),
+    path("zone/<int:zone_id>/play/", views.zone_play, name="zone_play"),
+    path("zone/<int:zone_id>/content/", views.zone_content_part, name="zone_content_part"),
+    path("zone/<int:zone_id>/files/<path:name>", views.zone_asset, name="zone_asset"),
+    path("leaderboard/", views.leaderboard_view, name="leaderboard"),
+    path("leaderboard/data/", views.leaderboard_data_api, name="leaderboard_data_api"),
+    path("leaderboard/me/", views.leaderboard_me_api, name="leaderboard_me_api"),
+    path("", include("app.urls")),
+    path("admin/", admin.site.urls),
+]
+
+
+def make_team(name, roles=("INTERN",)):
+    # User first: a Team without one would write to the credentials CSV
+    user = User.objects.create_user(username=name.lower(), password="x")
+    team = Team.objects.create(name=name, user=user)
+    players = [Player.objects.create(name=f"{name} {role}", role=role, team=team) for role in roles]
+    return team, players
+
+
+# -------------------------
+# ATTEMPT CODE REDEMPTION
+# -------------------------
+class AttemptCodeRedemptionTests(TestCase):
+    def setUp(self):
+        self.zone = Zone.objects.create(title="Zone 1")
+        self.team, (self.player,) = make_team("Alpha")
+        self.access = ZoneAttemptAccess.objects.create(
+            zone=self.zone, team=self.team, player=self.player, attempt_code="ALPHA-1"
+        )
+
+    def test_start_claims_code_and_creates_attempt(self):
+        attempt = ZoneAttempt.start("ALPHA-1")
+
+        self.assertEqual(attempt.status, "ACTIVE")
+        self.assertEqual(attempt.access_id, self.access.id)
+        self.access.refresh_from_db()
+        self.assertTrue(self.access.is_used)
+
+    def test_used_or_unknown_code_is_rejected(self):
+        ZoneAttempt.start("ALPHA-1")
+
+        self.assertIsNone(ZoneAttempt.start("ALPHA-1"))
+        self.assertIsNone(ZoneAttempt.start("NOPE"))
+        self.assertEqual(ZoneAttempt.objects.count(), 1)
+
+    def test_redemption_is_claim_plus_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            ZoneAttempt.start("ALPHA-1")
+
+        statements = [q["sql"].split()[0] for q in ctx.captured_queries]
+        statements = [s for s in statements if s not in ("SAVEPOINT", "RELEASE")]
+        self.assertEqual(statements, ["UPDATE", "INSERT"])
+
+    def test_enter_zone_view(self):
+        response = self.client.post("/enter_zone/", {"attempt_code": "ALPHA-1"})
+        self.assertRedirects(response, f"/zone/{self.zone.id}/play/", fetch_redirect_response=False)
+
+        response = self.client.post("/enter_zone/", {"attempt_code": "ALPHA-1"})
+        self.assertContains(response, "Invalid or already used attempt code")
+
+
+class AttemptCodeConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        zone = Zone.objects.create(title="Zone 1")
+        team, (player,) = make_team("Bravo")
+        ZoneAttemptAccess.objects.create(zone=zone, team=team, player=player, attempt_code="BRAVO-1")
+
+    def redeem(self, barrier, results):
+        try:
+            barrier.wait()
+            for _ in range(50):
+                try:
+                    results.append(ZoneAttempt.start("BRAVO-1"))
+                    return
+                except OperationalError:
+                    # SQLite table lock held by another claimer: retry
+                    time.sleep(0.01)
+            results.append("locked")
+        finally:
+            connection.close()
+
+    def test_exactly_one_winner_per_code(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        threads = [
+            threading.Thread(target=self.redeem, args=(barrier, results))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [r for r in results if isinstance(r, ZoneAttempt)]
+        self.assertNotIn("locked", results)
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(results.count(None), self.THREADS - 1)
+        self.assertEqual(ZoneAttempt.objects.count(), 1)
+        self.assertTrue(ZoneAttemptAccess.objects.get(attempt_code="BRAVO-1").is_used)
+
+
+# -------------------------
+# ATTEMPT CODE GENERATION
+# -------------------------
+class GenerateAttemptCodesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.zones = [Zone.objects.create(title=f"Zone {i}") for i in range(1, 3)]
+        self.teams = [make_team(name, roles=("INTERN", "MANAGER")) for name in ("Alpha", "Bravo")]
+
+        out = tempfile.TemporaryDirectory()
+        self.addCleanup(out.cleanup)
+        self.csv_path = os.path.join(out.name, "codes.csv")
+
+    def generate(self, *args):
+        call_command("generate_attempt_codes", "--output", self.csv_path, *args, stderr=io.StringIO())
+        with open(self.csv_path, newline="", encoding="utf-8") as file:
+            return list(csv.DictReader(file))
+
+    def test_codes_are_unique_and_exported(self):
+        (alpha, alpha_players), _ = self.teams
+        ZoneAttemptAccess.objects.create(
+            zone=self.zones[0], team=alpha, player=alpha_players[0], attempt_code="MANUAL-1",
+        )
+
+        rows = self.generate()
+
+        # One code per player per zone, minus the one issued by hand
+        self.assertEqual(len(rows), 2 * 2 * 2 - 1)
+        codes = [row["attempt_code"] for row in rows]
+        self.assertEqual(len(set(codes)), len(codes))
+        for code in codes:
+            self.assertRegex(code, f"^[{CODE_ALPHABET}]{{{CODE_LENGTH}}}$")
+        self.assertEqual(
+            {(row["player_name"], row["zone"], row["attempt_code"]) for row in rows},
+            set(
+                ZoneAttemptAccess.objects.filter(attempt_code__in=codes)
+                .values_list("player__name", "zone__title", "attempt_code")
+            ),
+        )
+        self.assertEqual(ZoneAttemptAccess.objects.get(attempt_code="MANUAL-1").player, alpha_players[0])
+
+        # Everything issued: a re-run adds nothing
+        self.assertEqual(self.generate(), [])
+
+    def test_generator_skips_taken_codes(self):
+        (alpha, players), _ = self.teams
+        ZoneAttemptAccess.objects.create(zone=self.zones[0], team=alpha, player=players[0], attempt_code="A" * 6)
+
+        with mock.patch("app.management.commands.generate_attempt_codes.secrets.choice", side_effect=list("AAAAAABBBBBB")):
+            next_code = CodeGenerator(length=6)
+            self.assertEqual(next_code(), "B" * 6)
+
+    def test_each_batch_is_written_as_it_is_inserted(self):
+        batches = []
+        flush = GenerateCommand.flush
+
+        def record(command, batch, writer):
+            batches.append([access.attempt_code for access in batch])
+            return flush(command, batch, writer)
+
+        with mock.patch.object(GenerateCommand, "flush", autospec=True, side_effect=record):
+            rows = self.generate("--batch-size", "3")
+
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 2])
+        self.assertEqual([row["attempt_code"] for row in rows], [code for batch in batches for code in batch])
+
+    def test_invalidates_team_state_per_batch(self):
+        (alpha, _), (bravo, _) = self.teams
+        with mock.patch("app.management.commands.generate_attempt_codes.invalidate_team_state") as invalidate:
+            self.generate("--batch-size", "4", "--team", "Alpha")
+
+        self.assertEqual(invalidate.call_args_list, [mock.call(alpha.id)])
+        self.assertFalse(ZoneAttemptAccess.objects.filter(team=bravo).exists())
+
+
+# -------------------------
+# TEAM SESSION LIMIT
+# -------------------------
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SessionLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.team, _ = make_team("Alpha")
+        self.team.user.set_password("x")
+        self.team.user.save()
+
+    def login(self):
+        client = Client()
+        return client, client.post("/login/", {"username": "alpha", "password": "x"})
+
+    def test_limit_and_logout_frees_a_slot(self):
+        clients = []
+        for _ in range(views.MAX_SESSIONS):
+            client, response = self.login()
+            self.assertEqual(response.status_code, 302)
+            clients.append(client)
+        self.assertEqual(TeamSession.objects.filter(user=self.team.user).count(), views.MAX_SESSIONS)
+
+        self.assertEqual(self.login()[1].status_code, 403)
+
+        clients[0].get("/logout/")
+        self.assertEqual(self.login()[1].status_code, 302)
+
+    def test_idle_sessions_are_purged(self):
+        other, _ = make_team("Bravo")
+        TeamSession.objects.create(user=other.user, session_key="bravo-idle")
+        for _ in range(views.MAX_SESSIONS):
+            self.login()
+        heartbeats.flush()
+        TeamSession.objects.update(last_seen_at=timezone.now() - timedelta(minutes=views.SESSION_IDLE_MINUTES + 1))
+
+        self.assertEqual(self.login()[1].status_code, 302)
+        self.assertEqual(TeamSession.objects.filter(user=self.team.user).count(), 1)
+        # Only the team logging in is purged
+        self.assertTrue(TeamSession.objects.filter(session_key="bravo-idle").exists())
+
+    def test_staff_sessions_are_not_tracked(self):
+        User.objects.create_superuser("admin_sessions", password="x")
+        response = self.client.post("/admin/login/", {"username": "admin_sessions", "password": "x", "next": "/admin/"})
+        self.assertEqual(response.status_code, 302)
+        self.client.get("/admin/")
+        self.assertFalse(TeamSession.objects.exists())
+
+
+class SessionLimitConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.team, _ = make_team("Alpha")
+
+    def login(self, barrier, results):
+        request = RequestFactory().post("/login/")
+        request.session = SessionStore()
+        try:
+            barrier.wait()
+            for _ in range(100):
+                try:
+                    results.append(views.login_within_limit(request, self.team.user))
+                    return
+                except OperationalError:
+                    # SQLite table lock held by another login (rolled back): retry
+                    time.sleep(0.01)
+            results.append("locked")
+        finally:
+            connection.close()
+
+    def test_concurrent_logins_respect_the_limit(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        threads = [threading.Thread(target=self.login, args=(barrier, results)) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertNotIn("locked", results)
+        self.assertEqual(results.count(True), views.MAX_SESSIONS)
+        self.assertEqual(TeamSession.objects.count(), views.MAX_SESSIONS)
+
+
+class HeartbeatBufferTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        team, _ = make_team("Alpha")
+        self.stale = timezone.now() - timedelta(hours=1)
+        for key in ("a" * 32, "b" * 32):
+            TeamSession.objects.create(user=team.user, session_key=key)
+        TeamSession.objects.update(last_seen_at=self.stale)
+
+    def last_seen(self, key):
+        return TeamSession.objects.get(session_key=key).last_seen_at
+
+    def test_timer_flushes_without_more_traffic(self):
+        buffer = HeartbeatBuffer(flush_every=0.05)
+        buffer.record("a" * 32)
+        self.assertEqual(self.last_seen("a" * 32), self.stale)
+
+        for _ in range(100):
+            if self.last_seen("a" * 32) > self.stale:
+                break
+            time.sleep(0.02)
+        self.assertGreater(self.last_seen("a" * 32), self.stale)
+        self.assertEqual(self.last_seen("b" * 32), self.stale)
+
+    def test_size_and_age_trigger_a_flush(self):
+        buffer = HeartbeatBuffer(flush_every=60, flush_size=2, timer=False)
+        buffer.record("a" * 32)
+        self.assertEqual(self.last_seen("a" * 32), self.stale)
+        buffer.record("b" * 32)
+        self.assertGreater(self.last_seen("a" * 32), self.stale)
+        self.assertGreater(self.last_seen("b" * 32), self.stale)
+
+        TeamSession.objects.update(last_seen_at=self.stale)
+        buffer = HeartbeatBuffer(flush_every=0, timer=False)
+        buffer.record("a" * 32)
+        self.assertGreater(self.last_seen("a" * 32), self.stale)
+
+    def test_failed_write_keeps_the_beats(self):
+        buffer = HeartbeatBuffer(timer=False)
+        buffer.record("a" * 32)
+        with mock.patch.object(HeartbeatBuffer, "_write", side_effect=OperationalError("disk I/O error")):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertGreater(self.last_seen("a" * 32), self.stale)
+
+
+# -------------------------
+# BULK TEAM IMPORT
+# -------------------------
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ImportTeamsPlayersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        work = tempfile.TemporaryDirectory()
+        self.addCleanup(work.cleanup)
+        self.dir = work.name
+        self.input = self.path("teams.csv")
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write_input(self, header, rows):
+        with open(self.input, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def read(self, name):
+        with open(self.path(name), newline="", encoding="utf-8") as file:
+            return list(csv.reader(file))[1:]
+
+    def run_import(self, *args, bulk=True):
+        call_command(
+            "import_teams_players", self.input, *(["--bulk"] if bulk else []),
+            "--output", self.path("credentials.csv"), *args,
+            stdout=io.StringIO(),
+        )
+
+    def test_bulk_inserts_skip_the_team_signals(self):
+        self.write_input(["team_name", "player_name", "role"], [
+            [f"Team{i}", f"Player{i} {role}", role] for i in range(6) for role in ("INTERN", "CEO")
+        ])
+
+        with mock.patch("app.signals.append_team_credentials") as append_credentials, \
+                CaptureQueriesContext(connection) as ctx:
+            self.run_import("--workers", "1")
+
+        # One statement per table for the whole chunk, not one per team
+        inserts = [q["sql"].split()[2] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        for table in ('"auth_user"', '"app_team"', '"app_player"', '"app_score"'):
+            self.assertEqual(inserts.count(table), 1, table)
+        # create_user_for_team didn't run: no second user, no credentials append
+        append_credentials.assert_not_called()
+        self.assertEqual(User.objects.count(), 6)
+
+        self.assertEqual(Team.objects.count(), 6)
+        self.assertEqual(Player.objects.count(), 12)
+        self.assertEqual(Score.objects.count(), 6)
+        self.assertEqual(LeaderboardEntry.objects.count(), 6)
+        for team_name, username, password in self.read("credentials.csv"):
+            self.assertTrue(User.objects.get(username=username, team__name=team_name).check_password(password))
+
+    def test_bad_rows_go_to_the_rejected_file(self):
+        make_team("Delta")
+        self.write_input(["team_name", "player_name", "role"], [
+            ["Alpha", "Ann", "INTERN"],
+            ["Alpha", "Abe", "MANAGER"],
+            ["Alpha", "Amy", "INTERN"],        # role taken
+            ["Bravo", "Bob", "PILOT"],         # unknown role
+            ["Bravo", "Bea", "CEO"],
+            ["Bravo", "", "TEAM_LEADER"],      # no name
+            ["Delta", "Dan", "CEO"],           # team exists
+        ])
+
+        self.run_import("--workers", "1")
+
+        self.assertEqual(
+            set(Player.objects.filter(team__name__in=["Alpha", "Bravo"]).values_list("team__name", "name", "role")),
+            {("Alpha", "Ann", "INTERN"), ("Alpha", "Abe", "MANAGER"), ("Bravo", "Bea", "CEO")},
+        )
+        self.assertEqual(
+            [(team, reason) for team, _, _, reason in self.read("teams.csv.rejected.csv")],
+            [
+                ("Alpha", "role 'INTERN' already exists in team"),
+                ("Bravo", "invalid role 'PILOT'"),
+                ("Bravo", "missing team or player name"),
+                ("Delta", "team or username already exists"),
+            ],
+        )
+
+        credentials = self.read("credentials.csv")
+        self.assertEqual([row[:2] for row in credentials], [["Alpha", "alpha"], ["Bravo", "bravo"]])
+        for team_name, username, password in credentials:
+            self.assertTrue(User.objects.get(username=username).check_password(password))
+            self.assertTrue(Score.objects.filter(team__name=team_name).exists())
+            self.assertTrue(LeaderboardEntry.objects.filter(team__name=team_name).exists())
+        self.assertFalse(os.path.exists(self.input + ".checkpoint"))
+
+    def test_a_failed_run_resumes_from_the_checkpoint(self):
+        self.write_input(["team_name", "player_name", "role"], [
+            ["Alpha", "Ann", "INTERN"],
+            ["Alpha", "Abe", "MANAGER"],
+            ["Bravo", "Bob", "INTERN"],
+            ["Charlie", "Cat", "CEO"],
+        ])
+        import_chunk = ImportCommand.import_chunk
+        calls = []
+
+        def fail_second_chunk(command, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise OperationalError("disk I/O error")
+            return import_chunk(command, *args)
+
+        with mock.patch.object(ImportCommand, "import_chunk", autospec=True, side_effect=fail_second_chunk):
+            with self.assertRaises(OperationalError):
+                self.run_import("--workers", "1", "--chunk-size", "1")
+
+        # Alpha's two rows are committed and recorded
+        with open(self.input + ".checkpoint", encoding="utf-8") as file:
+            self.assertEqual(json.load(file)["rows"], 2)
+        self.assertEqual(list(Team.objects.values_list("name", flat=True)), ["Alpha"])
+
+        self.run_import("--workers", "1", "--chunk-size", "1")
+
+        self.assertEqual(sorted(Team.objects.values_list("name", flat=True)), ["Alpha", "Bravo", "Charlie"])
+        self.assertEqual(Player.objects.count(), 4)
+        # Appended to, not rewritten, on resume
+        self.assertEqual([row[0] for row in self.read("credentials.csv")], ["Alpha", "Bravo", "Charlie"])
+        self.assertEqual(self.read("teams.csv.rejected.csv"), [])
+        self.assertFalse(os.path.exists(self.input + ".checkpoint"))
+
+    def test_default_path_commits_per_chunk_with_signals(self):
+        self.write_input(["team_name", "player_name", "role"], [
+            ["Alpha", "Ann", "INTERN"],
+            ["Bravo", "Bob", "PILOT"],         # unknown role
+            ["Bravo", "Bea", "CEO"],
+            ["Charlie", "Cat", "CEO"],
+        ])
+        import_chunk = ImportCommand.import_chunk
+
+        def fail_on_charlie(command, chunk, *args):
+            if "Charlie" in chunk:
+                raise OperationalError("disk I/O error")
+            return import_chunk(command, chunk, *args)
+
+        with mock.patch.object(ImportCommand, "import_chunk", autospec=True, side_effect=fail_on_charlie):
+            with self.assertRaises(OperationalError):
+                self.run_import("--chunk-size", "1", bulk=False)
+
+        # A bad row no longer rolls back the import: the chunks before stay
+        self.assertEqual(sorted(Team.objects.values_list("name", flat=True)), ["Alpha", "Bravo"])
+        self.assertEqual([row[3] for row in self.read("teams.csv.rejected.csv")], ["invalid role 'PILOT'"])
+
+        with mock.patch("app.management.commands.import_teams_players.rebuild_leaderboard") as rebuild:
+            self.run_import("--chunk-size", "1", bulk=False)
+
+        self.assertEqual(sorted(Team.objects.values_list("name", flat=True)), ["Alpha", "Bravo", "Charlie"])
+        # Score and leaderboard rows came from the per-team signals
+        rebuild.assert_not_called()
+        self.assertEqual(Score.objects.count(), 3)
+        self.assertEqual(LeaderboardEntry.objects.count(), 3)
+        for team_name, username, password in self.read("credentials.csv"):
+            self.assertTrue(User.objects.get(username=username, team__name=team_name).check_password(password))
+        self.assertFalse(os.path.exists(self.input + ".checkpoint"))
+
+    def test_checkpoint_for_another_input_is_refused(self):
+        self.write_input(["team_name", "player_name", "role"], [["Alpha", "Ann", "INTERN"]])
+        with open(self.input + ".checkpoint", "w", encoding="utf-8") as file:
+            json.dump({"input": "/elsewhere/teams.csv", "rows": 1}, file)
+
+        with self.assertRaisesMessage(CommandError, "belongs to /elsewhere/teams.csv"):
+            self.run_import("--workers", "1")
+        self.assertFalse(Team.objects.exists())
+
+    def test_raw_sheet_through_the_process_pool(self):
+        self.write_input(["Team Name", "Intern Name", "Manager Name", "CEO Name"], [
+            ["alpha", "ann", "abe", ""],
+            ["bravo", "bob", "", "bea"],
+            ["charlie", "cat", "", ""],
+        ])
+
+        self.run_import("--raw", "--workers", "2")
+
+        self.assertEqual(
+            set(Player.objects.values_list("team__name", "name", "role")),
+            {
+                ("ALPHA", "ANN", "INTERN"), ("ALPHA", "ABE", "MANAGER"),
+                ("BRAVO", "BOB", "INTERN"), ("BRAVO", "BEA", "CEO"),
+                ("CHARLIE", "CAT", "INTERN"),
+            },
+        )
+        # Hashed in the worker processes, checked here
+        for team_name, username, password in self.read("credentials.csv"):
+            self.assertTrue(User.objects.get(username=username).check_password(password))
+
+    def test_hash_passwords_in_a_pool(self):
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            hashes = hash_passwords(["one", "two", "three"], pool, workers=2)
+        self.assertEqual([check_password(p, h) for p, h in zip(["one", "two", "three"], hashes)], [True] * 3)
+
+
+# -------------------------
+# QUERY BUDGETS
+# -------------------------
+ROLES = [role for role, _ in Player.ROLE_CHOICES]
+
+
+def seed_teams(start, count, zones):
+    """
+    Bulk-create `count` teams with a player per role, a code per zone,
+    three completed attempts, one active attempt and scores.
+    """
+    hashed = make_password("x")
+    names = [f"Budget {i:04d}" for i in range(start, start + count)]
+
+    User.objects.bulk_create([User(username=name.lower().replace(" ", "_"), password=hashed) for name in names])
+    user_ids = dict(User.objects.filter(username__startswith="budget_").values_list("username", "id"))
+    Team.objects.bulk_create([Team(name=name, user_id=user_ids[name.lower().replace(" ", "_")]) for name in names])
+    teams = list(Team.objects.filter(name__in=names))
+
+    Player.objects.bulk_create([
+        Player(name=f"{team.name} {role}", role=role, team=team)
+        for team in teams for role in ROLES
+    ])
+    players = {(p.team_id, p.role): p for p in Player.objects.filter(team__in=teams)}
+
+    codes = [
+        ZoneAttemptAccess(
+            zone=zone, team=team, player=players[(team.id, ROLES[i % len(ROLES)])],
+            attempt_code=f"B{team.id}-{zone.id}", is_used=i < 4,
+        )
+        for team in teams for i, zone in enumerate(zones)
+    ]
+    ZoneAttemptAccess.objects.bulk_create(codes)
+
+    now = timezone.now()
+    ZoneAttempt.objects.bulk_create([
+        ZoneAttempt(
+            team_id=access.team_id, zone_id=access.zone_id, player_id=access.player_id, access=access,
+            status="COMPLETED" if i < 3 else "ACTIVE",
+            exit_time=now if i < 3 else None,
+            duration_seconds=600 + access.team_id if i < 3 else None,
+        )
+        for access in ZoneAttemptAccess.objects.filter(team__in=teams, is_used=True)
+        for i in [zones.index(access.zone)]
+    ])
+
+    points = {
+        team.id: {zones[0].id: 100 + team.id % 7 * 50, zones[1].id: 200, zones[2].id: team.id % 5 * 100}
+        for team in teams
+    }
+    ZoneScore.objects.bulk_create([
+        ZoneScore(team_id=team_id, zone_id=zone_id, points=value)
+        for team_id, by_zone in points.items() for zone_id, value in by_zone.items()
+    ])
+    Score.objects.bulk_create([Score(team=team, total=sum(points[team.id].values())) for team in teams])
+    rebuild_leaderboard()
+    rebuild_timeline()
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Hot views must run the same number of queries for 1, 50 and 500
+    teams (no per-row queries), within a wall-time ceiling.
+    """
+
+    SIZES = (1, 50, 500)
+
+    # Seconds, at the largest size; generous so only a regression trips them
+    WALL_TIME_CEILINGS = {
+        "leaderboard": 2.0,
+        "leaderboard_data_api": 1.0,
+        "leaderboard_data_api top 20": 0.5,
+        "leaderboard_me_api": 0.5,
+        "zones": 0.5,
+        "admin zoneattempt": 1.5,
+        "admin zoneattemptaccess": 1.5,
+        "admin player": 1.5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zones = [Zone.objects.create(title=f"Zone {i}") for i in range(1, 7)]
+        ZoneContent.objects.bulk_create([
+            ZoneContent(zone=zone, role=role, content="<p>brief</p>", exit_code="EXIT")
+            for zone in cls.zones for role in ROLES
+        ])
+        cls.admin_user = User.objects.create_superuser("admin_budget", password="x")
+
+    def setUp(self):
+        # Row ids repeat between tests (rollback): drop per-team cache entries
+        cache.clear()
+
+    def endpoints(self):
+        team_user = User.objects.get(username="budget_0000")
+        team_client = self.client_class()
+        team_client.force_login(team_user)
+        admin_client = self.client_class()
+        admin_client.force_login(self.admin_user)
+        anonymous = self.client_class()
+
+        return [
+            ("leaderboard", anonymous, "/leaderboard/"),
+            ("leaderboard_data_api", anonymous, "/leaderboard/data/"),
+            ("leaderboard_data_api top 20", anonymous, "/leaderboard/data/?limit=20"),
+            ("leaderboard_me_api", team_client, "/leaderboard/me/"),
+            ("zones", team_client, "/zones/"),
+            ("admin zoneattempt", admin_client, "/admin/app/zoneattempt/"),
+            ("admin zoneattemptaccess", admin_client, "/admin/app/zoneattemptaccess/"),
+            ("admin player", admin_client, "/admin/app/player/"),
+        ]
+
+    def assert_constant_queries(self):
+        counts = defaultdict(list)
+        seeded = 0
+
+        for size in self.SIZES:
+            seed_teams(seeded, size - seeded, self.zones)
+            seeded = size
+
+            for name, client, url in self.endpoints():
+                client.get(url)  # warm caches (zones, versions, session)
+
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - started
+
+                self.assertEqual(response.status_code, 200, f"{name} at {size} teams")
+                counts[name].append(len(ctx))
+
+                if size == self.SIZES[-1]:
+                    self.assertLess(
+                        elapsed, self.WALL_TIME_CEILINGS[name],
+                        f"{name} took {elapsed:.2f}s at {size} teams",
+                    )
+
+        for name, per_size in counts.items():
+            with self.subTest(view=name):
+                self.assertEqual(
+                    len(set(per_size)), 1,
+                    f"{name} queries grow with teams: {dict(zip(self.SIZES, per_size))}",
+                )
+
+    def test_async_views(self):
+        self.assert_constant_queries()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_views(self):
+        self.assert_constant_queries()
+
+
+# -------------------------
+# CACHED TEAM STATE (zones page)
+# -------------------------
+class TeamStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.zones = [Zone.objects.create(title=f"Zone {i}") for i in range(1, 4)]
+        self.team, (self.player,) = make_team("Alpha")
+        z1, z2, z3 = self.zones
+
+        ZoneAttemptAccess.objects.create(zone=z1, team=self.team, player=self.player, attempt_code="A-1")
+        done = ZoneAttemptAccess.objects.create(
+            zone=z2, team=self.team, player=self.player, attempt_code="A-2", is_used=True
+        )
+        ZoneAttempt.objects.create(
+            zone=z2, team=self.team, player=self.player, access=done, status="COMPLETED"
+        )
+        self.code = ZoneAttemptAccess.objects.create(
+            zone=z3, team=self.team, player=self.player, attempt_code="A-3"
+        )
+        ZoneScore.objects.create(team=self.team, zone=z2, points=300)
+
+        # Some other team's rows must not leak in
+        other, (other_player,) = make_team("Bravo")
+        ZoneAttemptAccess.objects.create(zone=z2, team=other, player=other_player, attempt_code="B-2")
+
+    def state_of(self, zone):
+        (annotated,) = [z for z in get_team_state(self.team.id).apply(get_zones()) if z.id == zone.id]
+        return annotated.has_active, annotated.has_completed, annotated.has_access, annotated.score, annotated.can_enter
+
+    def test_state_matches_rows(self):
+        z1, z2, z3 = self.zones
+        self.assertEqual(self.state_of(z1), (False, False, True, 0, True))
+        self.assertEqual(self.state_of(z2), (False, True, False, 300, False))
+        self.assertEqual(self.state_of(z3), (False, False, True, 0, True))
+
+    def test_state_is_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            get_team_state(self.team.id)
+        with self.assertNumQueries(0):
+            get_team_state(self.team.id)
+
+    def test_redeeming_a_code_invalidates_the_team(self):
+        z3 = self.zones[2]
+        self.state_of(z3)  # cache it
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ZoneAttempt.start("A-3")
+        self.assertEqual(self.state_of(z3), (True, False, False, 0, True))
+
+        attempt = ZoneAttempt.objects.get(access=self.code)
+        with self.captureOnCommitCallbacks(execute=True):
+            attempt.end_attempt(status="COMPLETED")
+        self.assertEqual(self.state_of(z3), (False, True, False, 0, False))
+
+    def test_zones_refresh_only_loads_the_user(self):
+        self.client.force_login(self.team.user)
+        self.client.get("/zones/")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/zones/")
+
+        self.assertEqual(response.status_code, 200)
+        tables = {q["sql"].split(" FROM ")[1].split()[0] for q in ctx.captured_queries if " FROM " in q["sql"]}
+        self.assertEqual(tables, {'"auth_user"'})
+
+
+# -------------------------
+# ZONE SCORES / MAINTAINED TOTAL
+# -------------------------
+class ZoneScoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Ids past 6: the old zone1..zone6 columns couldn't hold these
+        self.zones = [Zone.objects.create(id=zone_id, title=f"Zone {zone_id}") for zone_id in (3, 7, 12)]
+        self.team, _ = make_team("Alpha")
+        self.other, _ = make_team("Bravo")
+
+    def total(self, team):
+        return Score.objects.get(team=team).total
+
+    def test_total_follows_zone_rows(self):
+        z3, z7, z12 = self.zones
+        row = ZoneScore.objects.create(team=self.team, zone=z7, points=200)
+        ZoneScore.objects.create(team=self.team, zone=z12, points=50)
+        self.assertEqual(self.total(self.team), 250)
+
+        row.points = 120
+        row.save()
+        self.assertEqual(self.total(self.team), 170)
+
+        row.delete()
+        self.assertEqual(self.total(self.team), 50)
+        self.assertEqual(LeaderboardEntry.objects.get(team=self.team).total, 50)
+
+    def test_set_zone_points_upserts(self):
+        z3, z7, z12 = self.zones
+        score = Score.objects.get(team=self.team)
+        score.set_zone_points({z3.id: 100, z12.id: 400})
+        score.set_zone_points({z3.id: 0, z7.id: 300})
+
+        self.assertEqual(score.total, 700)
+        self.assertEqual(score.zone_points(), {z3.id: 0, z7.id: 300, z12.id: 400})
+
+    def test_ranking_is_ordered_by_stored_total(self):
+        z3, _, _ = self.zones
+        Score.objects.get(team=self.other).set_zone_points({z3.id: 500})
+        Score.objects.get(team=self.team).set_zone_points({z3.id: 100})
+
+        self.assertEqual(
+            [score.team_id for score in Score.objects.ranked()],
+            [self.other.id, self.team.id],
+        )
+
+    def test_admin_form_has_a_field_per_zone(self):
+        admin_user = User.objects.create_superuser("admin_scores", password="x")
+        self.client.force_login(admin_user)
+        score = Score.objects.get(team=self.team)
+        url = f"/admin/app/score/{score.id}/change/"
+
+        response = self.client.get(url)
+        for zone in self.zones:
+            self.assertContains(response, f'name="zone_{zone.id}"')
+
+        response = self.client.post(url, {
+            "team": self.team.id, "credit": 5,
+            **{f"zone_{zone.id}": 10 * zone.id for zone in self.zones},
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.total(self.team), 10 * (3 + 7 + 12))
+
+        response = self.client.get("/admin/app/score/")
+        self.assertContains(response, "Zone 12")
+
+    def test_zone_points_are_editable_on_the_changelist(self):
+        z3, z7, _ = self.zones
+        rows = [
+            ZoneScore.objects.create(team=self.team, zone=z3, points=100),
+            ZoneScore.objects.create(team=self.team, zone=z7, points=200),
+        ]
+        admin_user = User.objects.create_superuser("admin_zone_scores", password="x")
+        self.client.force_login(admin_user)
+
+        response = self.client.get("/admin/app/zonescore/")
+        self.assertContains(response, 'name="form-0-points"')
+
+        response = self.client.post("/admin/app/zonescore/", {
+            "form-TOTAL_FORMS": 2, "form-INITIAL_FORMS": 2,
+            "form-0-id": rows[0].id, "form-0-points": 150,
+            "form-1-id": rows[1].id, "form-1-points": 200,
+            "_save": "Save",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.total(self.team), 350)
+        self.assertEqual(LeaderboardEntry.objects.get(team=self.team).total, 350)
+
+    def test_admin_save_applies_the_score_once(self):
+        admin_user = User.objects.create_superuser("admin_once", password="x")
+        self.client.force_login(admin_user)
+        score = Score.objects.get(team=self.team)
+
+        with mock.patch("app.leaderboard.apply_score", wraps=leaderboard.apply_score) as apply_score:
+            response = self.client.post(f"/admin/app/score/{score.id}/change/", {
+                "team": self.team.id, "credit": 5,
+                **{f"zone_{zone.id}": 100 for zone in self.zones},
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(apply_score.call_count, 1)
+        entry = LeaderboardEntry.objects.get(team=self.team)
+        self.assertEqual((entry.total, entry.credit), (300, 5))
+
+    def test_ties_share_a_rank_and_skip_the_next(self):
+        z3, _, _ = self.zones
+        charlie, _ = make_team("Charlie")
+        delta, _ = make_team("Delta")
+        for team, points in ((self.team, 500), (self.other, 500), (charlie, 500), (delta, 100)):
+            Score.objects.get(team=team).set_zone_points({z3.id: points})
+        # Same total; credit breaks Charlie out of the tie
+        Score.objects.filter(team=charlie).update(credit=5)
+
+        ranked = {score.team.name: (score.rank, score.dense_rank) for score in Score.objects.ranked().select_related("team")}
+        self.assertEqual(ranked, {"Charlie": (1, 1), "Alpha": (2, 2), "Bravo": (2, 2), "Delta": (4, 3)})
+
+        rebuild_leaderboard()
+        self.assertEqual(
+            dict(LeaderboardEntry.objects.values_list("team__name", "rank")),
+            {"Charlie": 1, "Alpha": 2, "Bravo": 2, "Delta": 4},
+        )
+
+
+# -------------------------
+# LEADERBOARD PAGES / MY RANK
+# -------------------------
+class LeaderboardPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.zone = zone = Zone.objects.create(title="Zone 1")
+        # Points 700, 600, ..., with a tie at 300 to exercise the team_id tiebreak
+        cls.teams = []
+        for i, points in enumerate([700, 600, 500, 400, 300, 300, 200, 100]):
+            team, _ = make_team(f"Team{i}")
+            Score.objects.get(team=team).set_zone_points({zone.id: points})
+            cls.teams.append(team)
+        rebuild_leaderboard()
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, limit):
+        names, url = [], f"/leaderboard/data/?limit={limit}"
+        while url:
+            payload = self.client.get(url).json()
+            self.assertLessEqual(len(payload["leaderboard"]), limit)
+            names += [row["team"] for row in payload["leaderboard"]]
+            url = payload["next"] and f"/leaderboard/data/?limit={limit}&after={payload['next']}"
+        return names
+
+    def check_pages(self):
+        everything = [row["team"] for row in self.client.get("/leaderboard/data/").json()["leaderboard"]]
+        self.assertEqual(everything, [team.name for team in self.teams])
+        for limit in (1, 3, 8, 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), everything)
+
+    def check_me(self):
+        self.assertEqual(self.client.get("/leaderboard/me/").status_code, 403)
+
+        self.client.force_login(self.teams[5].user)
+        payload = self.client.get("/leaderboard/me/?neighbours=2").json()
+
+        self.assertEqual(payload["teams"], 8)
+        self.assertEqual(payload["you"]["team"], "Team5")
+        self.assertEqual(payload["you"]["rank"], 5)   # tied with Team4
+        self.assertEqual([row["team"] for row in payload["above"]], ["Team3", "Team4"])
+        self.assertEqual([row["team"] for row in payload["below"]], ["Team6", "Team7"])
+
+        payload = self.client.get("/leaderboard/me/?neighbours=5").json()
+        self.assertEqual(len(payload["above"]), 5)
+        self.assertEqual(len(payload["below"]), 2)
+
+    def check_conditional(self):
+        response = self.client.get("/leaderboard/data/")
+        etag = response["ETag"]
+        version = response.json()["version"]
+
+        self.assertEqual(self.client.get("/leaderboard/data/", headers={"if-none-match": etag}).status_code, 304)
+        # Another page or a delta is a different response
+        for query in ("?limit=3", "?limit=3&after=3.1", f"?since={version}"):
+            with self.subTest(query=query):
+                response = self.client.get(f"/leaderboard/data/{query}", headers={"if-none-match": etag})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+        delta = self.client.get(f"/leaderboard/data/?since={version}").json()
+        self.assertEqual((delta["full"], delta["leaderboard"]), (False, []))
+
+        # Team7 gains points without passing anyone: only its row is new
+        with self.captureOnCommitCallbacks(execute=True):
+            Score.objects.get(team=self.teams[7]).set_zone_points({self.zone.id: 150})
+
+        self.assertEqual(self.client.get("/leaderboard/data/", headers={"if-none-match": etag}).status_code, 200)
+        delta = self.client.get(f"/leaderboard/data/?since={version}").json()
+        self.assertGreater(delta["version"], version)
+        self.assertFalse(delta["full"])
+        self.assertEqual([row["team"] for row in delta["leaderboard"]], ["Team7"])
+
+        # An unknown (future) version gets the full list
+        ahead = self.client.get(f"/leaderboard/data/?since={delta['version'] + 5}").json()
+        self.assertTrue(ahead["full"])
+        self.assertEqual(len(ahead["leaderboard"]), 8)
+
+    def test_async_views(self):
+        self.check_pages()
+        self.check_me()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_views(self):
+        self.check_pages()
+        self.check_me()
+
+    def check_team_lookup_is_cached(self):
+        self.client.force_login(self.teams[2].user)
+        self.client.get("/leaderboard/data/?limit=3")   # warm the user -> team cache
+
+        with CaptureQueriesContext(connection) as ctx:
+            payload = self.client.get("/leaderboard/data/?limit=3").json()
+
+        self.assertEqual([row["is_you"] for row in payload["leaderboard"]], [False, False, True])
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if 'FROM "app_team"' in q["sql"]])
+
+    def test_async_team_lookup_is_cached(self):
+        self.check_team_lookup_is_cached()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_team_lookup_is_cached(self):
+        self.check_team_lookup_is_cached()
+
+    def test_async_conditional_requests(self):
+        self.check_conditional()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_conditional_requests(self):
+        self.check_conditional()
+
+    def test_cached_version_only_moves_forward(self):
+        version = leaderboard.current_version()
+        leaderboard.advance_version(version + 2)
+        leaderboard.advance_version(version + 1)   # an older commit landing late
+        self.assertEqual(leaderboard.current_version(), version + 2)
+
+    def test_chart_is_served_locally(self):
+        response = self.client.get("/leaderboard/")
+        self.assertContains(response, static("vendor/chartjs/chart-4.4.0.umd.min.js"))
+        self.assertNotContains(response, "cdn.jsdelivr.net/npm/chart")
+
+
+# -------------------------
+# SCORE TIMELINE
+# -------------------------
+class ScoreTimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.zone = Zone.objects.create(title="Zone 1")
+        self.team, _ = make_team("Alpha")
+        self.other, _ = make_team("Bravo")
+
+    def set_points(self, team, points):
+        Score.objects.get(team=team).set_zone_points({self.zone.id: points})
+
+    def events(self, team):
+        return list(ScoreEvent.objects.filter(team=team).order_by("id").values_list("total", "delta"))
+
+    def test_events_are_logged_only_when_the_total_changes(self):
+        self.set_points(self.team, 100)
+        self.assertEqual(self.events(self.team), [(100, 100)])
+
+        # Same total again, then a credit-only change: nothing to plot
+        self.set_points(self.team, 100)
+        score = Score.objects.get(team=self.team)
+        score.credit = 7
+        score.save()
+        self.assertEqual(self.events(self.team), [(100, 100)])
+        self.assertEqual(LeaderboardEntry.objects.get(team=self.team).credit, 7)
+
+        self.set_points(self.team, 250)
+        self.set_points(self.team, 200)
+        self.assertEqual(self.events(self.team), [(100, 100), (250, 150), (200, -50)])
+        self.assertEqual(self.events(self.other), [])
+
+    def test_timeline_since_returns_only_new_points(self):
+        self.set_points(self.team, 100)
+        self.set_points(self.other, 300)
+
+        payload = self.client.get("/leaderboard/timeline/").json()
+        self.assertEqual([(p["team"], p["y"]) for p in payload["points"]], [("Alpha", 100), ("Bravo", 300)])
+        last_id = payload["last_id"]
+
+        # Nothing new: no points, and the cursor stays put
+        self.assertEqual(
+            self.client.get(f"/leaderboard/timeline/?since={last_id}").json(),
+            {"last_id": last_id, "points": []},
+        )
+
+        self.set_points(self.team, 400)
+        payload = self.client.get(f"/leaderboard/timeline/?since={last_id}").json()
+        self.assertEqual([(p["team"], p["y"]) for p in payload["points"]], [("Alpha", 400)])
+        self.assertGreater(payload["last_id"], last_id)
+
+        # An invalid cursor is treated as absent
+        self.assertEqual(len(self.client.get("/leaderboard/timeline/?since=x").json()["points"]), 3)
+
+
+# -------------------------
+# INCREMENTAL RANK MAINTENANCE
+# -------------------------
+class RankMaintenanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.zone = Zone.objects.create(title="Zone 1")
+        # Team0 800 ... Team7 100
+        cls.teams, cls.players = [], []
+        for i in range(8):
+            team, (player,) = make_team(f"Team{i}")
+            Score.objects.get(team=team).set_zone_points({cls.zone.id: 800 - i * 100})
+            cls.teams.append(team)
+            cls.players.append(player)
+
+    def setUp(self):
+        cache.clear()
+
+    def set_points(self, team, points):
+        Score.objects.get(team=team).set_zone_points({self.zone.id: points})
+
+    def ranks(self):
+        return dict(LeaderboardEntry.objects.values_list("team__name", "rank"))
+
+    def touched_by(self, change):
+        """
+        Team names whose row was rewritten (new version) by change().
+        """
+        before = dict(LeaderboardEntry.objects.values_list("team__name", "version"))
+        change()
+        after = dict(LeaderboardEntry.objects.values_list("team__name", "version"))
+        return {name for name, version in after.items() if version != before.get(name)}
+
+    def assert_ranks_consistent(self):
+        # A full RANK() pass finds nothing left to fix
+        self.assertEqual(rerank(), set())
+
+    def test_moving_up_touches_only_the_rows_passed(self):
+        touched = self.touched_by(lambda: self.set_points(self.teams[6], 650))
+
+        self.assertEqual(touched, {"Team6", "Team2", "Team3", "Team4", "Team5"})
+        ranks = self.ranks()
+        self.assertEqual(ranks["Team6"], 3)
+        self.assertEqual([ranks[f"Team{i}"] for i in (0, 1, 2, 3, 4, 5, 7)], [1, 2, 4, 5, 6, 7, 8])
+        self.assert_ranks_consistent()
+
+    def test_moving_down_touches_only_the_rows_passed(self):
+        touched = self.touched_by(lambda: self.set_points(self.teams[1], 450))
+
+        self.assertEqual(touched, {"Team1", "Team2", "Team3"})
+        self.assertEqual(self.ranks()["Team1"], 4)
+        self.assert_ranks_consistent()
+
+    def test_unchanged_score_touches_nothing(self):
+        self.assertEqual(self.touched_by(lambda: self.set_points(self.teams[3], 500)), set())
+
+    def test_new_team_pushes_down_only_the_rows_behind_it(self):
+        def add_team():
+            team, _ = make_team("Late")
+            self.set_points(team, 550)
+
+        touched = self.touched_by(add_team)
+        self.assertEqual(touched - {"Late"}, {"Team3", "Team4", "Team5", "Team6", "Team7"})
+        self.assertEqual(self.ranks()["Late"], 4)
+        self.assert_ranks_consistent()
+
+    def test_completed_time_moves_the_tie_break(self):
+        self.set_points(self.teams[5], 400)   # level with Team4
+        player = self.players[4]
+        access = ZoneAttemptAccess.objects.create(
+            zone=self.zone, team=self.teams[4], player=player, attempt_code="T4", is_used=True,
+        )
+        attempt = ZoneAttempt.objects.create(zone=self.zone, team=self.teams[4], player=player, access=access)
+        ZoneAttempt.objects.filter(pk=attempt.pk).update(entry_time=timezone.now() - timedelta(minutes=5))
+        attempt.refresh_from_db()
+
+        self.assertEqual((self.ranks()["Team4"], self.ranks()["Team5"]), (5, 5))
+
+        # Team4 falls behind Team5, whose rank (5) doesn't change
+        touched = self.touched_by(lambda: attempt.end_attempt(status="COMPLETED"))
+
+        self.assertEqual(touched, {"Team4"})
+        self.assertEqual((self.ranks()["Team5"], self.ranks()["Team4"]), (5, 6))
+        self.assert_ranks_consistent()
+
+    def test_random_changes_keep_ranks_exact(self):
+        rng = random.Random(7)
+        for _ in range(60):
+            self.set_points(rng.choice(self.teams), rng.choice([0, 100, 300, 300, 500, 900]))
+            self.assert_ranks_consistent()
+
+
+# -------------------------
+# LEADERBOARD STREAM (SSE)
+# -------------------------
+class LeaderboardStreamTests(TestCase):
+    def test_wsgi_gets_no_stream(self):
+        # Under WSGI the endless body would be buffered: answer 204 so
+        # EventSource closes and the page falls back to polling
+        response = self.client.get("/leaderboard/stream/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    async def test_asgi_streams(self):
+        response = await self.async_client.get("/leaderboard/stream/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b"retry: "))
+        await chunks.aclose()
+
+    def test_page_polls_when_the_stream_never_opens(self):
+        for engine in ("django", "jinja2"):
+            with self.subTest(engine=engine), override_settings(PORTAL_HOT_TEMPLATES=engine):
+                response = self.client.get("/leaderboard/")
+                self.assertContains(response, "STREAM_OPEN_TIMEOUT_MS")
+                self.assertContains(response, "startPolling();", count=3)
+
+
+# -------------------------
+# JINJA2 TWINS OF THE HOT TEMPLATES
+# -------------------------
+class HotTemplateTests(TestCase):
+    """
+    app/jinja2/ copies of leaderboard, zones and zone_play must render the
+    same page as the Django templates they mirror.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zones = [Zone.objects.create(title=f"Zone {i}", description="<b>brief</b>") for i in range(1, 7)]
+        ZoneContent.objects.bulk_create([
+            ZoneContent(zone=zone, role=role, content="<p>brief</p>", exit_code="EXIT")
+            for zone in cls.zones for role in ROLES
+        ])
+        seed_teams(0, 5, cls.zones)
+        cls.user = User.objects.get(username="budget_0000")
+        cls.attempt = ZoneAttempt.objects.get(team__user=cls.user, status="ACTIVE")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        session = self.client.session
+        session["active_attempt_id"] = self.attempt.id
+        session.save()
+
+    def page(self, engine, url, wrong_exit_code=False):
+        with self.settings(PORTAL_HOT_TEMPLATES=engine):
+            if wrong_exit_code:
+                self.client.post(f"/zone/{self.attempt.zone_id}/submit/", {"exit_code": "nope"})
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        html = re.sub(r'name="csrfmiddlewaretoken" value="[^"]+"', "", response.content.decode())
+        return re.sub(r"\s+", " ", html).strip()
+
+    def check_pages(self):
+        play = f"/zone/{self.attempt.zone_id}/play/"
+        for url, wrong_exit_code in [("/leaderboard/", False), ("/zones/", False), (play, False), (play, True)]:
+            with self.subTest(url=url, message=wrong_exit_code):
+                self.assertEqual(self.page("jinja2", url, wrong_exit_code), self.page("django", url, wrong_exit_code))
+
+        self.assertIn("Incorrect exit code", self.page("jinja2", play, wrong_exit_code=True))
+
+    def test_async_views(self):
+        self.check_pages()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_views(self):
+        self.check_pages()
+
+
+# -------------------------
+# PRE-RENDERED ZONE CONTENT
+# -------------------------
+class ZoneContentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.zone = Zone.objects.create(title="Zone 1")
+        self.team, (player,) = make_team("Alpha")
+        access = ZoneAttemptAccess.objects.create(
+            zone=self.zone, team=self.team, player=player, attempt_code="A-1", is_used=True
+        )
+        self.attempt = ZoneAttempt.objects.create(zone=self.zone, team=self.team, player=player, access=access)
+
+        self.client.force_login(self.team.user)
+        session = self.client.session
+        session["active_attempt_id"] = self.attempt.id
+        session.save()
+
+    def add_content(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ZoneContent.objects.create(zone=self.zone, role="INTERN", content=text, exit_code="EXIT")
+
+    def test_partial_saves_skip_rendering(self):
+        content = self.add_content("<p>brief</p>")
+
+        with mock.patch.object(ZoneContent, "render") as render:
+            content.exit_code = "EXIT-2"
+            content.save(update_fields=["exit_code"])
+        render.assert_not_called()
+
+        content.content = "<p>new brief</p>"
+        content.save(update_fields=["content"])
+        content.refresh_from_db()
+        self.assertEqual((content.html, content.exit_code), ("<p>new brief</p>", "EXIT-2"))
+
+    def test_migration_renderer_matches_the_current_one(self):
+        # 0019 carries a frozen copy; today it must still agree
+        migration = importlib.import_module("app.migrations.0019_zone_content_html")
+        for text in (
+            "", "plain\n\ntext & more",
+            '<p onclick="x()">Hi <a href="example.com">link</a></p><script>alert(1)</script>',
+            "".join(f"<p>{'x' * 1000} {i}</p>" for i in range(40)),
+        ):
+            self.assertEqual(migration.render_content(text), render_content(text))
+
+    def test_content_is_sanitized_on_save(self):
+        content = self.add_content(
+            '<!-- note --><p onclick="x()">Go <a href="example.com">here</a>'
+            '<a href="javascript:alert(1)">no</a></p><script>alert(1)</script>'
+        )
+        self.assertEqual(
+            content.html,
+            '<p>Go <a href="https://example.com" target="_blank" rel="noopener noreferrer">here</a>'
+            '<a target="_blank" rel="noopener noreferrer">no</a></p>',
+        )
+        self.assertEqual(len(content.content_hash), 64)
+
+        ZoneContent.objects.all().delete()
+        self.assertEqual(self.add_content("1 < 2\nok").html, "<p>1 &lt; 2<br>ok</p>")
+
+    def check_play_revalidates(self):
+        url = f"/zone/{self.zone.id}/play/"
+        content = self.add_content("<p>brief</p>")
+        self.client.get(url)  # sets the CSRF cookie the page's ETag covers
+
+        response = self.client.get(url)
+        self.assertContains(response, "<p>brief</p>")
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+        etag = response["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            content.content = "<p>new brief</p>"
+            content.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "<p>new brief</p>")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def check_parts(self):
+        with mock.patch("app.content.PART_CHARS", 40):
+            content = self.add_content("".join(f"<p>paragraph number {i}</p>" for i in range(5)))
+        self.assertGreater(content.part_count, 1)
+        self.assertEqual("".join(content.part(i) for i in range(content.part_count)), content.html)
+
+        response = self.client.get(f"/zone/{self.zone.id}/play/")
+        self.assertContains(response, content.part(0))
+        self.assertNotContains(response, content.part(1))
+
+        url = f"/zone/{self.zone.id}/content/"
+        response = self.client.get(url, {"part": 1})
+        self.assertEqual(response.content.decode(), content.part(1))
+        self.assertEqual(self.client.get(url, {"part": 1}, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(url, {"part": content.part_count}).status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {"part": 1}).status_code, 403)
+
+    def test_async_views(self):
+        self.check_play_revalidates()
+        ZoneContent.objects.all().delete()
+        self.check_parts()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_views(self):
+        self.check_play_revalidates()
+        ZoneContent.objects.all().delete()
+        self.check_parts()
+
+
+# -------------------------
+# ZONE FILES
+# -------------------------
+class ZoneAssetTests(TestCase):
+    DATA = b"".join(b"%04d,row\n" % i for i in range(500))
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+        self.zone = Zone.objects.create(title="Zone 2")
+        os.makedirs(os.path.join(media.name, f"zone{self.zone.id}"))
+        self.path = os.path.join(media.name, f"zone{self.zone.id}", "dataset.txt")
+        with open(self.path, "wb") as file:
+            file.write(self.DATA)
+        with open(self.path + ".gz", "wb") as file:
+            file.write(gzip.compress(self.DATA))
+
+        team, (player,) = make_team("Alpha")
+        access = ZoneAttemptAccess.objects.create(
+            zone=self.zone, team=team, player=player, attempt_code="A-1", is_used=True
+        )
+        attempt = ZoneAttempt.objects.create(zone=self.zone, team=team, player=player, access=access)
+        self.client.force_login(team.user)
+        session = self.client.session
+        session["active_attempt_id"] = attempt.id
+        session.save()
+
+        self.url = f"/zone/{self.zone.id}/files/dataset.txt"
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def check_serving(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.DATA))
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertFalse(response["ETag"].startswith("W/"))
+        etag = response["ETag"]
+
+        self.assertEqual(self.get(**{"If-None-Match": etag})[0].status_code, 304)
+
+        response, body = self.get(**{"Range": "bytes=10-19"})
+        self.assertEqual((response.status_code, body), (206, self.DATA[10:20]))
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.DATA)}")
+        self.assertEqual(self.get(**{"Range": "bytes=-5"})[1], self.DATA[-5:])
+        self.assertEqual(self.get(**{"Range": "bytes=99999-"})[0].status_code, 416)
+        # Stale If-Range: the whole file instead of a piece of the new one
+        self.assertEqual(self.get(**{"Range": "bytes=0-9", "If-Range": '"old"'})[0].status_code, 200)
+
+        response, body = self.get(**{"Accept-Encoding": "gzip, br;q=0"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(body), self.DATA)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        self.assertEqual(self.get(f"/zone/{self.zone.id}/files/../../secret")[0].status_code, 404)
+        self.assertEqual(self.get(f"/zone/{self.zone.id}/files/missing.txt")[0].status_code, 404)
+
+        with self.settings(PORTAL_SENDFILE="x-accel-redirect"):
+            response, body = self.get(**{"Accept-Encoding": "gzip"})
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/zone{self.zone.id}/dataset.txt")
+        self.assertEqual(body, b"")
+
+        self.client.logout()
+        self.assertEqual(self.get()[0].status_code, 403)
+
+    def test_async_views(self):
+        self.check_serving()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_sync_views(self):
+        self.check_serving()
+
+
+# -------------------------
+# BULK ATTEMPT TRANSITIONS
+# -------------------------
+class EndAttemptsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.zones = [Zone.objects.create(title=f"Zone {i}") for i in range(1, 3)]
+        self.teams = [make_team(name, roles=("INTERN", "MANAGER")) for name in ("Alpha", "Bravo")]
+        self.attempts = []
+        for team, players in self.teams:
+            for zone in self.zones:
+                for player in players:
+                    access = ZoneAttemptAccess.objects.create(
+                        zone=zone, team=team, player=player, attempt_code=f"{team.name}-{zone.id}-{player.role}",
+                        is_used=True,
+                    )
+                    self.attempts.append(ZoneAttempt.objects.create(zone=zone, team=team, player=player, access=access))
+        # Started ten minutes ago; one already over
+        ZoneAttempt.objects.update(entry_time=timezone.now() - timedelta(minutes=10))
+        self.done = self.attempts[0]
+        self.done.end_attempt(status="COMPLETED")
+        rebuild_leaderboard()
+
+    def test_one_update_ends_only_active_rows(self):
+        zone = self.zones[0]
+        with CaptureQueriesContext(connection) as ctx:
+            ended = ZoneAttempt.objects.filter(zone=zone).end_attempts("FORCED_EXIT")
+        statements = [q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("UPDATE"))
+
+        expected = {a.id for a in self.attempts if a.zone_id == zone.id and a != self.done}
+        self.assertEqual(set(ended), expected)
+        for attempt in ZoneAttempt.objects.filter(id__in=ended):
+            self.assertEqual(attempt.status, "FORCED_EXIT")
+            self.assertIn(attempt.duration_seconds, (600, 601))
+            self.assertEqual(attempt.time_taken_seconds, int((attempt.exit_time - attempt.entry_time).total_seconds()))
+        self.assertEqual(ZoneAttempt.objects.get(id=self.done.id).status, "COMPLETED")
+        self.assertEqual(ZoneAttempt.objects.filter(zone=self.zones[1], status="ACTIVE").count(), 4)
+
+        # Nothing left to end
+        self.assertEqual(ZoneAttempt.objects.filter(zone=zone).end_attempts("FORCED_EXIT"), [])
+
+    def test_fallback_without_update_returning(self):
+        zone = self.zones[0]
+        with mock.patch("app.models.supports_update_returning", return_value=False):
+            ended = ZoneAttempt.objects.filter(zone=zone).end_attempts("FORCED_EXIT")
+
+        expected = {a.id for a in self.attempts if a.zone_id == zone.id and a != self.done}
+        self.assertEqual(set(ended), expected)
+        for status, duration_seconds in ZoneAttempt.objects.filter(id__in=ended).values_list("status", "duration_seconds"):
+            self.assertEqual(status, "FORCED_EXIT")
+            self.assertIn(duration_seconds, (600, 601))
+
+    def test_update_returning_needs_sqlite_3_35(self):
+        sqlite = mock.Mock(vendor="sqlite")
+        with mock.patch("app.db.sqlite3.sqlite_version_info", (3, 34, 1)):
+            self.assertFalse(supports_update_returning(sqlite))
+        with mock.patch("app.db.sqlite3.sqlite_version_info", (3, 35, 0)):
+            self.assertTrue(supports_update_returning(sqlite))
+        self.assertTrue(supports_update_returning(mock.Mock(vendor="postgresql")))
+        self.assertFalse(supports_update_returning(mock.Mock(vendor="mysql")))
+
+    def test_completed_adds_time_and_invalidates_once(self):
+        (alpha, _), (bravo, _) = self.teams
+        before = dict(LeaderboardEntry.objects.values_list("team_id", "total_time_seconds"))
+
+        with mock.patch("app.team_state.invalidate") as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                ended = ZoneAttempt.objects.filter(team=alpha).end_attempts("COMPLETED")
+        self.assertEqual(len(ended), 3)
+        invalidate.assert_called_once_with(alpha.id)
+
+        after = dict(LeaderboardEntry.objects.values_list("team_id", "total_time_seconds"))
+        added = sum(ZoneAttempt.objects.filter(id__in=ended).values_list("duration_seconds", flat=True))
+        self.assertEqual(after[alpha.id], before[alpha.id] + added)
+        self.assertEqual(after[bravo.id], before[bravo.id])
+        self.assertEqual(after, dict(Score.objects.with_totals().values_list("team_id", "total_time_seconds")))
+
+    def test_logout_force_exits_the_team(self):
+        (alpha, _), (bravo, _) = self.teams
+        self.client.force_login(alpha.user)
+        self.client.post("/logout/")
+
+        self.assertFalse(ZoneAttempt.objects.filter(team=alpha, status="ACTIVE").exists())
+        self.assertEqual(ZoneAttempt.objects.filter(team=bravo, status="ACTIVE").count(), 4)
+
+    def test_admin_action(self):
+        self.client.force_login(User.objects.create_superuser("admin_attempts", password="x"))
+        zone = self.zones[1]
+        response = self.client.post(
+            f"/admin/app/zoneattempt/?zone__id__exact={zone.id}",
+            {"action": "force_exit_attempts", "select_across": "1", "index": "0",
+             "_selected_action": [a.id for a in self.attempts if a.zone_id == zone.id]},
+            follow=True,
+        )
+
+        self.assertContains(response, "Force-exited 4 active attempt(s).")
+        self.assertFalse(ZoneAttempt.objects.filter(zone=zone, status="ACTIVE").exists())
+        self.assertEqual(ZoneAttempt.objects.filter(zone=self.zones[0], status="ACTIVE").count(), 3)
+
+
+# -------------------------
+# METRICS EXPORT
+# -------------------------
+class MetricsTests(TestCase):
+    TOKEN = "scrape-token"
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        self.enterContext(override_settings(PORTAL_METRICS_DIR=self.dir, PORTAL_METRICS_TOKEN=self.TOKEN))
+        # A fresh registry for this process, so other tests' traffic doesn't count
+        self.enterContext(mock.patch.object(metrics, "registry", metrics.Registry()))
+
+    def write_snapshot(self, pid, age=0, counters=(), histograms=(), sse_clients=0, pollers=()):
+        with open(os.path.join(self.dir, f"{pid}.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "written_at": time.time() - age,
+                "counters": list(counters),
+                "histograms": list(histograms),
+                "sse_clients": sse_clients,
+                "pollers": list(pollers),
+            }, file)
+
+    def test_token_or_staff_only(self):
+        team, _ = make_team("Alpha")
+        staff = User.objects.create_user("ops", password="x", is_staff=True)
+
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        self.assertEqual(self.client.get("/metrics/", headers={"authorization": "Bearer wrong"}).status_code, 403)
+        self.assertEqual(self.client.get("/metrics/", headers={"authorization": self.TOKEN}).status_code, 403)
+
+        response = self.client.get("/metrics/", headers={"authorization": f"Bearer {self.TOKEN}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+
+        self.client.force_login(team.user)
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+    def test_no_token_configured_means_staff_only(self):
+        with override_settings(PORTAL_METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics/", headers={"authorization": "Bearer "}).status_code, 403)
+
+    def test_snapshots_are_summed_across_workers(self):
+        requests = ["portal_requests_total", [["method", "GET"], ["status", "200"], ["view", "zones"]]]
+        latency = ["portal_request_duration_seconds", [["view", "zones"]]]
+        buckets = len(metrics.LATENCY_BUCKETS) + 1
+
+        self.write_snapshot(
+            1, counters=[[*requests, 3.0]], histograms=[[*latency, [2] + [0] * (buckets - 1) + [0.004]]],
+            sse_clients=2, pollers=["a", "b"],
+        )
+        # Exited a while ago: its counters still count, its gauges don't
+        self.write_snapshot(
+            2, age=metrics.STALE_SECONDS + 1, counters=[[*requests, 4.0]],
+            histograms=[[*latency, [0, 1] + [0] * (buckets - 2) + [0.008]]],
+            sse_clients=5, pollers=["c"],
+        )
+        # Long gone: dropped, and its file removed
+        self.write_snapshot(3, age=metrics.RETENTION_SECONDS + 1, counters=[[*requests, 100.0]], sse_clients=9)
+
+        counters, histograms, gauges = metrics.collect()
+
+        self.assertEqual(counters[("portal_requests_total", (("method", "GET"), ("status", "200"), ("view", "zones")))], 7.0)
+        merged = histograms[("portal_request_duration_seconds", (("view", "zones"),))]
+        self.assertEqual(merged[:2], [2, 1])
+        self.assertAlmostEqual(merged[-1], 0.012)
+        self.assertEqual(gauges[("portal_sse_clients", ())], 2)
+        self.assertEqual(gauges[("portal_leaderboard_pollers", ())], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "3.json")))
+        # This process wrote its own snapshot first
+        self.assertTrue(os.path.exists(os.path.join(self.dir, f"{os.getpid()}.json")))
+
+    def test_prometheus_text_format(self):
+        buckets = len(metrics.LATENCY_BUCKETS) + 1
+        self.write_snapshot(1, counters=[
+            ["portal_requests_total", [["method", "GET"], ["status", "200"], ["view", 'say "hi"']], 2.0],
+        ], histograms=[
+            ["portal_request_duration_seconds", [["view", "zones"]], [1, 2] + [0] * (buckets - 3) + [1, 3.5]],
+        ])
+        Zone.objects.create(title="Zone 1")
+
+        lines = metrics.render().splitlines()
+
+        for expected in [
+            "# HELP portal_requests_total Requests by URL name, method and status",
+            "# TYPE portal_requests_total counter",
+            'portal_requests_total{method="GET",status="200",view="say \\"hi\\""} 2.0',
+            "# TYPE portal_request_duration_seconds histogram",
+            'portal_request_duration_seconds_bucket{view="zones",le="0.005"} 1',
+            'portal_request_duration_seconds_bucket{view="zones",le="0.01"} 3',
+            'portal_request_duration_seconds_bucket{view="zones",le="+Inf"} 4',
+            'portal_request_duration_seconds_sum{view="zones"} 3.5',
+            'portal_request_duration_seconds_count{view="zones"} 4',
+            "# TYPE portal_sse_clients gauge",
+            'portal_zone_attempts{status="ACTIVE"} 0',
+            "portal_team_sessions 0",
+        ]:
+            self.assertIn(expected, lines)
+
+    def test_path_has_a_trailing_slash(self):
+        response = self.client.get("/metrics", headers={"authorization": f"Bearer {self.TOKEN}"})
+        self.assertRedirects(response, "/metrics/", status_code=301, fetch_redirect_response=False)
+
+
+# -------------------------
+# CACHE CONFIG
+# -------------------------
+class CacheSettingsTests(SimpleTestCase):
+    def test_tests_never_touch_the_file_cache(self):
+        self.assertIsInstance(caches["default"], LocMemCache)
+
+    def test_file_cache_is_sized_for_an_event(self):
+        options = project_settings.CACHES["default"]["OPTIONS"]
+        self.assertGreaterEqual(options["MAX_ENTRIES"], 10_000)
+        self.assertGreaterEqual(options["CULL_FREQUENCY"], 4)   # never clear it all (0)
+
+
+# -------------------------
+# LOCK RETRY
+# -------------------------
+@override_settings(PORTAL_DB_LOCK_RETRIES=3)
+class RetryOnLockTests(SimpleTestCase):
+    def flaky(self, failures, message="database is locked"):
+        calls = []
+
+        @retry_on_lock
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return "written"
+
+        return write, calls
+
+    def test_retries_lock_errors_then_succeeds(self):
+        write, calls = self.flaky(failures=2)
+        self.assertEqual(write(), "written")
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_the_retry_budget(self):
+        write, calls = self.flaky(failures=10)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 4)
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.flaky(failures=1, message="no such table: app_zone")
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
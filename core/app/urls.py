@@ -1,15 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Read-heavy pages run natively async under ASGI unless switched off
+hot = async_views if settings.PORTAL_ASYNC_VIEWS else views
 
 urlpatterns = [
     path("", views.index, name="index"),
-    path("zones/", views.zones_view, name="zones"),
+    path("zones/", hot.zones_view, name="zones"),
     path("enter_zone/", views.enter_zone, name="enter_zone"),
-    path("zone/<int:zone_id>/play/", views.zone_play, name="zone_play"),
+    path("zone/<int:zone_id>/play/", hot.zone_play, name="zone_play"),
+    path("zone/<int:zone_id>/content/", hot.zone_content_part, name="zone_content_part"),
+    path("zone/<int:zone_id>/files/<path:name>", hot.zone_asset, name="zone_asset"),
     path("zone/<int:zone_id>/submit/", views.submit_zone, name="submit_zone"),
     path("login/", views.team_login, name="team_login"),
     path("logout/", views.team_logout, name="logout"),
-    path("leaderboard/", views.leaderboard_view, name="leaderboard"),
-    path("leaderboard/data/", views.leaderboard_data_api, name="leaderboard_data_api"),
+    path("leaderboard/", hot.leaderboard_view, name="leaderboard"),
+    path("leaderboard/data/", hot.leaderboard_data_api, name="leaderboard_data_api"),
+    path("leaderboard/me/", hot.leaderboard_me_api, name="leaderboard_me_api"),
+    path("leaderboard/timeline/", views.leaderboard_timeline_api, name="leaderboard_timeline_api"),
+    path("leaderboard/stream/", views.leaderboard_stream, name="leaderboard_stream"),
+    path("metrics/", views.metrics_view, name="metrics"),
 
-]
\ No newline at end of file
+]
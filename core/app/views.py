@@ -1,26 +1,38 @@
-from datetime import timedelta
+import hashlib
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseForbidden, JsonResponse
-from django.contrib.auth import authenticate, login, logout
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.contrib.auth import SESSION_KEY, authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.utils import timezone
-from django.db import transaction
+from django.contrib.messages import get_messages
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
+from django.db import IntegrityError, transaction
 from collections import defaultdict
 from django.utils.timezone import make_naive
 
+from . import metrics, zone_assets
+from .events import leaderboard_events, parse_last_event_id
+from .leaderboard import (
+    current_version,
+    format_time_display,
+    serialize_entry,
+    timeline_points,
+)
 from .models import (
-    TeamSession,
-    Zone,
-    ZoneAttemptAccess,
+    LeaderboardEntry,
     ZoneAttempt,
-    ZoneContent,
     Player,
-    Score,
 )
+from .db import retry_on_lock
+from .session_backend import count_live_sessions, heartbeats, track_session
+from .team_state import get_team_state, team_id_for_user
+from .zone_cache import get_zone, get_zone_content, get_zones
 
 from django.utils.timezone import make_naive
-from django.db.models import Prefetch
-from .models import Score, ZoneAttempt
+from django.db.models import Prefetch, Q
 
 
 
@@ -45,42 +57,37 @@ def team_login(request):
         if user is None:
             return render(request, "login.html", {"error": "Invalid credentials"})
 
-        # cleanup stale sessions
-        cutoff = timezone.now() - timedelta(minutes=SESSION_IDLE_MINUTES)
-        TeamSession.objects.filter(last_seen_at__lt=cutoff).delete()
-
-        with transaction.atomic():
-            active_sessions = (
-                TeamSession.objects
-                .select_for_update()
-                .filter(user=user)
-                .count()
-            )
-
-            if active_sessions >= MAX_SESSIONS:
-                return HttpResponseForbidden("Maximum sessions reached")
+        # Write buffered heartbeats first so active sessions aren't
+        # mistaken for idle ones by the cleanup
+        heartbeats.flush()
+        if not login_within_limit(request, user):
+            return HttpResponseForbidden("Maximum sessions reached")
 
-            login(request, user)
+        return redirect("index")
 
-            if not request.session.session_key:
-                request.session.save()
+    return render(request, "login.html")
 
-            TeamSession.objects.get_or_create(
-                session_key=request.session.session_key,
-                defaults={"user": user},
-            )
 
-        return redirect("index")
+@retry_on_lock
+def login_within_limit(request, user):
+    """
+    Log in unless the team already has MAX_SESSIONS live sessions. The
+    count and the new TeamSession row share one locked transaction, so
+    concurrent logins can't both take the last slot. (A cached counter
+    would skip the COUNT but drifts under concurrent logins and expiry.)
+    """
+    with transaction.atomic():
+        if count_live_sessions(user.id, SESSION_IDLE_MINUTES) >= MAX_SESSIONS:
+            return False
 
-    return render(request, "login.html")
+        login(request, user)   # cycles (and saves) the session key
+        track_session(request.session, user.id, request.session.session_key)
+    return True
 
 
 @login_required(login_url="/login/")
 def team_logout(request):
-    TeamSession.objects.filter(
-        session_key=request.session.session_key
-    ).delete()
-
+    # Session engine drops the TeamSession row when the session is flushed
     logout(request)
     return redirect("team_login")
 
@@ -105,60 +112,16 @@ def index(request):
 # -------------------------
 @login_required(login_url="/login/")
 def zones_view(request):
-    team = request.user.team
-    zones = Zone.objects.all()
-    print(f"DEBUG: Found {zones.count()} zones for team {team.name}")
-
-    # 1️⃣ Game state
-    attempts = (
-        ZoneAttempt.objects
-        .filter(team=team)
-        .select_related("zone")
-    )
-
-    attempts_by_zone = {}
-    for attempt in attempts:
-        attempts_by_zone.setdefault(attempt.zone_id, []).append(attempt)
-
-    # 2️⃣ Access state (ONLY UNUSED)
-    access_by_zone = (
-        ZoneAttemptAccess.objects
-        .filter(team=team, is_used=False)
-        .values_list("zone_id", flat=True)
-    )
-    access_zone_ids = set(access_by_zone)
-
-    score_obj = getattr(team, "score", None)
-
-    for zone in zones:
-        zone_attempts = attempts_by_zone.get(zone.id, [])
-
-        zone.has_active = any(a.status == "ACTIVE" for a in zone_attempts)
-        zone.has_completed = any(a.status == "COMPLETED" for a in zone_attempts)
-
-        zone.has_access = zone.id in access_zone_ids
-
-        # SCORE
-        if score_obj:
-            zone.score = getattr(score_obj, f"zone{zone.id}", 0)
-        else:
-            zone.score = 0
+    # Per-team state is cached and dropped on that team's changes
+    # (see team_state.py), so a refresh normally touches only the cache
+    team_id = team_id_for_user(request.user.id)
+    zones = get_team_state(team_id).apply(get_zones())
 
-        # 🔐 ENTRY PERMISSION (THIS IS THE FIX)
-        if zone.has_active:
-            zone.can_enter = True
-        elif zone.has_completed:
-            zone.can_enter = zone.has_access
-        else:
-            zone.can_enter = zone.has_access
-
-    print(f"DEBUG: Passing {len(zones)} zones to template")
-    for z in zones:
-        print(f"  Zone {z.id}: {z.title} - Active:{getattr(z, 'has_active', None)} Completed:{getattr(z, 'has_completed', None)} CanEnter:{getattr(z, 'can_enter', None)}")
-    
     return render(request, "zones.html", {
         "zones": zones,
-    })
+    }, using=settings.PORTAL_HOT_TEMPLATES)
+
+
 # -------------------------
 # PLAYER ENTRY (ATTEMPT CODE AUTH)
 # -------------------------
@@ -177,40 +140,25 @@ def enter_zone(request):
                 "error": "Attempt code is required"
             })
 
+        # Claim the code and create the attempt atomically: two tabs
+        # redeeming the same code can't both get in.
         try:
-            access = ZoneAttemptAccess.objects.select_related(
-                "team", "zone", "player"
-            ).get(attempt_code=attempt_code, is_used=False)
-        except ZoneAttemptAccess.DoesNotExist:
+            attempt = ZoneAttempt.start(attempt_code)
+        except IntegrityError:
+            # Block re-attempt by same player (unique player/zone)
             return render(request, "enter_zone.html", {
-                "error": "Invalid or already used attempt code"
+                "error": "This player has already attempted this zone"
             })
 
-        # Block re-attempt by same player
-        if ZoneAttempt.objects.filter(
-            player=access.player,
-            zone=access.zone
-        ).exists():
+        if attempt is None:
             return render(request, "enter_zone.html", {
-                "error": "This player has already attempted this zone"
+                "error": "Invalid or already used attempt code"
             })
 
-        # Create attempt
-        attempt = ZoneAttempt.objects.create(
-            team=access.team,
-            zone=access.zone,
-            player=access.player,
-            access=access
-        )
-
-        # Burn code
-        access.is_used = True
-        access.save(update_fields=["is_used"])
-
         # Store attempt in session (player identity)
         request.session["active_attempt_id"] = attempt.id
 
-        return redirect("zone_play", zone_id=attempt.zone.id)
+        return redirect("zone_play", zone_id=attempt.zone_id)
 
     return render(request, "enter_zone.html")
 
@@ -218,32 +166,137 @@ def enter_zone(request):
 # -------------------------
 # ZONE PLAY (PLAYER VIEW)
 # -------------------------
+# The briefing is rendered once on save (ZoneContent.html, app/content.py).
+# Its first part is inlined; the rest is fetched by the page from
+# zone_content_part. Both answer reloads with 304 Not Modified.
+
+def zone_play_etag(request, attempt, zone, zone_content):
+    """
+    Covers everything zone_play.html shows, including the CSRF secret
+    behind the form's token. None while flash messages are pending
+    (they are shown once).
+    """
+    if len(get_messages(request)):
+        return None
+    shown = (
+        attempt.id, attempt.entry_time.isoformat(), attempt.player.name, attempt.player.role,
+        zone.title, zone_content.content_hash, request.META.get("CSRF_COOKIE", ""),
+    )
+    return '"zp-' + hashlib.blake2b(repr(shown).encode(), digest_size=12).hexdigest() + '"'
+
+
+def zone_play_context(attempt, zone, zone_content):
+    return {
+        "attempt": attempt,
+        "zone": zone,
+        "player": attempt.player,
+        "role": attempt.player.role,
+        "content": zone_content.part(0),
+        "content_parts": zone_content.part_count,
+        "exit_code": zone_content.exit_code or "",
+    }
+
+
+def not_modified_or_none(request, etag, updated_at):
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=int(updated_at.timestamp()))
+
+
+def revalidated(response, etag, updated_at):
+    """
+    Validators for a private page: the browser keeps it but asks first.
+    """
+    if etag is not None:
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(updated_at.timestamp())
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def parse_part(request):
+    try:
+        return int(request.GET.get("part", 0))
+    except ValueError:
+        return None
+
+
+def zone_part_etag(zone_content, part):
+    return f'"zc-{zone_content.content_hash[:24]}-{part}"'
+
+
 def zone_play(request, zone_id):
     attempt_id = request.session.get("active_attempt_id")
     if not attempt_id:
         return redirect("enter_zone")
 
     attempt = get_object_or_404(
-        ZoneAttempt,
+        ZoneAttempt.objects.select_related("player"),
         id=attempt_id,
         zone_id=zone_id,
         status="ACTIVE"
     )
 
-    zone_content = get_object_or_404(
-        ZoneContent,
-        zone=attempt.zone,
-        role=attempt.player.role
+    zone = get_zone(attempt.zone_id)
+    zone_content = get_zone_content(attempt.zone_id, attempt.player.role)
+    if zone is None or zone_content is None:
+        raise Http404("No zone content for this role")
+
+    etag = zone_play_etag(request, attempt, zone, zone_content)
+    not_modified = not_modified_or_none(request, etag, zone_content.updated_at)
+    if not_modified is not None:
+        return not_modified
+
+    response = render(
+        request, "zone_play.html", zone_play_context(attempt, zone, zone_content),
+        using=settings.PORTAL_HOT_TEMPLATES,
     )
+    return revalidated(response, etag, zone_content.updated_at)
+
+
+def active_attempt(request, zone_id):
+    """
+    The session's ACTIVE attempt in this zone (with its player), or None.
+    """
+    return (
+        ZoneAttempt.objects.select_related("player")
+        .filter(id=request.session.get("active_attempt_id"), zone_id=zone_id, status="ACTIVE")
+        .first()
+    )
+
+
+def zone_content_part(request, zone_id):
+    """
+    ?part=N of the active attempt's briefing, as an HTML fragment.
+    """
+    attempt = active_attempt(request, zone_id)
+    if attempt is None:
+        return HttpResponseForbidden("No active attempt in this zone")
+
+    zone_content = get_zone_content(zone_id, attempt.player.role)
+    part = parse_part(request)
+    if zone_content is None or part is None or not 0 <= part < zone_content.part_count:
+        raise Http404("No such part")
+
+    etag = zone_part_etag(zone_content, part)
+    not_modified = not_modified_or_none(request, etag, zone_content.updated_at)
+    if not_modified is not None:
+        return not_modified
+
+    response = HttpResponse(zone_content.part(part), content_type="text/html; charset=utf-8")
+    return revalidated(response, etag, zone_content.updated_at)
+
+
+def zone_asset(request, zone_id, name):
+    """
+    A zone's challenge file (MEDIA_ROOT/zone<id>/<name>), for players in
+    the zone only. See app/zone_assets.py.
+    """
+    if active_attempt(request, zone_id) is None:
+        return HttpResponseForbidden("No active attempt in this zone")
+    return zone_assets.serve(request, zone_id, name)
+
 
-    return render(request, "zone_play.html", {
-        "attempt": attempt,
-        "zone": attempt.zone,
-        "player": attempt.player,
-        "role": attempt.player.role,
-        "content": zone_content.content,
-        "exit_code": zone_content.exit_code or "",
-    })
 # -------------------------
 # SUBMIT ZONE (PLAYER)
 # -------------------------
@@ -258,6 +311,7 @@ def submit_zone(request, zone_id):
             zone_id=zone_id,
             status="ACTIVE"
         )
+        .select_related("player")
         .order_by("-entry_time")  # ✅ correct field
         .first()
     )
@@ -266,10 +320,7 @@ def submit_zone(request, zone_id):
         return redirect("zones")
 
     # Validate exit code
-    zone_content = ZoneContent.objects.filter(
-        zone=attempt.zone,
-        role=attempt.player.role
-    ).first()
+    zone_content = get_zone_content(attempt.zone_id, attempt.player.role)
 
     if zone_content and zone_content.exit_code:
         submitted_exit_code = request.POST.get("exit_code", "").strip()
@@ -294,68 +345,48 @@ from django.utils.timezone import make_naive
 
 
 def leaderboard_view(request):
-    scores = Score.objects.select_related("team").all()
-
     # -----------------------
-    # Leaderboard Data
+    # Leaderboard Data (materialized, already ranked)
     # -----------------------
-    leaderboard_data = []
-
-    for score in scores:
-        total_time = score.get_total_time_seconds()
+    entries = LeaderboardEntry.objects.select_related("team").order_by("rank", "team_id")
 
-        leaderboard_data.append({
-            "score": score,
-            "total_time_seconds": total_time,  # used only for display
-            "total_time_display": format_time_display(total_time),
-        })
+    leaderboard = leaderboard_context_rows(entries)
 
     # -----------------------
-    # Leaderboard Sorting
+    # Timeline Graph Data (append-only score history)
     # -----------------------
-    # 1️⃣ Total DESC
-    # 2️⃣ Credit DESC
-    leaderboard = sorted(
-        leaderboard_data,
-        key=lambda x: (
-            -x["score"].total,
-            -x["score"].credit,
-        ),
-    )
+    timeline_last_id, points = timeline_points()
+    graph_data = build_graph_data(points)
 
-    # -----------------------
-    # Timeline Graph Data
-    # -----------------------
-
-    attempts = (
-        ZoneAttempt.objects
-        .filter(status="COMPLETED", exit_time__isnull=False)
-        .select_related("team", "zone")
-        .order_by("exit_time")
-    )
-
-    team_progress = defaultdict(list)
-    team_scores = defaultdict(int)
+    return render(request, "leaderboard.html", {
+        "leaderboard": leaderboard,
+        "graph_data": graph_data,
+        "timeline_last_id": timeline_last_id,
+        "user_team_id": user_team_id(request),
+    }, using=settings.PORTAL_HOT_TEMPLATES)
 
-    for attempt in attempts:
-        team = attempt.team
-        team_name = team.name
 
-        score_obj = getattr(team, "score", None)
-        if not score_obj:
-            continue
+def user_team_id(request):
+    if not request.user.is_authenticated:
+        return None
+    return team_id_for_user(request.user.id)
 
-        zone_field = f"zone{attempt.zone.id}"
-        zone_points = getattr(score_obj, zone_field, 0)
+def leaderboard_context_rows(entries):
+    return [
+        {
+            "entry": entry,
+            "total_time_display": format_time_display(entry.total_time_seconds),
+        }
+        for entry in entries
+    ]
 
-        team_scores[team_name] += zone_points
 
-        team_progress[team_name].append({
-            "x": make_naive(attempt.exit_time).isoformat(),
-            "y": team_scores[team_name],
-        })
+def build_graph_data(points):
+    team_progress = defaultdict(list)
+    for point in points:
+        team_progress[point["team"]].append({"x": point["x"], "y": point["y"]})
 
-    graph_data = [
+    return [
         {
             "label": team,
             "data": data,
@@ -363,49 +394,242 @@ def leaderboard_view(request):
         for team, data in team_progress.items()
     ]
 
-    return render(request, "leaderboard.html", {
-        "leaderboard": leaderboard,
-        "graph_data": graph_data,
-    })
 
-def format_time_display(seconds):
-    """Format seconds into MM:SS or HH:MM:SS"""
-    if seconds == 0:
-        return "--:--"
-    
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    secs = seconds % 60
-    
-    if hours > 0:
-        return f"{hours}:{minutes:02d}:{secs:02d}"
-    return f"{minutes}:{secs:02d}"
+def leaderboard_payload(entries, version, full, user_team_id, next_cursor=None):
+    return {
+        "version": version,
+        "full": full,
+        "leaderboard": [
+            {
+                **serialize_entry(entry),
+                "is_you": entry.team_id == user_team_id,
+            }
+            for entry in entries
+        ],
+        # ?after= value for the next page (None on the last page / unpaged)
+        "next": next_cursor,
+    }
+
+
+# -------------------------------------
+# KEYSET PAGINATION (?limit=&after=)
+# -------------------------------------
+# Pages walk the (rank, team_id) order, which the index on those columns
+# serves directly: no OFFSET, and a page costs the same anywhere in the list.
+LEADERBOARD_MAX_LIMIT = 200
+LEADERBOARD_MAX_NEIGHBOURS = 10
+
+
+def parse_page(request):
+    """
+    (limit, after) from ?limit=N&after=<rank>.<team_id>; None if absent or invalid.
+    """
+    try:
+        limit = min(max(int(request.GET["limit"]), 1), LEADERBOARD_MAX_LIMIT)
+    except (KeyError, ValueError):
+        limit = None
+
+    try:
+        rank, team_id = request.GET["after"].split(".")
+        after = (int(rank), int(team_id))
+    except (KeyError, ValueError):
+        after = None
+
+    return limit, after
+
+
+def ranked_after(rank, team_id):
+    return Q(rank__gt=rank) | Q(rank=rank, team_id__gt=team_id)
+
+
+def ranked_before(rank, team_id):
+    return Q(rank__lt=rank) | Q(rank=rank, team_id__lt=team_id)
+
+
+def page_entries(entries, limit, after):
+    if after is not None:
+        entries = entries.filter(ranked_after(*after))
+    if limit is not None:
+        entries = entries[:limit + 1]   # one extra row tells if there's a next page
+    return entries
+
+
+def page_cursor(entries, limit):
+    """
+    Drop the look-ahead row; returns (entries, next cursor or None).
+    """
+    if limit is None or len(entries) <= limit:
+        return entries, None
+    entries = entries[:limit]
+    return entries, f"{entries[-1].rank}.{entries[-1].team_id}"
+
+
+def parse_neighbours(request, default=2):
+    try:
+        return min(max(int(request.GET["neighbours"]), 0), LEADERBOARD_MAX_NEIGHBOURS)
+    except (KeyError, ValueError):
+        return default
+
+
+def neighbour_querysets(entry, count):
+    """
+    The `count` rows ranked right above and right below `entry`
+    (above comes back nearest-first; reverse it for display).
+    """
+    entries = LeaderboardEntry.objects.select_related("team")
+    above = entries.filter(ranked_before(entry.rank, entry.team_id)).order_by("-rank", "-team_id")[:count]
+    below = entries.filter(ranked_after(entry.rank, entry.team_id)).order_by("rank", "team_id")[:count]
+    return above, below
+
+
+def my_rank_payload(entry, above, below, teams, version):
+    return {
+        "version": version,
+        "teams": teams,
+        "you": {**serialize_entry(entry), "is_you": True},
+        "above": [{**serialize_entry(e), "is_you": False} for e in reversed(above)],
+        "below": [{**serialize_entry(e), "is_you": False} for e in below],
+    }
+
+
+def parse_since(request):
+    try:
+        return int(request.GET["since"])
+    except (KeyError, ValueError):
+        return None
+
+
+# -------------------------------------
+# LEADERBOARD JSON (shared by both twins)
+# -------------------------------------
+# The sync views below and their async twins differ only in data access:
+# the ETag, the row selection and the response are built here.
+def leaderboard_etag(request, version, user_id):
+    """
+    Version + viewer (is_you differs per team) + the normalized query, so
+    a page or a ?since= delta is never revalidated against another one.
+    No ORM work: the version comes from the cache, the user id from the
+    session.
+    """
+    limit, after = parse_page(request)
+    query = (
+        limit,
+        after and f"{after[0]}.{after[1]}",
+        parse_since(request),
+        parse_neighbours(request, default=None),
+    )
+    return quote_etag("-".join(
+        ["lb", str(version), str(user_id), *("" if value is None else str(value) for value in query)]
+    ))
+
+
+def leaderboard_entries(request, version):
+    """
+    (rows for ?since= and ?limit=&after=, full, limit). ?since=<version>
+    selects only rows changed after it; absent or unknown, the full list.
+    """
+    since = parse_since(request)
+    entries = LeaderboardEntry.objects.select_related("team").order_by("rank", "team_id")
+
+    full = since is None or since > version
+    if not full:
+        entries = entries.filter(version__gt=since)
+
+    limit, after = parse_page(request)
+    return page_entries(entries, limit, after), full, limit
+
+
+def my_entry(team_id):
+    return LeaderboardEntry.objects.select_related("team").filter(team_id=team_id)
+
+
+def leaderboard_json(payload, etag):
+    response = JsonResponse(payload)
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    return response
 
 
 def leaderboard_data_api(request):
-    scores = Score.objects.select_related("team").all()
+    version = current_version()
+    etag = leaderboard_etag(request, version, request.session.get(SESSION_KEY, 0))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
 
-    user_team = None
-    if request.user.is_authenticated:
-        user_team = getattr(request.user, "team", None)
+    entries, full, limit = leaderboard_entries(request, version)
+    entries, next_cursor = page_cursor(list(entries), limit)
 
-    leaderboard_data = []
+    return leaderboard_json(leaderboard_payload(entries, version, full, user_team_id(request), next_cursor), etag)
 
-    for score in scores:
-        total_time = score.get_total_time_seconds()
 
-        leaderboard_data.append({
-            "team": score.team.name,
-            "total": score.total,
-            "credit": score.credit,
-            "time": format_time_display(total_time),
-            "is_you": user_team == score.team if user_team else False,
-        })
+def leaderboard_me_api(request):
+    """
+    The caller's row plus ?neighbours=N (default 2) teams above and
+    below it. Index range scans only; the field is never loaded whole.
+    """
+    version = current_version()
+    etag = leaderboard_etag(request, version, request.session.get(SESSION_KEY, 0))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    team_id = user_team_id(request)
+    entry = my_entry(team_id).first() if team_id else None
+    if entry is None:
+        return HttpResponseForbidden("Team login required")
+
+    above, below = neighbour_querysets(entry, parse_neighbours(request))
+    teams = LeaderboardEntry.objects.count()
+
+    return leaderboard_json(my_rank_payload(entry, list(above), list(below), teams, version), etag)
+
 
-    leaderboard = sorted(
-        leaderboard_data,
-        key=lambda x: (-x["total"], -x["credit"]),
+def leaderboard_timeline_api(request):
+    """
+    New timeline points after ?since=<event id> (all points if omitted).
+    """
+    last_id, points = timeline_points(parse_since(request))
+    return JsonResponse({"last_id": last_id, "points": points})
+
+
+async def leaderboard_stream(request):
+    """
+    Server-Sent Events feed of leaderboard deltas.
+    Needs an ASGI server (see core/asgi.py); each client holds one connection.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would buffer the endless stream and pin a worker
+        # thread per viewer. 204 tells EventSource to stop; the page polls.
+        return HttpResponse(status=204)
+
+    last_event_id = parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
     )
 
-    return JsonResponse({"leaderboard": leaderboard})
+    response = StreamingHttpResponse(
+        leaderboard_events.stream(last_event_id),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # disable proxy buffering (nginx)
+    return response
+
+
+# -------------------------------------
+# METRICS (PROMETHEUS SCRAPE)
+# -------------------------------------
+def metrics_view(request):
+    """
+    Prometheus text format, summed over all worker processes.
+    Scrapers send "Authorization: Bearer <PORTAL_METRICS_TOKEN>";
+    staff can also open it in the browser.
+    """
+    token = settings.PORTAL_METRICS_TOKEN
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    )
+    if not authorized:
+        return HttpResponseForbidden("Forbidden")
 
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
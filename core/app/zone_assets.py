@@ -0,0 +1,213 @@
+"""
+Zone challenge files (MEDIA_ROOT/zone<id>/...), served only to a player
+whose session has an ACTIVE attempt in that zone.
+
+Files are streamed from disk (never read whole), with strong ETags,
+single byte ranges and precompressed .br/.gz siblings. With
+PORTAL_SENDFILE set, the front server sends the file instead
+(X-Accel-Redirect for nginx, X-Sendfile for Apache/lighttpd); it then
+also handles ranges itself.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+ZONE_DIR = "zone{zone_id}"
+BLOCK_SIZE = 64 * 1024
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))   # preferred first
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class Asset:
+    """
+    One representation of a file on disk (identity, br or gzip).
+    """
+
+    def __init__(self, path, stat_result, encoding=None):
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime = stat_result.st_mtime
+        self.encoding = encoding
+        # Strong: changes with any write to the file (size, mtime, inode),
+        # and differs per encoding, so ranges never mix representations
+        self.etag = quote_etag(
+            f"{encoding or 'id'}-{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+        )
+
+
+def _stat_file(path):
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
+
+
+def accepted_encodings(request):
+    """
+    Codings in Accept-Encoding, minus any sent with q=0.
+    """
+    accepted = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def find_asset(zone_id, name, accepted=()):
+    """
+    The file to send for zone_id/name, or raise Http404. A .br/.gz
+    sibling wins when the client accepts it.
+    """
+    try:
+        path = safe_join(settings.MEDIA_ROOT, ZONE_DIR.format(zone_id=zone_id), name)
+    except SuspiciousFileOperation:
+        raise Http404("No such file")
+
+    stat_result = _stat_file(path)
+    if stat_result is None:
+        raise Http404("No such file")
+
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted:
+            sibling = _stat_file(path + suffix)
+            if sibling is not None:
+                return Asset(path + suffix, sibling, encoding)
+    return Asset(path, stat_result)
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the
+    whole file (no header, or several ranges), or "unsatisfiable".
+    """
+    match = RANGE.match(header.replace(" ", ""))
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None   # invalid: ignore the header
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, end
+
+
+class RangeFile:
+    """
+    Reads at most `length` bytes from an open file. No fileno(): a WSGI
+    file_wrapper would otherwise sendfile() the whole file.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _content_type(name):
+    content_type, _ = mimetypes.guess_type(name)
+    if content_type is None:
+        return "application/octet-stream"
+    if content_type.startswith("text/"):
+        return f"{content_type}; charset=utf-8"
+    return content_type
+
+
+def _requested_range(request, asset):
+    # If-Range: the range is only valid against the representation it
+    # came from; otherwise send the whole (new) file
+    if_range = request.headers.get("If-Range")
+    if "Range" not in request.headers or (if_range is not None and if_range != asset.etag):
+        return None
+    return parse_range(request.headers["Range"], asset.size)
+
+
+def _sendfile_response(asset, content_type):
+    response = HttpResponse(content_type=content_type)
+    if settings.PORTAL_SENDFILE == "x-accel-redirect":
+        relative = os.path.relpath(asset.path, settings.MEDIA_ROOT).replace(os.sep, "/")
+        response["X-Accel-Redirect"] = settings.PORTAL_SENDFILE_PREFIX + relative
+    else:
+        response["X-Sendfile"] = asset.path
+    return response
+
+
+def _file_response(asset, name, content_type, byte_range):
+    file = open(asset.path, "rb")
+    # filename: Content-Disposition names the file, not its .br/.gz sibling
+    filename = os.path.basename(name)
+    if byte_range is None:
+        response = FileResponse(file, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            RangeFile(file, end - start + 1), status=206, filename=filename, content_type=content_type
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{asset.size}"
+
+    response.block_size = BLOCK_SIZE
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve(request, zone_id, name):
+    """
+    Response for an authorized request (the caller checks the attempt).
+    """
+    sendfile = settings.PORTAL_SENDFILE
+    # The front server negotiates encodings itself when it sends the file
+    asset = find_asset(zone_id, name, () if sendfile else accepted_encodings(request))
+
+    not_modified = get_conditional_response(request, etag=asset.etag, last_modified=int(asset.mtime))
+    if not_modified is not None:
+        return not_modified
+
+    content_type = _content_type(name)
+    if sendfile:
+        response = _sendfile_response(asset, content_type)
+    else:
+        byte_range = _requested_range(request, asset)
+        if byte_range == "unsatisfiable":
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{asset.size}"
+            return response
+        response = _file_response(asset, name, content_type, byte_range)
+
+    response["ETag"] = asset.etag
+    response["Last-Modified"] = http_date(asset.mtime)
+    response["Cache-Control"] = "private, no-cache"
+    response["X-Content-Type-Options"] = "nosniff"
+    if asset.encoding:
+        response["Content-Encoding"] = asset.encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
@@ -0,0 +1,130 @@
+import copy
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Zone, ZoneContent
+
+
+# -------------------------
+# READ-THROUGH ZONE CACHE
+# -------------------------
+# Zones and their role content only change when an admin edits them,
+# so each process keeps them in local memory. A version counter in the
+# shared cache tells every worker when its copy is stale.
+
+VERSION_CACHE_KEY = "zones:version"
+
+_lock = threading.Lock()
+_store = {"version": None, "items": {}}
+
+
+def current_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        # Unique seed so a cleared cache never matches an old local copy
+        cache.add(VERSION_CACHE_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def invalidate():
+    """
+    Drop every process's cached zones (called after admin edits).
+    """
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+
+    with _lock:
+        _store["version"] = None
+        _store["items"] = {}
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
+
+
+_MISS = object()
+
+
+def _lookup(key):
+    version = current_version()
+
+    with _lock:
+        if _store["version"] != version:
+            _store["version"] = version
+            _store["items"] = {}
+            return version, _MISS
+        return version, _store["items"].get(key, _MISS)
+
+
+def _remember(version, key, value):
+    with _lock:
+        if _store["version"] == version:
+            _store["items"][key] = value
+    return value
+
+
+def _cached(key, loader):
+    version, value = _lookup(key)
+    if value is _MISS:
+        value = _remember(version, key, loader())
+    return value
+
+
+async def _acached(key, aloader):
+    version, value = _lookup(key)
+    if value is _MISS:
+        value = _remember(version, key, await aloader())
+    return value
+
+
+# -------------------------
+# LOOKUPS
+# -------------------------
+# Callers get copies: views annotate zones per request (has_active, ...)
+# and must not mutate the shared instances.
+
+def get_zones():
+    zones = _cached("zones", lambda: list(Zone.objects.order_by("id")))
+    return [copy.copy(zone) for zone in zones]
+
+
+def get_zone(zone_id):
+    zone = _cached(("zone", zone_id), lambda: Zone.objects.filter(pk=zone_id).first())
+    return copy.copy(zone) if zone else None
+
+
+def get_zone_content(zone_id, role):
+    content = _cached(
+        ("content", zone_id, role),
+        lambda: ZoneContent.objects.filter(zone_id=zone_id, role=role).first(),
+    )
+    return copy.copy(content) if content else None
+
+
+# Async twins for async views: same cache, async ORM on a miss
+
+async def aget_zones():
+    async def load():
+        return [zone async for zone in Zone.objects.order_by("id")]
+
+    zones = await _acached("zones", load)
+    return [copy.copy(zone) for zone in zones]
+
+
+async def aget_zone(zone_id):
+    zone = await _acached(("zone", zone_id), Zone.objects.filter(pk=zone_id).afirst)
+    return copy.copy(zone) if zone else None
+
+
+async def aget_zone_content(zone_id, role):
+    content = await _acached(
+        ("content", zone_id, role),
+        ZoneContent.objects.filter(zone_id=zone_id, role=role).afirst,
+    )
+    return copy.copy(content) if content else None
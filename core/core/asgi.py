@@ -3,6 +3,14 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the portal through this entry point (not WSGI) so long-lived async
+views such as the leaderboard SSE stream (/leaderboard/stream/) hold their
+connections on the event loop instead of a worker thread each:
+
+    uvicorn core.asgi:application --host 0.0.0.0 --port 8000
+
+The SSE broadcaster lives in-process, so run a single worker process.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -13,4 +21,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Django runs each ASGI request's sync code on a new thread, so a kept-open
+# connection is never reused; it just lingers until garbage-collected.
+# Persistent connections (CONN_MAX_AGE) only pay off under WSGI/commands.
+os.environ.setdefault('PORTAL_CONN_MAX_AGE', '0')
+
 application = get_asgi_application()
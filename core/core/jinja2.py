@@ -1,11 +1,34 @@
-from jinja2 import Environment
-from django.urls import reverse
+from functools import lru_cache
+
+from jinja2 import Environment, FileSystemBytecodeCache
+from django.urls import get_script_prefix, get_urlconf, reverse
 from django.contrib.staticfiles.storage import staticfiles_storage
 
-def environment(**options):
+
+# -------------------------
+# MEMOIZED URL REVERSAL
+# -------------------------
+# reverse() walks the resolver on every call; the hot templates call it
+# with the same few names on every render. The urlconf and script prefix
+# are part of the key, so per-request urlconfs and test overrides still
+# get their own results.
+@lru_cache(maxsize=1024)
+def _reverse(urlconf, prefix, viewname, args, kwargs):
+    return reverse(viewname, urlconf=urlconf, args=args, kwargs=dict(kwargs))
+
+
+def url(viewname, *args, **kwargs):
+    return _reverse(get_urlconf(), get_script_prefix(), viewname, args, tuple(sorted(kwargs.items())))
+
+
+def environment(bytecode_cache_dir=None, **options):
+    if bytecode_cache_dir is not None:
+        bytecode_cache_dir.mkdir(parents=True, exist_ok=True)
+        options.setdefault('bytecode_cache', FileSystemBytecodeCache(str(bytecode_cache_dir)))
+
     env = Environment(**options)
     env.globals.update({
-        'url': reverse,
+        'url': url,
         'static': staticfiles_storage.url,
     })
     return env
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,12 +45,43 @@ INSTALLED_APPS = [
 ]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Zone files (MEDIA_ROOT/zone<id>/) are only served through the zone_asset
+# view. PORTAL_SENDFILE hands the transfer to the front server once the
+# attempt is checked: "x-accel-redirect" (nginx, with an `internal`
+# location at PORTAL_SENDFILE_PREFIX aliased to MEDIA_ROOT) or
+# "x-sendfile" (Apache mod_xsendfile / lighttpd). Empty: Django streams it.
+PORTAL_SENDFILE = os.environ.get("PORTAL_SENDFILE", "")
+PORTAL_SENDFILE_PREFIX = os.environ.get("PORTAL_SENDFILE_PREFIX", "/protected-media/")
 # Sessions
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
-SESSION_SAVE_EVERY_REQUEST = True
+# cached_db-based engine that also tracks TeamSession rows; it re-saves
+# at most every SESSION_REFRESH_SECONDS instead of on every request.
+SESSION_ENGINE = "app.session_backend"
+
+# Cache
+# File-based so every worker process on this host sees the same values
+# (e.g. the leaderboard version). Swap for Redis/Memcached if multi-host.
+# It holds the leaderboard and zone versions, per-team zone state, the
+# user -> team lookups and every cached_db session, so the default
+# MAX_ENTRIES (300) would cull live entries at random during an event.
+# Size it well above teams x (sessions + players) and, if it does fill
+# up, drop a tenth of the files rather than the default third.
+# manage.py test swaps in a locmem cache (core/test_runner.py).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / ".cache",
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.environ.get("PORTAL_CACHE_MAX_ENTRIES", "100000")),
+            "CULL_FREQUENCY": 10,
+        },
+    }
+}
+
+TEST_RUNNER = "core.test_runner.PortalTestRunner"
 
 
 MIDDLEWARE = [
+    'app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,15 +90,35 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "app.middleware.TeamSessionHeartbeatMiddleware",
 
 ]
 
 ROOT_URLCONF = 'core.urls'
 
+# Serve zones / zone_play / leaderboard pages from app.async_views.
+# PORTAL_ASYNC_VIEWS=0 routes the sync versions (e.g. for bench_views).
+PORTAL_ASYNC_VIEWS = os.environ.get("PORTAL_ASYNC_VIEWS", "1") == "1"
+
+# PORTAL_DEBUG_HEADERS=1 adds X-DB-Queries / X-DB-Time-Ms headers
+# (app.middleware.MetricsMiddleware), used by the loadtest command.
+PORTAL_DEBUG_HEADERS = os.environ.get("PORTAL_DEBUG_HEADERS", "0") == "1"
+
+# /metrics: per-process snapshots are summed from this directory.
+# Scrapes need "Authorization: Bearer <PORTAL_METRICS_TOKEN>"
+# (staff users can view it without one).
+PORTAL_METRICS_DIR = BASE_DIR / ".metrics"
+PORTAL_METRICS_TOKEN = os.environ.get("PORTAL_METRICS_TOKEN", "")
+
+# PORTAL_HOT_TEMPLATES picks the engine (a TEMPLATES NAME below) for the
+# leaderboard, zones and zone play pages, which have twins in app/jinja2/.
+# Compare the two with "manage.py bench_templates".
+PORTAL_HOT_TEMPLATES = os.environ.get("PORTAL_HOT_TEMPLATES", "jinja2")
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates + render timing for /metrics
+        'NAME': 'django',
+        'BACKEND': 'app.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,13 +130,21 @@ TEMPLATES = [
             ],
         },
     },
-     # Jinja2 Templates
+     # Jinja2 Templates (app/jinja2/), also timed for /metrics
     {
-        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'NAME': 'jinja2',
+        'BACKEND': 'app.metrics.TimedJinja2',
         'DIRS': [BASE_DIR / 'jinja_templates'],  # separate folder for jinja
         'APP_DIRS': True,
         'OPTIONS': {
             'environment': 'core.jinja2.environment',
+            'context_processors': [
+                "django.contrib.messages.context_processors.messages",
+            ],
+            # Templates are compiled once per process and the bytecode is
+            # kept on disk for the next worker; only watch for edits in DEBUG
+            'auto_reload': DEBUG,
+            'bytecode_cache_dir': BASE_DIR / '.jinja_cache',
         },
     },
 ]
@@ -95,13 +155,51 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# PORTAL_DB_PROFILE=production (default) tunes SQLite for many concurrent
+# writers (logins, heartbeats, zone entries/submissions); "stock" keeps
+# Django's SQLite behaviour (rollback journal, no retries) for comparison
+# with `manage.py bench_writes`.
+PORTAL_DB_PROFILE = os.environ.get("PORTAL_DB_PROFILE", "production")
+
+SQLITE_PROFILES = {
+    "production": {
+        "OPTIONS": {
+            # Run once per new connection
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"         # readers never block the writer
+                "PRAGMA synchronous=NORMAL;"       # fsync at checkpoints only (safe with WAL)
+                "PRAGMA busy_timeout=5000;"        # wait up to 5s for the write lock
+                "PRAGMA mmap_size=134217728;"      # 128 MiB memory-mapped reads
+                "PRAGMA cache_size=-32768;"        # 32 MiB page cache per connection
+                "PRAGMA temp_store=MEMORY;"
+            ),
+            # Take the write lock at BEGIN: a deferred transaction that
+            # upgrades from read to write fails at once when another
+            # writer is active, busy_timeout or not.
+            "transaction_mode": "IMMEDIATE",
+        },
+        # Reuse connections across requests (0 under core.asgi, see there)
+        "CONN_MAX_AGE": int(os.environ.get("PORTAL_CONN_MAX_AGE", "300")),
+        "CONN_HEALTH_CHECKS": True,
+    },
+    "stock": {
+        # journal_mode is stored in the file, so switch it back explicitly
+        "OPTIONS": {"init_command": "PRAGMA journal_mode=DELETE;"},
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **SQLITE_PROFILES[PORTAL_DB_PROFILE],
     }
 }
 
+# app.db.retry_on_lock: re-runs short write transactions this many times
+# on "database is locked", with jittered exponential backoff.
+PORTAL_DB_LOCK_RETRIES = 5 if PORTAL_DB_PROFILE == "production" else 0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -140,6 +238,18 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# STATICFILES_STORAGE was removed in Django 5.1, so configure it here.
+# collectstatic writes content-hashed names plus .gz/.br siblings, and
+# WhiteNoise serves hashed names with a 10-year "immutable" max-age
+# (Brotli needs the Brotli package at collectstatic time).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 # WHITENOISE_MANIFEST_STRICT = False
 
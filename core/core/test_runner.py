@@ -0,0 +1,40 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+# -------------------------
+# TEST CACHE
+# -------------------------
+# Tests call cache.clear() between cases; with the file cache from
+# settings that would wipe the developer's real .cache directory (and
+# its sessions). Run the suite against a private in-memory cache.
+TEST_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "portal-tests",
+    }
+}
+
+
+class PortalTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_override = override_settings(CACHES=TEST_CACHES)
+        self._cache_override.enable()
+
+        # The heartbeat timer would write from its own thread into the
+        # database a test is holding a transaction on; tests flush
+        # explicitly (or build their own buffer to test the timer).
+        from app.session_backend import heartbeats
+        heartbeats.timer = False
+
+    def teardown_databases(self, old_config, **kwargs):
+        # Write leftover beats to the test database now; the atexit flush
+        # would otherwise send them to the real one
+        from app.session_backend import heartbeats
+        heartbeats.flush()
+        super().teardown_databases(old_config, **kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        super().teardown_test_environment(**kwargs)